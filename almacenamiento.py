@@ -0,0 +1,897 @@
+import asyncio
+import json
+import mmap
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import serializacion
+from serializacion import SerializadorJSON
+
+
+def escribir_atomico(ruta, datos):
+    """Escribe bytes en un archivo temporal y lo renombra sobre la ruta final"""
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    fd, temporal = tempfile.mkstemp(prefix=".tmp-", dir=directorio)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(datos)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        try:
+            os.unlink(temporal)
+        except OSError:
+            pass
+        raise
+
+
+def estado_vacio():
+    return {"configs": {}, "torneos": {}, "salas": {}, "ranking": {}}
+
+
+def guilds_en(estado):
+    return set(estado["configs"]) | set(estado["torneos"]) | set(estado["salas"])
+
+
+# ----------------- LECTURA INCREMENTAL DEL JSON MONOLÍTICO ----------------- #
+SECCIONES = ("configs", "torneos", "salas")
+# Formato anterior: notificaciones de salas fuera de configs y con el roster
+# como lista. Se indexa por guild para migrarlo al cargar cada guild
+SECCION_ANTIGUA = "notificaciones_salas"
+# Cualquier otra clave de primer nivel se conserva tal cual: {clave: (inicio, fin)}
+OTRAS = "_otras"
+INDEXADAS = SECCIONES + (SECCION_ANTIGUA, OTRAS)
+VERSION_INDICE = 2
+
+_ESPACIO = re.compile(rb"\s*")
+# Todo lo que hay hasta la próxima llave o corchete que no esté dentro de una cadena
+_HASTA_ESTRUCTURA = re.compile(rb'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.S)
+_FIN_CADENA = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_ESCALAR = re.compile(rb"[^,}\]\s]*")
+
+
+def _saltar_espacio(datos, pos):
+    return _ESPACIO.match(datos, pos).end()
+
+
+def _fin_valor(datos, pos):
+    """Posición justo después del valor JSON que empieza en pos, sin decodificarlo"""
+    inicial = datos[pos:pos + 1]
+    if inicial == b'"':
+        return _FIN_CADENA.match(datos, pos + 1).end()
+    if inicial not in (b"{", b"["):
+        return _ESCALAR.match(datos, pos).end()
+    profundidad = 0
+    while True:
+        pos = _HASTA_ESTRUCTURA.match(datos, pos).end()
+        caracter = datos[pos:pos + 1]
+        if not caracter:
+            raise ValueError("JSON truncado")
+        pos += 1
+        profundidad += 1 if caracter in (b"{", b"[") else -1
+        if profundidad == 0:
+            return pos
+
+
+def _recorrer_objeto(datos, pos):
+    """Genera (clave, inicio, fin) de cada valor del objeto que empieza en pos"""
+    pos = _saltar_espacio(datos, pos)
+    if datos[pos:pos + 1] != b"{":
+        raise ValueError(f"Se esperaba un objeto en la posición {pos}")
+    pos = _saltar_espacio(datos, pos + 1)
+    if datos[pos:pos + 1] == b"}":
+        return
+    while True:
+        fin_clave = _FIN_CADENA.match(datos, pos + 1).end()
+        clave = json.loads(datos[pos:fin_clave])
+        pos = _saltar_espacio(datos, fin_clave)
+        pos = _saltar_espacio(datos, pos + 1)  # ':'
+        fin = _fin_valor(datos, pos)
+        yield clave, pos, fin
+        pos = _saltar_espacio(datos, fin)
+        if datos[pos:pos + 1] == b"}":
+            return
+        pos = _saltar_espacio(datos, pos + 1)  # ','
+
+
+def indexar_json(ruta):
+    """{sección: {guild_id: (inicio, fin)}} con la posición en bytes del valor
+    de cada guild en config.json. Se recorre el archivo mapeado en memoria sin
+    construir los objetos, así que el pico de memoria no depende del tamaño."""
+    posiciones = {seccion: {} for seccion in INDEXADAS}
+    if not os.path.exists(ruta) or os.path.getsize(ruta) == 0:
+        return posiciones
+    with open(ruta, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as datos:
+        for seccion, inicio, fin in _recorrer_objeto(datos, 0):
+            if seccion in SECCIONES + (SECCION_ANTIGUA,) and datos[inicio:inicio + 1] == b"{":
+                posiciones[seccion] = {guild_id: (a, b) for guild_id, a, b in _recorrer_objeto(datos, inicio)}
+            elif seccion not in SECCIONES + (SECCION_ANTIGUA,):
+                posiciones[OTRAS][seccion] = (inicio, fin)
+    return posiciones
+
+
+def _firma(ruta):
+    estado = os.stat(ruta)
+    return [estado.st_size, estado.st_mtime_ns]
+
+
+def leer_indice(ruta, ruta_indice):
+    """Índice guardado junto a config.json si sigue correspondiendo al archivo
+    (mismo tamaño y fecha); si no, se recorre el archivo y se guarda de nuevo"""
+    if not os.path.exists(ruta):
+        return {seccion: {} for seccion in INDEXADAS}
+    try:
+        with open(ruta_indice, "r") as f:
+            guardado = json.load(f)
+        if guardado.get("version") == VERSION_INDICE and guardado["firma"] == _firma(ruta):
+            return {seccion: {g: tuple(p) for g, p in guardado["posiciones"][seccion].items()} for seccion in INDEXADAS}
+    except (OSError, ValueError, KeyError):
+        pass
+    posiciones = indexar_json(ruta)
+    guardar_indice(ruta, ruta_indice, posiciones)
+    return posiciones
+
+
+def guardar_indice(ruta, ruta_indice, posiciones):
+    try:
+        escribir_atomico(ruta_indice, json.dumps({"version": VERSION_INDICE, "firma": _firma(ruta),
+                                                 "posiciones": posiciones}).encode())
+    except OSError as e:
+        print(f"⚠️ No se pudo guardar el índice de {ruta}: {e}")
+
+
+def _roster(jugadores):
+    """jugadores_listos como {user_id: entrada}; antes era una lista de entradas"""
+    if isinstance(jugadores, list):
+        return {str(j["user_id"]): j for j in jugadores if isinstance(j, dict) and j.get("user_id")}
+    return dict(jugadores or {})
+
+
+def migrar_notificaciones(config, antigua):
+    """Config del guild con la sección notificaciones_salas del formato anterior
+    incorporada; lo que ya estuviera en la config tiene prioridad"""
+    config = dict(config or {"channel_id": None, "message_id": None, "torneo_seleccionado": None})
+    actual = config.get("notificaciones_salas") or {}
+    listos = {**_roster((antigua or {}).get("jugadores_listos")), **_roster(actual.get("jugadores_listos"))}
+    config["notificaciones_salas"] = {**(antigua or {}), **actual, "jugadores_listos": listos}
+    return config
+
+
+# ----------------- BACKEND JSON ----------------- #
+class CambioExterno(RuntimeError):
+    """config.json cambió por fuera del bot y todavía no se ha recargado"""
+
+
+class BackendJSON:
+    """Formato histórico: config.json y ranking.json.
+
+    Al arrancar solo se lee el índice de config.json (posición de cada guild
+    en cada sección, guardado en config.json.indice y rehecho si el archivo
+    cambió por fuera); cada guild se decodifica la primera vez que se accede. Al
+    volcar se reescribe el archivo completo, pero los guilds sin cambios se
+    copian tal cual del archivo anterior en lugar de volver a serializarse."""
+
+    def __init__(self, config_file, ranking_file, serializador=None):
+        self.config_file = config_file
+        self.ranking_file = ranking_file
+        self.serializador = serializador or SerializadorJSON()
+        # config.json sigue siendo JSON (lo lee el panel web y el índice depende de ello)
+        self.serializador_config = self.serializador if isinstance(self.serializador, SerializadorJSON) else SerializadorJSON()
+        self.indice_file = config_file + ".indice"
+        self._posiciones = {seccion: {} for seccion in INDEXADAS}
+        self._archivo = None
+        # Protege el par (archivo, posiciones) frente al volcado en otro hilo
+        self._lock = threading.Lock()
+        # Firma del último config.json que el bot leyó o escribió, y hash de
+        # los bytes de cada (sección, guild) cargado: así se distingue una
+        # edición externa de un volcado propio y se sabe qué guilds tocó
+        self._firma_vista = None
+        self._huellas = {}
+        # Con la recarga en caliente activa no se pisa un archivo editado por fuera
+        self.respetar_externos = False
+
+    def guilds_conocidos(self):
+        return set().union(*(self._posiciones[s] for s in SECCIONES + (SECCION_ANTIGUA,)))
+
+    def cargar(self):
+        estado = estado_vacio()
+        if os.path.exists(self.ranking_file):
+            estado["ranking"] = serializacion.leer(self.ranking_file)
+        self._posiciones = leer_indice(self.config_file, self.indice_file)
+        if os.path.exists(self.config_file):
+            self._archivo = open(self.config_file, "rb")
+            self._firma_vista = _firma(self.config_file)
+        return estado
+
+    def _leer(self, inicio, fin):
+        self._archivo.seek(inicio)
+        return self._archivo.read(fin - inicio)
+
+    def cargar_guild(self, guild_id):
+        valores = {}
+        with self._lock:
+            for seccion in SECCIONES + (SECCION_ANTIGUA,):
+                posicion = self._posiciones[seccion].get(guild_id)
+                if posicion is not None:
+                    datos = self._leer(*posicion)
+                    if seccion != SECCION_ANTIGUA:
+                        self._huellas[(seccion, guild_id)] = hash(datos)
+                    valores[seccion] = serializacion.decodificar(datos)
+        if not valores:
+            return None
+        config = valores.get("configs")
+        if SECCION_ANTIGUA in valores:
+            config = migrar_notificaciones(config, valores[SECCION_ANTIGUA])
+            print(f"📦 Notificaciones de salas del servidor {guild_id} pasadas al formato actual")
+        return config, valores.get("torneos", {}), valores.get("salas", {})
+
+    def preparar(self, estado, guilds, equipos):
+        nuevos = None
+        if guilds:
+            # Solo se serializan los guilds que cambiaron; None = ya no está
+            nuevos = {seccion: {} for seccion in SECCIONES}
+            for seccion in SECCIONES:
+                for guild_id in guilds:
+                    valor = estado[seccion].get(guild_id)
+                    nuevos[seccion][guild_id] = None if valor is None else self.serializador_config.codificar(valor)
+        ranking = self.serializador.codificar(estado["ranking"]) if equipos else None
+        return nuevos, ranking
+
+    def _escribir_config(self, nuevos):
+        if self.respetar_externos and os.path.exists(self.config_file) and _firma(self.config_file) != self._firma_vista:
+            raise CambioExterno("config.json cambió por fuera; el volcado espera a la recarga")
+        directorio = os.path.dirname(os.path.abspath(self.config_file))
+        fd, temporal = tempfile.mkstemp(prefix=".tmp-", dir=directorio)
+        posiciones = {seccion: {} for seccion in INDEXADAS}
+        # Un guild reescrito ya lleva sus notificaciones migradas dentro de configs
+        cambios_seccion = {**nuevos, SECCION_ANTIGUA: dict.fromkeys(nuevos["configs"])}
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(b"{")
+                for i, seccion in enumerate(SECCIONES + (SECCION_ANTIGUA,)):
+                    anteriores = self._posiciones[seccion]
+                    cambios = cambios_seccion[seccion]
+                    if seccion == SECCION_ANTIGUA and all(g in cambios for g in anteriores):
+                        break
+                    f.write(b'%s\n"%s": {' % (b"," if i else b"", seccion.encode()))
+                    primero = True
+                    for guild_id in list(anteriores) + [g for g in cambios if g not in anteriores]:
+                        if guild_id in cambios:
+                            datos = cambios[guild_id]
+                            if datos is None:
+                                continue
+                        else:
+                            with self._lock:
+                                datos = self._leer(*anteriores[guild_id])
+                        f.write(b'%s\n%s: ' % (b"" if primero else b",", json.dumps(guild_id).encode()))
+                        inicio = f.tell()
+                        f.write(datos)
+                        posiciones[seccion][guild_id] = (inicio, f.tell())
+                        primero = False
+                    f.write(b"\n}")
+                # Claves de primer nivel que el bot no usa: se copian sin tocarlas
+                for clave, posicion in self._posiciones[OTRAS].items():
+                    with self._lock:
+                        datos = self._leer(*posicion)
+                    f.write(b',\n%s: ' % json.dumps(clave).encode())
+                    inicio = f.tell()
+                    f.write(datos)
+                    posiciones[OTRAS][clave] = (inicio, f.tell())
+                f.write(b"\n}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, self.config_file)
+        except BaseException:
+            try:
+                os.unlink(temporal)
+            except OSError:
+                pass
+            raise
+        guardar_indice(self.config_file, self.indice_file, posiciones)
+        archivo = open(self.config_file, "rb")
+        with self._lock:
+            anterior, self._archivo, self._posiciones = self._archivo, archivo, posiciones
+            self._firma_vista = _firma(self.config_file)
+            for seccion, cambios in nuevos.items():
+                for guild_id, datos in cambios.items():
+                    if datos is None:
+                        self._huellas.pop((seccion, guild_id), None)
+                    else:
+                        self._huellas[(seccion, guild_id)] = hash(datos)
+        if anterior:
+            anterior.close()
+
+    def cambios_externos(self, guilds):
+        """Si config.json ya no es el último que el bot leyó o escribió, lo
+        vuelve a indexar y devuelve {guild_id: {sección: valor}} con las
+        secciones que cambiaron de los guilds en memoria (`guilds`); del resto
+        basta con las posiciones nuevas. None si el archivo es el propio."""
+        if not os.path.exists(self.config_file):
+            return None
+        firma = _firma(self.config_file)
+        if firma == self._firma_vista:
+            return None
+        posiciones = indexar_json(self.config_file)
+        archivo = open(self.config_file, "rb")
+        cambios, huellas = {}, {}
+        try:
+            for seccion in SECCIONES:
+                for guild_id in guilds:
+                    posicion = posiciones[seccion].get(guild_id)
+                    clave = (seccion, guild_id)
+                    if posicion is None:
+                        if clave in self._huellas:
+                            cambios.setdefault(guild_id, {})[seccion] = None
+                        continue
+                    archivo.seek(posicion[0])
+                    datos = archivo.read(posicion[1] - posicion[0])
+                    huellas[clave] = hash(datos)
+                    if self._huellas.get(clave) != huellas[clave]:
+                        cambios.setdefault(guild_id, {})[seccion] = serializacion.decodificar(datos)
+        except BaseException:
+            archivo.close()
+            raise
+        if _firma(self.config_file) != firma:
+            # Se siguió escribiendo mientras se leía: el próximo aviso lo recoge
+            archivo.close()
+            return None
+        guardar_indice(self.config_file, self.indice_file, posiciones)
+        with self._lock:
+            anterior, self._archivo, self._posiciones = self._archivo, archivo, posiciones
+            self._firma_vista = firma
+            for clave in [c for c in self._huellas if c[1] in guilds]:
+                del self._huellas[clave]
+            self._huellas.update(huellas)
+        if anterior:
+            anterior.close()
+        return cambios
+
+    def escribir(self, lote):
+        nuevos, ranking = lote
+        if nuevos is not None:
+            self._escribir_config(nuevos)
+        if ranking is not None:
+            escribir_atomico(self.ranking_file, ranking)
+
+    def tamano(self, lote):
+        nuevos, ranking = lote
+        total = len(ranking or b"")
+        if nuevos is not None:
+            total += sum(len(d) for cambios in nuevos.values() for d in cambios.values() if d)
+        return total
+
+    def cerrar(self):
+        if self._archivo:
+            self._archivo.close()
+            self._archivo = None
+
+
+# ----------------- BACKEND SQLITE ----------------- #
+# {tabla: (columnas clave, columnas de datos)}
+TABLAS = {
+    "guilds": (("guild_id",), ("channel_id", "message_id", "torneo_seleccionado", "extra")),
+    "torneos": (("guild_id", "nombre"), ()),
+    "participantes": (("guild_id", "torneo", "user_id"), ("equipo",)),
+    "salas": (("guild_id", "sala_id"), ("nombre", "hora_apertura", "hora_cierre", "canal_id", "mensaje_id", "extra")),
+    "sala_jugadores": (("guild_id", "sala_id", "user_id"), ()),
+    "ranking": (("equipo",), ("victorias",)),
+}
+TABLAS_GUILD = ("guilds", "torneos", "participantes", "salas", "sala_jugadores")
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS guilds (
+    guild_id TEXT PRIMARY KEY,
+    channel_id TEXT,
+    message_id TEXT,
+    torneo_seleccionado TEXT,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS torneos (
+    guild_id TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    PRIMARY KEY (guild_id, nombre)
+);
+CREATE TABLE IF NOT EXISTS participantes (
+    guild_id TEXT NOT NULL,
+    torneo TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    equipo TEXT NOT NULL,
+    PRIMARY KEY (guild_id, torneo, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_participantes_equipo ON participantes (guild_id, torneo, equipo);
+CREATE TABLE IF NOT EXISTS salas (
+    guild_id TEXT NOT NULL,
+    sala_id TEXT NOT NULL,
+    nombre TEXT,
+    hora_apertura TEXT,
+    hora_cierre TEXT,
+    canal_id TEXT,
+    mensaje_id TEXT,
+    extra TEXT,
+    PRIMARY KEY (guild_id, sala_id)
+);
+CREATE TABLE IF NOT EXISTS sala_jugadores (
+    guild_id TEXT NOT NULL,
+    sala_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    PRIMARY KEY (guild_id, sala_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS ranking (
+    equipo TEXT PRIMARY KEY,
+    victorias INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ranking_victorias ON ranking (victorias DESC);
+"""
+
+CAMPOS_CONFIG = ("channel_id", "message_id", "torneo_seleccionado")
+CAMPOS_SALA = ("nombre", "hora_apertura", "hora_cierre", "canal_id", "mensaje_id")
+
+
+def _sql_upsert(tabla):
+    claves, datos = TABLAS[tabla]
+    columnas = claves + datos
+    sql = f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))}) ON CONFLICT ({', '.join(claves)}) DO "
+    if datos:
+        return sql + "UPDATE SET " + ", ".join(f"{c} = excluded.{c}" for c in datos)
+    return sql + "NOTHING"
+
+
+def _sql_delete(tabla):
+    claves, _ = TABLAS[tabla]
+    return f"DELETE FROM {tabla} WHERE " + " AND ".join(f"{c} = ?" for c in claves)
+
+
+def _extra(d, campos):
+    extra = {k: v for k, v in d.items() if k not in campos}
+    return json.dumps(extra) if extra else None
+
+
+class BackendSQLite:
+    """Tablas indexadas por guild; cada volcado solo toca las filas que cambiaron"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(ESQUEMA)
+        # Última versión escrita de cada guild: {guild_id: {tabla: {clave: fila}}}
+        self._escritos = {}
+        self._ranking_escrito = {}
+        # cargar_guild() corre en el loop mientras un volcado escribe en otro hilo
+        self._lock = threading.Lock()
+
+    def vacio(self):
+        return self._conn.execute("SELECT 1 FROM guilds LIMIT 1").fetchone() is None and \
+            self._conn.execute("SELECT 1 FROM ranking LIMIT 1").fetchone() is None
+
+    def guilds_conocidos(self):
+        return {fila[0] for fila in self._conn.execute("SELECT guild_id FROM guilds")}
+
+    def cargar(self):
+        """Solo el ranking; cada guild se lee con cargar_guild() al accederlo"""
+        estado = estado_vacio()
+        for equipo, victorias in self._conn.execute("SELECT equipo, victorias FROM ranking ORDER BY rowid"):
+            estado["ranking"][equipo] = victorias
+        self._ranking_escrito = {e: (e, v) for e, v in estado["ranking"].items()}
+        return estado
+
+    def cargar_guild(self, guild_id):
+        with self._lock:
+            return self._cargar_guild(guild_id)
+
+    def _cargar_guild(self, guild_id):
+        c = self._conn
+        fila = c.execute("SELECT channel_id, message_id, torneo_seleccionado, extra FROM guilds WHERE guild_id = ?",
+                         (guild_id,)).fetchone()
+        if fila is None:
+            return None
+        config = dict(zip(CAMPOS_CONFIG, fila[:3]))
+        if fila[3]:
+            config.update(json.loads(fila[3]))
+        torneos = {}
+        for (nombre,) in c.execute("SELECT nombre FROM torneos WHERE guild_id = ? ORDER BY rowid", (guild_id,)):
+            torneos[nombre] = {}
+        for torneo, user_id, equipo in c.execute(
+                "SELECT torneo, user_id, equipo FROM participantes WHERE guild_id = ? ORDER BY rowid", (guild_id,)):
+            torneos.setdefault(torneo, {})[user_id] = equipo
+        salas = {}
+        for fila in c.execute(
+                "SELECT sala_id, nombre, hora_apertura, hora_cierre, canal_id, mensaje_id, extra FROM salas "
+                "WHERE guild_id = ? ORDER BY rowid", (guild_id,)):
+            sala = dict(zip(CAMPOS_SALA, fila[1:6]))
+            sala["jugadores"] = []
+            if fila[6]:
+                sala.update(json.loads(fila[6]))
+            salas[fila[0]] = sala
+        for sala_id, user_id in c.execute(
+                "SELECT sala_id, user_id FROM sala_jugadores WHERE guild_id = ? ORDER BY rowid", (guild_id,)):
+            if sala_id in salas:
+                salas[sala_id]["jugadores"].append(user_id)
+        estado = {"configs": {guild_id: config}, "torneos": {guild_id: torneos}, "salas": {guild_id: salas}}
+        self._escritos[guild_id] = self._filas_guild(estado, guild_id)
+        return config, torneos, salas
+
+    def _filas_guild(self, estado, guild_id):
+        filas = {tabla: {} for tabla in TABLAS_GUILD}
+        config = estado["configs"].get(guild_id, {})
+        filas["guilds"][(guild_id,)] = (guild_id,) + tuple(config.get(c) for c in CAMPOS_CONFIG) + (_extra(config, CAMPOS_CONFIG),)
+        for nombre, participantes in estado["torneos"].get(guild_id, {}).items():
+            filas["torneos"][(guild_id, nombre)] = (guild_id, nombre)
+            for user_id, equipo in participantes.items():
+                filas["participantes"][(guild_id, nombre, user_id)] = (guild_id, nombre, user_id, equipo)
+        for sala_id, sala in estado["salas"].get(guild_id, {}).items():
+            filas["salas"][(guild_id, sala_id)] = (guild_id, sala_id) + tuple(sala.get(c) for c in CAMPOS_SALA) + \
+                (_extra(sala, CAMPOS_SALA + ("jugadores",)),)
+            for user_id in sala.get("jugadores", []):
+                filas["sala_jugadores"][(guild_id, sala_id, user_id)] = (guild_id, sala_id, user_id)
+        return filas
+
+    def preparar(self, estado, guilds, equipos):
+        """Calcula en el loop el diff contra lo último escrito (O(guild)); la
+        escritura posterior es proporcional al número de filas cambiadas"""
+        upserts = {tabla: [] for tabla in TABLAS}
+        borrados = {tabla: [] for tabla in TABLAS}
+        nuevos = {}
+        for guild_id in guilds:
+            actuales = self._filas_guild(estado, guild_id)
+            previas = self._escritos.get(guild_id, {})
+            for tabla, filas in actuales.items():
+                anteriores = previas.get(tabla, {})
+                for clave, fila in filas.items():
+                    if anteriores.get(clave) != fila:
+                        upserts[tabla].append(fila)
+                borrados[tabla].extend(anteriores.keys() - filas.keys())
+            nuevos[guild_id] = actuales
+        ranking_nuevo = {}
+        for equipo in equipos:
+            if equipo in estado["ranking"]:
+                fila = (equipo, estado["ranking"][equipo])
+                if self._ranking_escrito.get(equipo) != fila:
+                    upserts["ranking"].append(fila)
+                ranking_nuevo[equipo] = fila
+            elif equipo in self._ranking_escrito:
+                borrados["ranking"].append((equipo,))
+                ranking_nuevo[equipo] = None
+        return upserts, borrados, nuevos, ranking_nuevo
+
+    def escribir(self, lote):
+        upserts, borrados, nuevos, ranking_nuevo = lote
+        with self._lock, self._conn:
+            for tabla in reversed(list(TABLAS)):
+                if borrados[tabla]:
+                    self._conn.executemany(_sql_delete(tabla), borrados[tabla])
+            for tabla in TABLAS:
+                if upserts[tabla]:
+                    self._conn.executemany(_sql_upsert(tabla), upserts[tabla])
+        self._escritos.update(nuevos)
+        for equipo, fila in ranking_nuevo.items():
+            if fila is None:
+                self._ranking_escrito.pop(equipo, None)
+            else:
+                self._ranking_escrito[equipo] = fila
+
+    def tamano(self, lote):
+        """Aproximado: suma del largo de los valores de las filas escritas"""
+        upserts = lote[0]
+        return sum(len(str(v)) for filas in upserts.values() for fila in filas for v in fila if v is not None)
+
+    def cerrar(self):
+        self._conn.close()
+
+
+# ----------------- BACKEND POR SERVIDOR ----------------- #
+class BackendShards:
+    """Un archivo por guild más un manifiesto; cada guild se lee la primera
+    vez que se accede a él y cada volcado reescribe solo los guilds sucios"""
+
+    def __init__(self, directorio, ranking_file, serializador=None):
+        self.directorio = directorio
+        self.ranking_file = ranking_file
+        # Los archivos conservan la extensión .json aunque el formato sea binario
+        self.serializador = serializador or SerializadorJSON()
+        self.manifiesto_file = os.path.join(directorio, "manifest.json")
+        os.makedirs(directorio, exist_ok=True)
+        self._manifiesto = set()
+
+    def ruta_guild(self, guild_id):
+        return os.path.join(self.directorio, f"guild_{guild_id}.json")
+
+    def guilds_conocidos(self):
+        return set(self._manifiesto)
+
+    def cargar(self):
+        estado = estado_vacio()
+        if os.path.exists(self.manifiesto_file):
+            with open(self.manifiesto_file, "r") as f:
+                self._manifiesto = set(json.load(f).get("guilds", []))
+        if os.path.exists(self.ranking_file):
+            estado["ranking"] = serializacion.leer(self.ranking_file)
+        return estado
+
+    def cargar_guild(self, guild_id):
+        if guild_id not in self._manifiesto:
+            return None
+        data = serializacion.leer(self.ruta_guild(guild_id))
+        return data.get("config"), data.get("torneos", {}), data.get("salas", {})
+
+    def preparar(self, estado, guilds, equipos):
+        trabajos = []
+        for guild_id in guilds:
+            data = {
+                "config": estado["configs"].get(guild_id),
+                "torneos": estado["torneos"].get(guild_id, {}),
+                "salas": estado["salas"].get(guild_id, {})
+            }
+            trabajos.append((self.ruta_guild(guild_id), self.serializador.codificar(data)))
+        nuevos = set(guilds) - self._manifiesto
+        manifiesto = None
+        if nuevos:
+            manifiesto = self._manifiesto | nuevos
+            trabajos.append((self.manifiesto_file, json.dumps({"version": 1, "guilds": sorted(manifiesto)}).encode()))
+        if equipos:
+            trabajos.append((self.ranking_file, self.serializador.codificar(estado["ranking"])))
+        return trabajos, manifiesto
+
+    def escribir(self, lote):
+        trabajos, manifiesto = lote
+        # Los archivos de guild van antes que el manifiesto que los referencia
+        for ruta, datos in trabajos:
+            escribir_atomico(ruta, datos)
+        if manifiesto is not None:
+            self._manifiesto |= manifiesto
+
+    def tamano(self, lote):
+        return sum(len(datos) for _, datos in lote[0])
+
+    def cerrar(self):
+        pass
+
+
+def lotes_json(config_file, ranking_file, tamano=500):
+    """Recorre config.json por lotes de guilds: cada lote es un estado con
+    solo esos guilds, así que migrar no carga el archivo entero en memoria.
+    El último lote trae además el ranking completo."""
+    origen = BackendJSON(config_file, ranking_file)
+    ranking = origen.cargar()["ranking"]
+    guilds = sorted(origen.guilds_conocidos())
+    try:
+        for i in range(0, max(len(guilds), 1), tamano):
+            lote = estado_vacio()
+            for guild_id in guilds[i:i + tamano]:
+                config, torneos, salas = origen.cargar_guild(guild_id)
+                if config is not None:
+                    lote["configs"][guild_id] = config
+                lote["torneos"][guild_id] = torneos
+                lote["salas"][guild_id] = salas
+            if i + tamano >= len(guilds):
+                lote["ranking"] = ranking
+            yield lote, guilds[i:i + tamano]
+    finally:
+        origen.cerrar()
+
+
+def migrar_json_a_shards(config_file, ranking_file, destino):
+    """Reparte el config.json monolítico en un archivo por guild"""
+    if isinstance(destino, str):
+        destino = BackendShards(destino, ranking_file)
+    total = estado_vacio()
+    for lote, guilds in lotes_json(config_file, ranking_file):
+        destino.escribir(destino.preparar(lote, guilds, ()))
+        total["configs"].update(dict.fromkeys(guilds))
+        total["ranking"] = lote["ranking"]
+    return total
+
+
+def crear_backend(tipo, config_file, ranking_file, db_file, shards_dir, serializador=None):
+    """tipo: 'json' (por defecto), 'sqlite' o 'shards'; serializador, el
+    formato de los snapshots de archivo (ver serializacion.py)"""
+    if tipo == "shards":
+        nuevo = not os.path.exists(os.path.join(shards_dir, "manifest.json"))
+        backend = BackendShards(shards_dir, ranking_file, serializador)
+        if nuevo and os.path.exists(config_file):
+            migrar_json_a_shards(config_file, ranking_file, backend)
+            print(f"📦 {config_file} repartido por servidor en {shards_dir}/")
+        return backend
+    if tipo == "sqlite":
+        nuevo = not os.path.exists(db_file)
+        backend = BackendSQLite(db_file)
+        if nuevo and (os.path.exists(config_file) or os.path.exists(ranking_file)):
+            migrar_json_a_sqlite(config_file, ranking_file, backend)
+            print(f"📦 Datos migrados de {config_file}/{ranking_file} a {db_file}")
+        return backend
+    return BackendJSON(config_file, ranking_file, serializador)
+
+
+def migrar_json_a_sqlite(config_file, ranking_file, destino, forzar=False):
+    """Copia config.json/ranking.json a una base SQLite (una sola vez)"""
+    if isinstance(destino, str):
+        destino = BackendSQLite(destino)
+    if not forzar and not destino.vacio():
+        raise RuntimeError(f"{destino.ruta} ya contiene datos (usa forzar=True para sobrescribir)")
+    total = estado_vacio()
+    for lote, guilds in lotes_json(config_file, ranking_file):
+        destino.escribir(destino.preparar(lote, guilds, set(lote["ranking"])))
+        total["configs"].update(dict.fromkeys(guilds))
+        total["ranking"] = lote["ranking"]
+    return total
+
+
+# ----------------- ALMACÉN DIFERIDO ----------------- #
+class AlmacenDiferido:
+    """Persistencia write-behind: las mutaciones solo marcan guilds o equipos
+    sucios y un único task los vuelca como mucho una vez por intervalo."""
+
+    def __init__(self, backend, estado, intervalo=2.0, diario=None):
+        self.backend = backend
+        self.estado = estado
+        self.intervalo = intervalo
+        # Si hay diario, cada snapshot escrito lo compacta
+        self.diario = diario
+        # observador(segundos, bytes) tras cada volcado correcto (métricas)
+        self.observador = None
+        self._guilds = set()
+        self._equipos = set()
+        self._cargados = set()
+        self._task = None
+        self._lock = threading.Lock()
+        # Un volcado a la vez: el lote siguiente se prepara contra lo ya escrito
+        # (diff de SQLite) y no puede terminar antes que uno más viejo
+        self._volcando = asyncio.Lock()
+
+    def asegurar_guild(self, guild_id):
+        """Trae al estado en memoria un guild que el backend carga bajo demanda"""
+        if guild_id in self._cargados:
+            return
+        # Si la lectura falla, el guild no queda como cargado: un volcado con
+        # su estado vacío pisaría los datos reales en disco
+        datos = self.backend.cargar_guild(guild_id)
+        self._cargados.add(guild_id)
+        if datos is None:
+            return
+        config, torneos, salas = datos
+        if config is not None:
+            self.estado["configs"].setdefault(guild_id, config)
+        self.estado["torneos"].setdefault(guild_id, torneos)
+        self.estado["salas"].setdefault(guild_id, salas)
+
+    def descargar_guild(self, guild_id):
+        """Saca de memoria un guild ya volcado; se volverá a leer si se accede.
+        Devuelve False si tiene cambios pendientes y no se puede soltar aún."""
+        guild_id = str(guild_id)
+        if guild_id in self._guilds:
+            return False
+        for seccion in ("configs", "torneos", "salas"):
+            self.estado[seccion].pop(guild_id, None)
+        self._cargados.discard(guild_id)
+        return True
+
+    @property
+    def guilds_cargados(self):
+        return len(self._cargados)
+
+    def guild_pendiente(self, guild_id):
+        return str(guild_id) in self._guilds
+
+    def _cambios_externos(self, guilds):
+        # Con el lock del volcado: nunca se recarga a mitad de una escritura
+        with self._lock:
+            return self.backend.cambios_externos(guilds)
+
+    async def cambios_externos(self):
+        """{guild_id: {sección: valor}} de lo editado por fuera en los guilds
+        en memoria, o None si el backend no lo admite o nada cambió"""
+        if not hasattr(self.backend, "cambios_externos"):
+            return None
+        return await asyncio.to_thread(self._cambios_externos, set(self._cargados))
+
+    def marcar_guild(self, guild_id):
+        guild_id = str(guild_id)
+        # Nunca volcar un guild a medio cargar encima de su archivo
+        self.asegurar_guild(guild_id)
+        self._guilds.add(guild_id)
+
+    def marcar_equipo(self, equipo):
+        self._equipos.add(equipo)
+
+    def marcar_todo(self):
+        self._guilds |= guilds_en(self.estado)
+        self._equipos |= set(self.estado["ranking"])
+
+    @property
+    def pendiente(self):
+        return bool(self._guilds or self._equipos)
+
+    def _tomar_snapshot(self):
+        # Se prepara en el hilo del loop para obtener una copia consistente
+        guilds, equipos = self._guilds, self._equipos
+        self._guilds, self._equipos = set(), set()
+        try:
+            seq = self.diario.seq if self.diario else None
+            return guilds, equipos, (seq, self.backend.preparar(self.estado, guilds, equipos))
+        except Exception:
+            self._guilds |= guilds
+            self._equipos |= equipos
+            raise
+
+    def _escribir(self, lote):
+        seq, datos = lote
+        with self._lock:
+            self.backend.escribir(datos)
+            if seq is not None:
+                self.diario.compactar(seq)
+        return self.backend.tamano(datos)
+
+    def _fallo(self, guilds, equipos, error):
+        if isinstance(error, CambioExterno):
+            print(f"⏳ {error}")
+        else:
+            print(f"❌ Error al guardar: {error}")
+        self._guilds |= guilds
+        self._equipos |= equipos
+
+    async def vaciar(self):
+        """Vuelca lo pendiente; la escritura corre fuera del event loop"""
+        async with self._volcando:
+            if not self.pendiente:
+                return
+            guilds, equipos, lote = self._tomar_snapshot()
+            inicio = time.perf_counter()
+            try:
+                escritos = await asyncio.to_thread(self._escribir, lote)
+            except Exception as e:
+                self._fallo(guilds, equipos, e)
+                return
+        if self.observador:
+            self.observador(time.perf_counter() - inicio, escritos)
+
+    def vaciar_sync(self):
+        """Volcado bloqueante para el cierre del proceso"""
+        if not self.pendiente:
+            return
+        guilds, equipos, lote = self._tomar_snapshot()
+        try:
+            self._escribir(lote)
+        except Exception as e:
+            self._fallo(guilds, equipos, e)
+
+    async def _bucle(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                await self.vaciar()
+            except Exception as e:
+                print(f"❌ Error en el guardado diferido: {e}")
+
+    def iniciar(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.vaciar()
+
+
+if __name__ == "__main__":
+    # python almacenamiento.py migrar-sqlite [config.json] [ranking.json] [torneos.db]
+    # python almacenamiento.py migrar-shards [config.json] [ranking.json] [estado]
+    destinos = {"migrar-sqlite": ("torneos.db", migrar_json_a_sqlite), "migrar-shards": ("estado", migrar_json_a_shards)}
+    if len(sys.argv) < 2 or sys.argv[1] not in destinos:
+        print("Uso: python almacenamiento.py migrar-sqlite|migrar-shards [config.json] [ranking.json] [destino]")
+        sys.exit(1)
+    destino_defecto, migrar = destinos[sys.argv[1]]
+    args = sys.argv[2:] + ["config.json", "ranking.json", destino_defecto][len(sys.argv[2:]):]
+    estado = migrar(args[0], args[1], args[2])
+    print(f"✅ Migrados {len(guilds_en(estado))} servidores y {len(estado['ranking'])} equipos a {args[2]}")
@@ -0,0 +1,176 @@
+"""API local de lectura/escritura del estado del bot para el panel web.
+
+Responde desde la memoria del proceso: cada guild (y el ranking) tiene un
+contador de versión que sube con cada mutación, y el ETag de una respuesta es
+esa versión, así que un If-None-Match que coincide se contesta con 304 sin
+serializar nada. Las escrituras llaman a handlers del bot, que pasan por
+mutar() como cualquier interacción de Discord.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from serializacion import SerializadorJSON
+
+MENSAJES = {200: "OK", 201: "Created", 204: "No Content", 304: "Not Modified", 400: "Bad Request",
+            401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+            421: "Misdirected Request",
+            500: "Internal Server Error"}
+MAX_CUERPO = 1024 * 1024
+
+
+class ErrorApi(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.mensaje = mensaje
+
+
+class Versiones:
+    """Versión por guild y del ranking, actualizada en cada mutación"""
+
+    def __init__(self):
+        # Distingue un reinicio: los contadores vuelven a empezar
+        self.arranque = format(int(time.time()), "x")
+        self._versiones = {}
+
+    def cambio(self, registro):
+        clave = "ranking" if registro["op"] == "victoria" else registro.get("guild")
+        if clave is not None:
+            self._versiones[clave] = self._versiones.get(clave, 0) + 1
+
+    def etag(self, clave):
+        return f'"{self.arranque}-{clave}-{self._versiones.get(clave, 0)}"'
+
+
+class ApiLocal:
+    """Servidor HTTP/1.1 mínimo (TCP local o socket Unix) con rutas del estilo
+    /api/guilds/{guild}/salas; cada ruta de lectura indica de qué clave de
+    versión depende para poder responder 304"""
+
+    def __init__(self, versiones, host="127.0.0.1", puerto=None, socket=None, token=None):
+        self.versiones = versiones
+        self.host = host
+        self.puerto = puerto
+        self.socket = socket
+        self.token = token
+        self.serializador = SerializadorJSON()
+        self._rutas = []  # [(método, regex, handler, clave_version)]
+        self._servidor = None
+
+    def ruta(self, metodo, patron, clave_version=None):
+        """Decorador: handler(params, consulta, cuerpo) -> objeto (o corrutina).
+        clave_version(params) da la clave de Versiones de una lectura."""
+        regex = re.compile("^" + re.sub(r"\{(\w+)\}", r"(?P<\1>[^/]+)", patron) + "$")
+
+        def registrar(handler):
+            self._rutas.append((metodo, regex, handler, clave_version))
+            return handler
+        return registrar
+
+    def _buscar(self, metodo, ruta):
+        encontrada = False
+        for metodo_ruta, regex, handler, clave_version in self._rutas:
+            m = regex.match(ruta)
+            if m:
+                encontrada = True
+                if metodo_ruta == metodo:
+                    return handler, {k: unquote(v) for k, v in m.groupdict().items()}, clave_version
+        raise ErrorApi(405 if encontrada else 404, "Método no permitido" if encontrada else "Ruta no encontrada")
+
+    async def _resolver(self, metodo, objetivo, cabeceras, cuerpo):
+        """(estado, cuerpo, cabeceras extra)"""
+        if self.token and cabeceras.get("authorization") != f"Bearer {self.token}":
+            raise ErrorApi(401, "Token inválido")
+        url = urlsplit(objetivo)
+        handler, params, clave_version = self._buscar(metodo, url.path)
+        consulta = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        etag = None
+        if clave_version is not None:
+            etag = self.versiones.etag(clave_version(params))
+            if cabeceras.get("if-none-match") == etag:
+                return 304, b"", {"ETag": etag}
+        if cuerpo:
+            try:
+                datos = json.loads(cuerpo)
+            except ValueError:
+                raise ErrorApi(400, "El cuerpo no es JSON válido")
+        else:
+            datos = {}
+        resultado = handler(params, consulta, datos)
+        if asyncio.iscoroutine(resultado):
+            resultado = await resultado
+        extra = {"ETag": etag} if etag else {}
+        if resultado is None:
+            return 204, b"", extra
+        return 200, self.serializador.codificar(resultado), extra
+
+    def _respuesta(self, estado, cuerpo, extra, cerrar):
+        lineas = [f"HTTP/1.1 {estado} {MENSAJES.get(estado, '')}"]
+        if cuerpo:
+            lineas.append("Content-Type: application/json; charset=utf-8")
+        lineas.append(f"Content-Length: {len(cuerpo)}")
+        lineas.extend(f"{k}: {v}" for k, v in extra.items())
+        if cerrar:
+            lineas.append("Connection: close")
+        return ("\r\n".join(lineas) + "\r\n\r\n").encode() + cuerpo
+
+    async def _atender(self, lector, escritor):
+        try:
+            while True:
+                try:
+                    cabecera = await asyncio.wait_for(lector.readuntil(b"\r\n\r\n"), timeout=30)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    return
+                lineas = cabecera.decode("latin-1").split("\r\n")
+                metodo, objetivo, version = lineas[0].split(" ", 2)
+                cabeceras = {}
+                for linea in lineas[1:]:
+                    if ":" in linea:
+                        nombre, valor = linea.split(":", 1)
+                        cabeceras[nombre.strip().lower()] = valor.strip()
+                cerrar = cabeceras.get("connection", "").lower() == "close" or version == "HTTP/1.0"
+                largo = int(cabeceras.get("content-length") or 0)
+                try:
+                    if largo > MAX_CUERPO:
+                        raise ErrorApi(413, "Cuerpo demasiado grande")
+                    cuerpo = await lector.readexactly(largo) if largo else b""
+                    estado, datos, extra = await self._resolver(metodo, objetivo, cabeceras, cuerpo)
+                except ErrorApi as e:
+                    estado, datos, extra = e.estado, self.serializador.codificar({"error": e.mensaje}), {}
+                    cerrar = cerrar or e.estado == 413
+                except Exception as e:
+                    print(f"❌ Error en la API local ({metodo} {objetivo}): {e}")
+                    estado, datos, extra = 500, self.serializador.codificar({"error": str(e)}), {}
+                escritor.write(self._respuesta(estado, datos, extra, cerrar))
+                await escritor.drain()
+                if cerrar:
+                    return
+        except (ConnectionError, ValueError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            escritor.close()
+
+    async def iniciar(self):
+        if self._servidor is not None:
+            return
+        if self.socket:
+            if os.path.exists(self.socket):
+                os.unlink(self.socket)
+            self._servidor = await asyncio.start_unix_server(self._atender, self.socket)
+            os.chmod(self.socket, 0o660)
+            print(f"🔌 API local en unix:{self.socket}")
+        else:
+            self._servidor = await asyncio.start_server(self._atender, self.host, self.puerto)
+            print(f"🔌 API local en http://{self.host}:{self.puerto}/api")
+
+    async def detener(self):
+        if self._servidor is not None:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+            self._servidor = None
+            if self.socket and os.path.exists(self.socket):
+                os.unlink(self.socket)
@@ -0,0 +1,482 @@
+"""Benchmark offline de los handlers del bot con una capa de Discord simulada.
+
+Importa main.py en una carpeta temporal (sin token, así que no se conecta),
+reemplaza guilds, miembros, roles, canales e interacciones por objetos
+falsos cuyas llamadas REST duermen una latencia configurable, y ejecuta los
+handlers reales a escala. Por fase informa throughput, latencia p50/p99,
+llamadas REST y bytes escritos a disco.
+
+    python benchmark.py --guilds 1000 --participantes 500 --latencia 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import discord
+
+main = None  # se importa en preparar_entorno(), después de fijar cwd y variables
+
+
+# ----------------- REST SIMULADO ----------------- #
+class RESTSimulado:
+    def __init__(self, latencia):
+        self.latencia = latencia
+        self.llamadas = Counter()
+
+    async def llamada(self, nombre):
+        self.llamadas[nombre] += 1
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+
+
+rest = None
+_ids = iter(range(900_000_000_000_000_000, 10 ** 19))
+
+
+def nuevo_id():
+    return next(_ids)
+
+
+# ----------------- OBJETOS FALSOS ----------------- #
+class Permisos:
+    def __init__(self, administrator):
+        self.administrator = administrator
+
+
+class FalsoRol:
+    def __init__(self, guild, nombre):
+        self.id = nuevo_id()
+        self.name = nombre
+        self.guild = guild
+
+    async def delete(self):
+        await rest.llamada("delete_role")
+        self.guild._roles.pop(self.id, None)
+        for miembro in self.guild._miembros.values():
+            if self in miembro.roles:
+                miembro.roles.remove(self)
+
+
+class FalsoMiembro:
+    def __init__(self, guild, user_id, admin=False):
+        self.id = user_id
+        self.guild = guild
+        self.name = f"jugador{user_id % 100000}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+        self.roles = []
+        self.guild_permissions = Permisos(admin)
+
+    async def add_roles(self, *roles):
+        await rest.llamada("add_roles")
+        self.roles.extend(r for r in roles if r not in self.roles)
+
+    async def remove_roles(self, *roles):
+        await rest.llamada("remove_roles")
+        self.roles = [r for r in self.roles if r not in roles]
+
+
+class FalsoMensaje:
+    def __init__(self, channel, message_id=None):
+        self.id = message_id or nuevo_id()
+        self.channel = channel
+
+    async def edit(self, **kwargs):
+        await rest.llamada("edit_message")
+        return self
+
+
+class FalsoCanal:
+    def __init__(self, guild):
+        self.id = nuevo_id()
+        self.guild = guild
+
+    async def send(self, *args, **kwargs):
+        await rest.llamada("send_message")
+        return FalsoMensaje(self)
+
+    def get_partial_message(self, message_id):
+        return FalsoMensaje(self, message_id)
+
+
+class FalsoGuild:
+    def __init__(self, participantes, guild_id=None):
+        self.id = guild_id or nuevo_id()
+        self.name = f"Servidor {self.id}"
+        self._roles = {}
+        self._miembros = {}
+        self.canal = FalsoCanal(self)
+        self.admin = FalsoMiembro(self, nuevo_id(), admin=True)
+        self._miembros[self.admin.id] = self.admin
+        for _ in range(participantes):
+            miembro = FalsoMiembro(self, nuevo_id())
+            self._miembros[miembro.id] = miembro
+
+    @property
+    def roles(self):
+        return list(self._roles.values())
+
+    @property
+    def members(self):
+        return list(self._miembros.values())
+
+    def get_member(self, user_id):
+        return self._miembros.get(user_id)
+
+    def miembro(self, user_id, admin=False):
+        """Devuelve el miembro, creándolo si todavía no existe"""
+        miembro = self._miembros.get(user_id)
+        if miembro is None:
+            miembro = self._miembros[user_id] = FalsoMiembro(self, user_id, admin)
+        return miembro
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    async def create_role(self, name, **kwargs):
+        await rest.llamada("create_role")
+        rol = FalsoRol(self, name)
+        self._roles[rol.id] = rol
+        return rol
+
+
+class FalsaRespuesta:
+    """Los métodos se envuelven con main._anotar_respuesta al preparar el
+    entorno, igual que los de discord.InteractionResponse"""
+
+    def __init__(self):
+        self.respondida = None  # instante (perf_counter) del primer ack
+
+    def is_done(self):
+        return self.respondida is not None
+
+    async def _responder(self):
+        await rest.llamada("interaction_response")
+        if self.respondida is None:
+            self.respondida = time.perf_counter()
+
+    async def send_message(self, *args, **kwargs):
+        await self._responder()
+
+    async def defer(self, *args, **kwargs):
+        await self._responder()
+
+    async def edit_message(self, *args, **kwargs):
+        await self._responder()
+
+    async def send_modal(self, *args, **kwargs):
+        await self._responder()
+
+
+class FalsoFollowup:
+    def __init__(self, channel):
+        self.channel = channel
+
+    async def send(self, *args, wait=False, **kwargs):
+        await rest.llamada("followup")
+        return FalsoMensaje(self.channel) if wait else None
+
+
+class FalsaInteraccion:
+    def __init__(self, guild, user, tipo=discord.InteractionType.modal_submit):
+        self.id = nuevo_id()
+        self.type = tipo
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = guild.canal
+        self.created_at = datetime.now(timezone.utc)
+        self.data = {}
+        self.extras = {}
+        self.command = None
+        self.response = FalsaRespuesta()
+        self.followup = FalsoFollowup(guild.canal)
+
+
+def rellenar(entrada, valor):
+    # Lo que hace discord.py con los valores que llegan al enviar el modal
+    entrada._value = valor
+
+
+# ----------------- ENTORNO ----------------- #
+def preparar_entorno(args):
+    global main, rest
+    directorio = tempfile.mkdtemp(prefix="bench-torneos-")
+    os.chdir(directorio)
+    os.environ.pop("DISCORD_TOKEN", None)
+    os.environ["ALMACEN_BACKEND"] = args.backend
+    os.environ["INTERACCION_LENTA"] = "inf"
+    os.environ["API_PUERTO"] = ""
+    os.environ["RECARGA_CONFIG"] = "0"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main as modulo
+    main = modulo
+    rest = RESTSimulado(args.latencia)
+    for nombre in ("send_message", "defer", "edit_message", "send_modal"):
+        setattr(FalsaRespuesta, nombre, main._anotar_respuesta(getattr(FalsaRespuesta, nombre)))
+    return directorio
+
+
+class Bytes:
+    """Acumula los bytes que el almacén y el diario reportan al escribir"""
+
+    def __init__(self):
+        self.total = 0
+
+    def envolver(self, observador):
+        def observar(segundos, escritos):
+            self.total += escritos
+            if observador:
+                observador(segundos, escritos)
+        return observar
+
+
+# ----------------- FASES ----------------- #
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+async def ejecutar(operaciones, concurrencia):
+    """Ejecuta los pares (corrutina, interacción o None) de `operaciones` con
+    `concurrencia` workers; devuelve la latencia total de cada operación y la
+    de su primera respuesta (lo que cuenta para el límite de 3 s)"""
+    latencias = []
+    acks = []
+    iterador = iter(operaciones)
+
+    async def worker():
+        for operacion, interaccion in iterador:
+            inicio = time.perf_counter()
+            try:
+                await operacion
+            except Exception as e:
+                print(f"❌ Error en operación: {e}")
+            latencias.append(time.perf_counter() - inicio)
+            if interaccion is not None and interaccion.response.respondida is not None:
+                acks.append(interaccion.response.respondida - inicio)
+
+    await asyncio.gather(*(worker() for _ in range(concurrencia)))
+    return latencias, acks
+
+
+async def esperar_fondo(fijas):
+    """Espera a que terminen los tasks en segundo plano (logs, dashboard, roles)"""
+    while True:
+        await main.cola_roles.esperar()
+        pendientes = asyncio.all_tasks() - fijas - {asyncio.current_task()}
+        if not pendientes:
+            return
+        await asyncio.gather(*pendientes, return_exceptions=True)
+
+
+def equipo_de(i, por_equipo):
+    return f"Equipo {i // por_equipo}"
+
+
+def fase_unirse(guilds, args):
+    for guild in guilds:
+        for i, miembro in enumerate(guild.members[1:]):
+            modal = main.UnirseModal(args.torneo, guild.id)
+            rellenar(modal.equipo_input, equipo_de(i, args.por_equipo))
+            interaccion = FalsaInteraccion(guild, miembro)
+            yield modal.on_submit(interaccion), interaccion
+
+
+def fase_cambiar(guilds, args):
+    for guild in guilds:
+        miembros = guild.members[1:]
+        for i, miembro in enumerate(miembros[:int(len(miembros) * args.cambios)]):
+            modal = main.CambiarModal(args.torneo, guild.id)
+            rellenar(modal.equipo_input, equipo_de(i + args.por_equipo, args.por_equipo))
+            interaccion = FalsaInteraccion(guild, miembro)
+            yield modal.on_submit(interaccion), interaccion
+
+
+def fase_generar_embed(guilds, args):
+    for guild in guilds:
+        yield main.generar_embed(str(guild.id)), None
+
+
+def fase_actualizar_dashboard(guilds, args):
+    for guild in guilds:
+        yield main.actualizar_dashboard(guild), None
+
+
+def fase_unirse_sala(guilds, args):
+    for guild in guilds:
+        main.mutar("crear_sala", guild.id, sala_id="bench", sala={
+            "nombre": "Sala benchmark",
+            "hora_apertura": "00:00",
+            "hora_cierre": "23:59",
+            "jugadores": [],
+            "canal_id": str(guild.canal.id),
+            "mensaje_id": None
+        })
+    for guild in guilds:
+        vista = main.SalaView("bench", guild.id)
+        for miembro in guild.members[1:]:
+            interaccion = FalsaInteraccion(guild, miembro, discord.InteractionType.component)
+            yield vista.unirse_sala.callback(interaccion), interaccion
+
+
+def fase_finalizar(guilds, args):
+    for guild in guilds:
+        modal = main.FinalizarTorneoModal(args.torneo, guild.id)
+        rellenar(modal.confirmacion, "CONFIRMAR")
+        interaccion = FalsaInteraccion(guild, guild.admin)
+        yield modal.on_submit(interaccion), interaccion
+
+
+async def _volcado_completo():
+    main.guardar_config()
+    main.guardar_ranking()
+    await main.almacen.vaciar()
+
+
+def fase_guardar_config(guilds, args):
+    yield _volcado_completo(), None
+
+
+FASES = {
+    "unirse": fase_unirse,
+    "cambiar": fase_cambiar,
+    "generar_embed": fase_generar_embed,
+    "actualizar_dashboard": fase_actualizar_dashboard,
+    "unirse_sala": fase_unirse_sala,
+    "finalizar": fase_finalizar,
+    "guardar_config": fase_guardar_config,
+}
+
+
+class Simulacion:
+    """Conecta el bot importado con los guilds falsos y arranca sus tasks de
+    fondo (diario, almacén, planificador, cola de roles) sin conectarse"""
+
+    def __init__(self):
+        self.guilds = {}
+        self.canales = {}
+        self.bytes = Bytes()
+        self.fijas = set()
+
+    def agregar_guild(self, guild):
+        self.guilds[guild.id] = guild
+        self.canales[guild.canal.id] = guild.canal
+        main.indice_roles.construir(guild)
+        main.mutar("config", guild.id, campos={"channel_id": str(guild.canal.id)})
+        return guild
+
+    async def iniciar(self):
+        bot = main.bot
+        bot.get_guild = self.guilds.get
+        bot.get_channel = self.canales.get
+
+        async def fetch_user(user_id):
+            await rest.llamada("fetch_user")
+            return FalsoMiembro(None, user_id)
+        bot.fetch_user = fetch_user
+
+        main.almacen.observador = self.bytes.envolver(main.almacen.observador)
+        main.diario.observador = self.bytes.envolver(main.diario.observador)
+        await bot.setup_hook()
+        self.fijas = set(asyncio.all_tasks())
+
+    async def esperar(self):
+        """Espera lo que quedó en segundo plano y vuelca todo a disco"""
+        await esperar_fondo(self.fijas)
+        await main.diario.vaciar()
+        await main.almacen.vaciar()
+
+    async def detener(self):
+        await main.almacen.detener()
+        await main.diario.detener()
+        main.planificador.detener()
+
+
+async def correr(args):
+    simulacion = Simulacion()
+    await simulacion.iniciar()
+    bytes_escritos = simulacion.bytes
+    guilds = []
+    for _ in range(args.guilds):
+        guild = simulacion.agregar_guild(FalsoGuild(args.participantes))
+        main.mutar("crear_torneo", guild.id, torneo=args.torneo)
+        main.mutar("config", guild.id, campos={"torneo_seleccionado": args.torneo})
+        guilds.append(guild)
+
+    resultados = []
+    for nombre in args.fases:
+        rest_antes = rest.llamadas.copy()
+        bytes_antes = bytes_escritos.total
+        inicio = time.perf_counter()
+        latencias, acks = await ejecutar(FASES[nombre](guilds, args), args.concurrencia)
+        duracion = time.perf_counter() - inicio
+        # Lo que los handlers dejaron en segundo plano se cuenta en su fase
+        await simulacion.esperar()
+        llamadas = rest.llamadas - rest_antes
+        resultados.append({
+            "fase": nombre,
+            "operaciones": len(latencias),
+            "segundos": duracion,
+            "ops_por_segundo": len(latencias) / duracion if duracion else 0.0,
+            "p50_ms": percentil(latencias, 0.5) * 1000,
+            "p99_ms": percentil(latencias, 0.99) * 1000,
+            "ack_p99_ms": percentil(acks, 0.99) * 1000 if acks else None,
+            "rest": sum(llamadas.values()),
+            "rest_detalle": dict(llamadas),
+            "bytes": bytes_escritos.total - bytes_antes,
+        })
+    await simulacion.detener()
+    return resultados
+
+
+def imprimir(resultados, args):
+    print(f"\n📊 {args.guilds} guilds × {args.participantes} participantes · "
+          f"latencia REST {args.latencia * 1000:.0f} ms · backend {args.backend} · concurrencia {args.concurrencia}\n")
+    print(f"{'fase':<22}{'ops':>9}{'s':>9}{'ops/s':>11}{'p50 ms':>9}{'p99 ms':>10}{'ack p99':>9}{'REST':>9}{'bytes':>13}")
+    for r in resultados:
+        ack = "-" if r["ack_p99_ms"] is None else f"{r['ack_p99_ms']:.2f}"
+        print(f"{r['fase']:<22}{r['operaciones']:>9}{r['segundos']:>9.2f}{r['ops_por_segundo']:>11.0f}"
+              f"{r['p50_ms']:>9.2f}{r['p99_ms']:>10.2f}{ack:>9}{r['rest']:>9}{r['bytes']:>13}")
+    if args.detalle:
+        print()
+        for r in resultados:
+            detalle = ", ".join(f"{k}={v}" for k, v in sorted(r["rest_detalle"].items()))
+            print(f"{r['fase']:<22}{detalle}")
+
+
+def parsear_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline de los handlers del bot")
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--participantes", type=int, default=100, help="Participantes por guild")
+    parser.add_argument("--por-equipo", type=int, default=5, help="Jugadores por equipo")
+    parser.add_argument("--cambios", type=float, default=0.1, help="Fracción de participantes que cambian de equipo")
+    parser.add_argument("--latencia", type=float, default=0.0, help="Latencia simulada de cada llamada REST (s)")
+    parser.add_argument("--concurrencia", type=int, default=256, help="Operaciones en vuelo a la vez")
+    parser.add_argument("--backend", choices=("json", "sqlite", "shards"), default="json")
+    parser.add_argument("--fases", nargs="+", choices=list(FASES), default=list(FASES))
+    parser.add_argument("--torneo", default="Copa Benchmark")
+    parser.add_argument("--detalle", action="store_true", help="Desglose de llamadas REST por fase")
+    parser.add_argument("--json", help="Guardar los resultados en este archivo para comparar versiones")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parsear_args()
+    salida = os.path.abspath(args.json) if args.json else None
+    directorio = preparar_entorno(args)
+    resultados = asyncio.run(correr(args))
+    imprimir(resultados, args)
+    print(f"\n📁 Estado generado en {directorio}")
+    if salida:
+        with open(salida, "w") as f:
+            json.dump({"parametros": vars(args), "resultados": resultados}, f, indent=4)
+        print(f"💾 Resultados en {salida}")
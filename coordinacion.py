@@ -0,0 +1,112 @@
+import sqlite3
+import threading
+import time
+
+
+class CoordinadorLocal:
+    """Un solo proceso: el ranking en memoria ya es la fuente de verdad"""
+
+    def __init__(self, ranking):
+        self.ranking = ranking
+
+    def sumar_victoria(self, equipo):
+        return self.ranking.get(equipo, 0) + 1
+
+    def cambios_desde(self, version):
+        return version, []
+
+    def reportar_salud(self, proceso, shards):
+        pass
+
+    def salud(self):
+        return []
+
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS ranking_global (
+    equipo TEXT PRIMARY KEY,
+    victorias INTEGER NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ranking_global_version ON ranking_global (version);
+CREATE TABLE IF NOT EXISTS salud (
+    shard_id INTEGER PRIMARY KEY,
+    proceso TEXT NOT NULL,
+    conectado INTEGER NOT NULL,
+    latencia REAL,
+    guilds INTEGER NOT NULL,
+    actualizado REAL NOT NULL
+);
+"""
+
+
+class CoordinadorSQLite:
+    """Estado compartido entre procesos de una misma máquina.
+
+    El ranking global vive en una tabla donde cada victoria es un incremento
+    atómico; cada fila guarda la versión en que cambió, así que cada proceso
+    trae solo lo nuevo con cambios_desde() y lo aplica a su copia en memoria.
+    La tabla salud recoge el último estado reportado por cada shard.
+    Los métodos bloquean: desde el bot se llaman con asyncio.to_thread."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._conn = sqlite3.connect(ruta, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(ESQUEMA)
+        self._lock = threading.Lock()
+
+    def importar(self, ranking):
+        """Siembra la tabla con un ranking existente la primera vez"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("SELECT 1 FROM ranking_global LIMIT 1").fetchone() is None:
+                    self._conn.executemany(
+                        "INSERT INTO ranking_global (equipo, victorias, version) VALUES (?, ?, 1)",
+                        ranking.items())
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def sumar_victoria(self, equipo):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self._conn.execute("SELECT COALESCE(MAX(version), 0) + 1 FROM ranking_global").fetchone()[0]
+                self._conn.execute(
+                    "INSERT INTO ranking_global (equipo, victorias, version) VALUES (?, 1, ?) "
+                    "ON CONFLICT (equipo) DO UPDATE SET victorias = victorias + 1, version = excluded.version",
+                    (equipo, version))
+                total = self._conn.execute("SELECT victorias FROM ranking_global WHERE equipo = ?", (equipo,)).fetchone()[0]
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return total
+
+    def cambios_desde(self, version):
+        """(nueva_version, [(equipo, victorias)]) con lo cambiado después de version"""
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT equipo, victorias, version FROM ranking_global WHERE version > ? ORDER BY version",
+                (version,)).fetchall()
+        if not filas:
+            return version, []
+        return filas[-1][2], [(equipo, victorias) for equipo, victorias, _ in filas]
+
+    def reportar_salud(self, proceso, shards):
+        """shards: [(shard_id, conectado, latencia, guilds)]"""
+        ahora = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO salud (shard_id, proceso, conectado, latencia, guilds, actualizado) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (shard_id) DO UPDATE SET proceso = excluded.proceso, conectado = excluded.conectado, "
+                "latencia = excluded.latencia, guilds = excluded.guilds, actualizado = excluded.actualizado",
+                [(shard_id, proceso, int(conectado), latencia, guilds, ahora) for shard_id, conectado, latencia, guilds in shards])
+
+    def salud(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT shard_id, proceso, conectado, latencia, guilds, actualizado FROM salud ORDER BY shard_id").fetchall()
@@ -0,0 +1,281 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+from almacenamiento import escribir_atomico
+
+
+def aplicar_mutacion(estado, registro):
+    """Aplica una mutación del diario al estado en memoria.
+
+    Todas las operaciones son idempotentes (fijan valores en lugar de sumarlos),
+    así que reproducir un registro ya incluido en el snapshot no cambia nada."""
+    op = registro["op"]
+    guild_id = registro.get("guild")
+    if op == "victoria":
+        estado["ranking"][registro["equipo"]] = registro["total"]
+        return
+    torneos = estado["torneos"].setdefault(guild_id, {})
+    salas = estado["salas"].setdefault(guild_id, {})
+    if op in ("unirse", "cambiar"):
+        torneos.setdefault(registro["torneo"], {})[registro["user_id"]] = registro["equipo"]
+    elif op == "eliminar_usuario":
+        torneos.get(registro["torneo"], {}).pop(registro["user_id"], None)
+    elif op == "eliminar_equipo":
+        participantes = torneos.get(registro["torneo"], {})
+        for user_id in [u for u, e in participantes.items() if e == registro["equipo"]]:
+            del participantes[user_id]
+    elif op == "crear_torneo":
+        torneos.setdefault(registro["torneo"], {})
+    elif op == "finalizar_torneo":
+        torneos.pop(registro["torneo"], None)
+        config = estado["configs"].get(guild_id)
+        if config and config.get("torneo_seleccionado") == registro["torneo"]:
+            config["torneo_seleccionado"] = None
+    elif op == "config":
+        config = estado["configs"].setdefault(guild_id, {"channel_id": None, "message_id": None, "torneo_seleccionado": None})
+        config.update(registro["campos"])
+    elif op == "crear_sala":
+        salas[registro["sala_id"]] = dict(registro["sala"])
+    elif op == "actualizar_sala":
+        if registro["sala_id"] in salas:
+            salas[registro["sala_id"]].update(registro["campos"])
+    elif op == "unirse_sala":
+        sala = salas.get(registro["sala_id"])
+        if sala is not None and registro["user_id"] not in sala["jugadores"]:
+            sala["jugadores"].append(registro["user_id"])
+    elif op == "cerrar_sala":
+        salas.pop(registro["sala_id"], None)
+    elif op in ("trabajo_roles", "progreso_trabajo_roles", "fin_trabajo_roles"):
+        config = estado["configs"].setdefault(guild_id, {"channel_id": None, "message_id": None, "torneo_seleccionado": None})
+        trabajos = config["trabajos_roles"] = dict(config.get("trabajos_roles") or {})
+        if op == "trabajo_roles":
+            trabajos[registro["trabajo"]["id"]] = dict(registro["trabajo"], ops=list(registro["trabajo"]["ops"]))
+        elif op == "progreso_trabajo_roles":
+            if registro["trabajo_id"] in trabajos:
+                trabajos[registro["trabajo_id"]]["hechos"] = registro["hechos"]
+        else:
+            trabajos.pop(registro["trabajo_id"], None)
+    elif op in ("panel_notificaciones", "anotar_notificacion", "quitar_notificacion", "limpiar_notificaciones"):
+        config = estado["configs"].setdefault(guild_id, {"channel_id": None, "message_id": None, "torneo_seleccionado": None})
+        notificaciones = config.setdefault("notificaciones_salas", {"jugadores_listos": {}})
+        if op == "panel_notificaciones":
+            notificaciones.update(registro["campos"])
+        elif op == "anotar_notificacion":
+            notificaciones["jugadores_listos"].setdefault(registro["user_id"], dict(registro["entrada"]))
+        elif op == "quitar_notificacion":
+            notificaciones["jugadores_listos"].pop(registro["user_id"], None)
+        else:
+            notificaciones["jugadores_listos"] = {}
+    else:
+        raise ValueError(f"Mutación desconocida: {op}")
+
+
+# Operaciones que quitan algo: con cambios propios aún sin volcar en un guild,
+# lo que falta en el archivo puede ser un alta del bot que todavía no llegó
+BAJAS = ("finalizar_torneo", "eliminar_usuario", "cerrar_sala", "quitar_notificacion", "limpiar_notificaciones")
+
+
+def mutaciones_diferencia(guild_id, actual, nuevo, solo_altas=False):
+    """Registros que llevan un guild del estado actual al nuevo; ambos son
+    {sección: valor} con las secciones ("configs", "torneos", "salas") que
+    cambiaron.
+
+    Se emiten las mismas operaciones de grano fino que producen los botones
+    (una inscripción, una sala), así los índices se mantienen sin reconstruir.
+    Con solo_altas no se quita nada y los jugadores de una sala se unen."""
+    registros = []
+
+    def agregar(op, **datos):
+        if not (solo_altas and op in BAJAS):
+            registros.append({"op": op, "guild": guild_id, **datos})
+
+    if "torneos" in nuevo:
+        torneos, torneos_n = actual.get("torneos") or {}, nuevo["torneos"] or {}
+        for torneo in [t for t in torneos if t not in torneos_n]:
+            agregar("finalizar_torneo", torneo=torneo)
+        for torneo, participantes in torneos_n.items():
+            anteriores = torneos.get(torneo)
+            if anteriores is None:
+                agregar("crear_torneo", torneo=torneo)
+                anteriores = {}
+            for user_id in [u for u in anteriores if u not in participantes]:
+                agregar("eliminar_usuario", torneo=torneo, user_id=user_id)
+            for user_id, equipo in participantes.items():
+                if anteriores.get(user_id) != equipo:
+                    agregar("unirse", torneo=torneo, user_id=user_id, equipo=equipo)
+
+    if "salas" in nuevo:
+        salas, salas_n = actual.get("salas") or {}, nuevo["salas"] or {}
+        for sala_id in [s for s in salas if s not in salas_n]:
+            agregar("cerrar_sala", sala_id=sala_id)
+        for sala_id, sala in salas_n.items():
+            anterior = salas.get(sala_id)
+            if anterior is None:
+                agregar("crear_sala", sala_id=sala_id, sala={"jugadores": [], **sala})
+                continue
+            campos = {k: v for k, v in sala.items() if anterior.get(k) != v}
+            if not solo_altas:
+                campos.update({k: None for k in anterior if k not in sala})
+            elif "jugadores" in campos:
+                jugadores = list(anterior.get("jugadores", []))
+                campos["jugadores"] = jugadores + [u for u in sala["jugadores"] if u not in jugadores]
+                if campos["jugadores"] == anterior.get("jugadores"):
+                    del campos["jugadores"]
+            if campos:
+                agregar("actualizar_sala", sala_id=sala_id, campos=campos)
+
+    if "configs" in nuevo:
+        config, config_n = actual.get("configs") or {}, nuevo["configs"] or {}
+        campos = {k: v for k, v in config_n.items() if k != "notificaciones_salas" and config.get(k) != v}
+        if not solo_altas:
+            campos.update({k: None for k in config if k not in config_n and k != "notificaciones_salas"})
+        if campos:
+            agregar("config", campos=campos)
+        notificaciones = config.get("notificaciones_salas") or {}
+        notificaciones_n = config_n.get("notificaciones_salas") or {}
+        campos = {k: v for k, v in notificaciones_n.items() if k != "jugadores_listos" and notificaciones.get(k) != v}
+        if campos:
+            agregar("panel_notificaciones", campos=campos)
+        listos = notificaciones.get("jugadores_listos") or {}
+        listos_n = notificaciones_n.get("jugadores_listos") or {}
+        if listos and not listos_n:
+            agregar("limpiar_notificaciones")
+            listos = {}
+        for user_id, entrada in listos.items():
+            if listos_n.get(user_id) != entrada:
+                agregar("quitar_notificacion", user_id=user_id)
+        for user_id, entrada in listos_n.items():
+            if listos.get(user_id) != entrada and (user_id not in listos or not solo_altas):
+                agregar("anotar_notificacion", user_id=user_id, entrada=entrada)
+    return registros
+
+
+class Diario:
+    """Diario append-only de mutaciones (una línea JSON por cambio).
+
+    Las líneas se acumulan en memoria y se escriben con un solo fsync por lote.
+    Tras cada snapshot correcto se compacta descartando lo ya incluido."""
+
+    def __init__(self, ruta, intervalo=0.1, max_lote=500):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.max_lote = max_lote
+        self.seq = 0
+        self._pendientes = []  # [(seq, linea)]
+        self._compactado = 0
+        self._lock = threading.Lock()
+        self._despertar = None
+        self._task = None
+        # observador(segundos, bytes) tras cada lote escrito (métricas)
+        self.observador = None
+
+    def leer(self):
+        """Registros del diario en orden; ignora una última línea truncada"""
+        registros = []
+        if not os.path.exists(self.ruta):
+            return registros
+        with open(self.ruta, "r", encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    registros.append(json.loads(linea))
+                except json.JSONDecodeError:
+                    break
+        if registros:
+            self.seq = max(self.seq, registros[-1]["seq"])
+        return registros
+
+    def registrar(self, registro):
+        self.seq += 1
+        registro = {"seq": self.seq, **registro}
+        self._pendientes.append((self.seq, json.dumps(registro, ensure_ascii=False) + "\n"))
+        if len(self._pendientes) >= self.max_lote and self._despertar:
+            self._despertar.set()
+
+    def _escribir(self, lote):
+        with self._lock:
+            # Lo que ya cubre un snapshot no hace falta volver a escribirlo
+            lineas = [linea for seq, linea in lote if seq > self._compactado]
+            if not lineas:
+                return 0
+            datos = "".join(lineas).encode("utf-8")
+            with open(self.ruta, "ab") as f:
+                f.write(datos)
+                f.flush()
+                os.fsync(f.fileno())
+            return len(datos)
+
+    def compactar(self, hasta_seq):
+        """Descarta los registros incluidos en un snapshot ya escrito (seq <= hasta_seq)"""
+        with self._lock:
+            self._compactado = max(self._compactado, hasta_seq)
+            if not os.path.exists(self.ruta):
+                return
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                restantes = []
+                for linea in f:
+                    try:
+                        if json.loads(linea)["seq"] > hasta_seq:
+                            restantes.append(linea)
+                    except json.JSONDecodeError:
+                        break
+            escribir_atomico(self.ruta, "".join(restantes).encode("utf-8"))
+
+    def _tomar_lote(self):
+        lote, self._pendientes = self._pendientes, []
+        return lote
+
+    def _devolver(self, lote):
+        self._pendientes[:0] = lote
+
+    async def vaciar(self):
+        if not self._pendientes:
+            return
+        lote = self._tomar_lote()
+        inicio = time.perf_counter()
+        try:
+            escritos = await asyncio.to_thread(self._escribir, lote)
+        except Exception:
+            self._devolver(lote)
+            raise
+        if self.observador:
+            self.observador(time.perf_counter() - inicio, escritos)
+
+    def vaciar_sync(self):
+        if not self._pendientes:
+            return
+        lote = self._tomar_lote()
+        try:
+            self._escribir(lote)
+        except Exception:
+            self._devolver(lote)
+            raise
+
+    async def _bucle(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._despertar.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._despertar.clear()
+            try:
+                await self.vaciar()
+            except Exception as e:
+                print(f"❌ Error al escribir el diario: {e}")
+
+    def iniciar(self):
+        if self._task is None or self._task.done():
+            self._despertar = asyncio.Event()
+            self._task = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.vaciar()
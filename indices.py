@@ -0,0 +1,218 @@
+from bisect import bisect_left, insort
+
+
+class IndiceEquipos:
+    """Índice secundario equipo -> miembros de cada torneo.
+
+    Se construye la primera vez que se consulta un torneo y después se
+    mantiene con cada mutación, sin tocar el formato persistido
+    ({torneo: {user_id: equipo}}). Los miembros se guardan en un dict usado
+    como conjunto ordenado para conservar el orden de inscripción."""
+
+    def __init__(self, estado):
+        self.estado = estado
+        self._indices = {}  # {(guild_id, torneo): {equipo: {user_id: None}}}
+
+    def equipos(self, guild_id, torneo):
+        clave = (str(guild_id), torneo)
+        indice = self._indices.get(clave)
+        if indice is None:
+            indice = {}
+            participantes = self.estado["torneos"].get(clave[0], {}).get(torneo, {})
+            for user_id, equipo in participantes.items():
+                indice.setdefault(equipo, {})[user_id] = None
+            self._indices[clave] = indice
+        return indice
+
+    def miembros(self, guild_id, torneo, equipo):
+        return self.equipos(guild_id, torneo).get(equipo, {})
+
+    def olvidar(self, guild_id):
+        for clave in [c for c in self._indices if c[0] == str(guild_id)]:
+            del self._indices[clave]
+
+    def _quitar(self, indice, equipo, user_id):
+        miembros = indice.get(equipo)
+        if miembros is not None:
+            miembros.pop(user_id, None)
+            if not miembros:
+                del indice[equipo]
+
+    def actualizar(self, registro):
+        """Se llama antes de aplicar la mutación, con el estado todavía sin cambiar"""
+        op = registro["op"]
+        if op == "victoria":
+            return
+        guild_id = registro.get("guild")
+        if op == "finalizar_torneo":
+            self._indices.pop((guild_id, registro["torneo"]), None)
+            return
+        indice = self._indices.get((guild_id, registro.get("torneo")))
+        if indice is None:
+            return
+        participantes = self.estado["torneos"].get(guild_id, {}).get(registro["torneo"], {})
+        if op in ("unirse", "cambiar", "eliminar_usuario"):
+            anterior = participantes.get(registro["user_id"])
+            if anterior is not None:
+                self._quitar(indice, anterior, registro["user_id"])
+            if op != "eliminar_usuario":
+                indice.setdefault(registro["equipo"], {})[registro["user_id"]] = None
+        elif op == "eliminar_equipo":
+            indice.pop(registro["equipo"], None)
+
+
+class RankingOrdenado:
+    """Ranking global ordenado por victorias (desc) y antigüedad del equipo.
+
+    Mantiene una lista ordenada de claves (-victorias, orden_de_alta, equipo):
+    registrar una victoria busca e inserta con bisect, y tanto el top-K como
+    una página o la posición de un equipo salen sin ordenar todo el ranking.
+    El desempate por orden de alta reproduce el sorted() estable de antes."""
+
+    def __init__(self, ranking):
+        self.ranking = ranking
+        self._alta = {}
+        self._orden = []
+        for equipo, victorias in ranking.items():
+            self._alta[equipo] = len(self._alta)
+            self._orden.append((-victorias, self._alta[equipo], equipo))
+        self._orden.sort()
+
+    def __len__(self):
+        return len(self._orden)
+
+    def _clave(self, equipo):
+        return (-self.ranking[equipo], self._alta[equipo], equipo)
+
+    def actualizar(self, equipo, victorias):
+        """Se llama antes de fijar ranking[equipo] = victorias"""
+        if equipo in self._alta and equipo in self.ranking:
+            i = bisect_left(self._orden, self._clave(equipo))
+            del self._orden[i]
+        elif equipo not in self._alta:
+            self._alta[equipo] = len(self._alta)
+        insort(self._orden, (-victorias, self._alta[equipo], equipo))
+
+    def pagina(self, inicio, cantidad):
+        """[(posición, equipo, victorias)] empezando en la posición inicio + 1"""
+        return [(inicio + i + 1, equipo, -neg) for i, (neg, _, equipo) in enumerate(self._orden[inicio:inicio + cantidad])]
+
+    def top(self, k):
+        return self.pagina(0, k)
+
+    def posicion(self, equipo):
+        if equipo not in self.ranking:
+            return None
+        return bisect_left(self._orden, self._clave(equipo)) + 1
+
+
+class IndiceNotificaciones:
+    """Conjuntos por estado ("confirmado"/"notificado") del roster de
+    notificaciones de salas de cada guild.
+
+    El roster persistido vive en config["notificaciones_salas"]["jugadores_listos"]
+    como {user_id: entrada}, así que comprobar duplicados ya es O(1); este índice
+    solo evita recorrerlo para contar o listar por estado."""
+
+    def __init__(self, estado):
+        self.estado = estado
+        self._indices = {}  # {guild_id: {estado: set(user_id)}}
+
+    def roster(self, guild_id):
+        config = self.estado["configs"].get(str(guild_id)) or {}
+        return config.get("notificaciones_salas", {}).get("jugadores_listos", {})
+
+    def por_estado(self, guild_id, estado_jugador):
+        guild_id = str(guild_id)
+        indice = self._indices.get(guild_id)
+        if indice is None:
+            indice = {}
+            for user_id, entrada in self.roster(guild_id).items():
+                indice.setdefault(entrada["estado"], set()).add(user_id)
+            self._indices[guild_id] = indice
+        return indice.get(estado_jugador, set())
+
+    def olvidar(self, guild_id):
+        self._indices.pop(str(guild_id), None)
+
+    def actualizar(self, registro):
+        """Se llama antes de aplicar la mutación, con el estado todavía sin cambiar"""
+        op = registro["op"]
+        indice = self._indices.get(registro.get("guild"))
+        if indice is None:
+            return
+        if op == "anotar_notificacion":
+            if registro["user_id"] not in self.roster(registro["guild"]):
+                indice.setdefault(registro["entrada"]["estado"], set()).add(registro["user_id"])
+        elif op == "quitar_notificacion":
+            entrada = self.roster(registro["guild"]).get(registro["user_id"])
+            if entrada is not None:
+                indice.get(entrada["estado"], set()).discard(registro["user_id"])
+        elif op == "limpiar_notificaciones":
+            indice.clear()
+
+
+def _minutos(hora):
+    h, m = map(int, hora.split(':'))
+    return h * 60 + m
+
+
+class IndiceSalas:
+    """Ventana de apertura (en minutos del día) y conjunto de jugadores de
+    cada sala, para que un clic en "Unirse" no vuelva a parsear las horas
+    ni recorra la lista de jugadores. La ventana se calcula al crear la sala
+    (o la primera vez que se consulta una sala antigua)."""
+
+    def __init__(self, estado):
+        self.estado = estado
+        self._ventanas = {}  # {(guild_id, sala_id): (apertura, cierre)}
+        self._jugadores = {}  # {(guild_id, sala_id): set(user_id)}
+
+    def _sala(self, guild_id, sala_id):
+        return self.estado["salas"].get(guild_id, {}).get(sala_id)
+
+    def ventana(self, guild_id, sala_id):
+        clave = (str(guild_id), sala_id)
+        ventana = self._ventanas.get(clave)
+        if ventana is None:
+            sala = self._sala(*clave)
+            ventana = (_minutos(sala["hora_apertura"]), _minutos(sala["hora_cierre"]))
+            self._ventanas[clave] = ventana
+        return ventana
+
+    def jugadores(self, guild_id, sala_id):
+        clave = (str(guild_id), sala_id)
+        jugadores = self._jugadores.get(clave)
+        if jugadores is None:
+            sala = self._sala(*clave) or {}
+            jugadores = set(sala.get("jugadores", []))
+            self._jugadores[clave] = jugadores
+        return jugadores
+
+    def olvidar(self, guild_id):
+        for indice in (self._ventanas, self._jugadores):
+            for clave in [c for c in indice if c[0] == str(guild_id)]:
+                del indice[clave]
+
+    def actualizar(self, registro):
+        """Se llama antes de aplicar la mutación, con el estado todavía sin cambiar"""
+        op = registro["op"]
+        clave = (registro.get("guild"), registro.get("sala_id"))
+        if op == "crear_sala":
+            sala = registro["sala"]
+            self._jugadores[clave] = set(sala.get("jugadores", []))
+            try:
+                self._ventanas[clave] = (_minutos(sala["hora_apertura"]), _minutos(sala["hora_cierre"]))
+            except (KeyError, ValueError):
+                self._ventanas.pop(clave, None)
+        elif op == "actualizar_sala":
+            if "hora_apertura" in registro["campos"] or "hora_cierre" in registro["campos"]:
+                self._ventanas.pop(clave, None)
+            if "jugadores" in registro["campos"]:
+                self._jugadores.pop(clave, None)
+        elif op == "unirse_sala":
+            if clave in self._jugadores and self._sala(*clave) is not None:
+                self._jugadores[clave].add(registro["user_id"])
+        elif op == "cerrar_sala":
+            self._ventanas.pop(clave, None)
+            self._jugadores.pop(clave, None)
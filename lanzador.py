@@ -0,0 +1,127 @@
+"""Arranca el bot en varios procesos, cada uno con un rango de shards.
+
+    python lanzador.py --procesos 4 --shards 16
+    python lanzador.py estado
+
+Cada proceso ejecuta main.py con SHARD_COUNT, SHARD_IDS y PROCESO propios, su
+propio diario (diario-<n>.jsonl) y los puertos de métricas y API base + n.
+Todos comparten la base de coordinación (ranking global y salud de shards) y
+el almacén SQLite: cada proceso solo escribe los servidores de sus shards.
+Un proceso que termina con error se relanza con espera creciente; la espera
+vuelve a empezar si llevaba un rato funcionando.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from coordinacion import CoordinadorSQLite
+
+# Segundos en marcha a partir de los que una caída no cuenta como reintento seguido
+ESTABLE = 600
+
+
+def rangos(shards, procesos):
+    """Reparte shards entre procesos en rangos contiguos lo más parejos posible"""
+    base, resto = divmod(shards, procesos)
+    inicio = 0
+    for i in range(procesos):
+        fin = inicio + base + (1 if i < resto else 0)
+        yield inicio, fin - 1
+        inicio = fin
+
+
+def entorno_proceso(i, desde, hasta, args):
+    entorno = dict(os.environ)
+    entorno.update({
+        "SHARD_COUNT": str(args.shards),
+        "SHARD_IDS": f"{desde}-{hasta}",
+        "PROCESO": str(i),
+        "ALMACEN_DIARIO": f"diario-{i}.jsonl",
+        "COORDINACION_DB": args.coordinacion,
+    })
+    # Cada proceso expone sus propios puertos: base + n
+    for variable, defecto in (("METRICAS_PUERTO", ""), ("API_PUERTO", "")):
+        base = os.getenv(variable, defecto)
+        if base:
+            entorno[variable] = str(int(base) + i)
+    return entorno
+
+
+def lanzar(args):
+    if os.getenv("ALMACEN_BACKEND") != "sqlite":
+        # json y shards reescriben archivos que comparten todos los procesos
+        print("❌ Con varios procesos usa ALMACEN_BACKEND=sqlite")
+        return 1
+    if args.procesos > args.shards:
+        print("❌ No puede haber más procesos que shards")
+        return 1
+    # Crear el esquema antes de que los procesos compitan por hacerlo
+    CoordinadorSQLite(args.coordinacion)
+
+    procesos = {}  # {i: [Popen, entorno, reintentos, relanzar_en, inicio]}
+    for i, (desde, hasta) in enumerate(rangos(args.shards, args.procesos)):
+        entorno = entorno_proceso(i, desde, hasta, args)
+        procesos[i] = [subprocess.Popen([sys.executable, "main.py"], env=entorno), entorno, 0, None, time.monotonic()]
+        print(f"🚀 Proceso {i}: shards {desde}-{hasta}")
+
+    terminando = False
+
+    def terminar(signum, frame):
+        nonlocal terminando
+        terminando = True
+        for proceso, *_ in procesos.values():
+            if proceso.poll() is None:
+                proceso.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, terminar)
+    signal.signal(signal.SIGINT, terminar)
+
+    while True:
+        time.sleep(1)
+        if terminando:
+            for proceso, *_ in procesos.values():
+                proceso.wait()
+            return 0
+        for i, datos in procesos.items():
+            proceso, entorno, reintentos, relanzar_en, inicio = datos
+            codigo = proceso.poll()
+            if codigo is None:
+                continue
+            if relanzar_en is None:
+                if time.monotonic() - inicio >= ESTABLE:
+                    reintentos = datos[2] = 0
+                espera = min(60, 2 ** reintentos)
+                print(f"⚠️ Proceso {i} terminó con código {codigo}; se relanza en {espera}s")
+                datos[3] = time.monotonic() + espera
+            elif time.monotonic() >= relanzar_en:
+                datos[0] = subprocess.Popen([sys.executable, "main.py"], env=entorno)
+                datos[2] = reintentos + 1
+                datos[3] = None
+                datos[4] = time.monotonic()
+
+
+def estado(args):
+    filas = CoordinadorSQLite(args.coordinacion).salud()
+    if not filas:
+        print("Sin reportes de salud todavía")
+        return 0
+    ahora = time.time()
+    print(f"{'shard':>5}  {'proceso':>7}  {'estado':<12}  {'latencia':>9}  {'guilds':>6}  {'hace':>6}")
+    for shard_id, proceso, conectado, latencia, guilds, actualizado in filas:
+        latencia = f"{latencia * 1000:.0f} ms" if latencia not in (None, float("inf")) else "-"
+        print(f"{shard_id:>5}  {proceso:>7}  {'conectado' if conectado else 'desconectado':<12}  "
+              f"{latencia:>9}  {guilds:>6}  {ahora - actualizado:>5.0f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ejecuta el bot repartiendo los shards entre varios procesos")
+    parser.add_argument("accion", nargs="?", choices=("lanzar", "estado"), default="lanzar")
+    parser.add_argument("--procesos", type=int, default=2)
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--coordinacion", default=os.getenv("COORDINACION_DB") or "coordinacion.db")
+    args = parser.parse_args()
+    sys.exit(lanzar(args) if args.accion == "lanzar" else estado(args))
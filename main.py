@@ -1,115 +1,854 @@
+import time
+
+# Instante de arranque del proceso, para medir el tiempo hasta estar listo
+INICIO_PROCESO = time.perf_counter()
+
 import discord
 from discord.ext import commands
+from discord import app_commands
 from discord.ui import View, Button, Modal, TextInput, Select
 import json
 import os
 import asyncio
 import random
-from datetime import datetime
+import re
+import atexit
+import hashlib
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from almacenamiento import AlmacenDiferido, crear_backend, escribir_atomico
+from serializacion import crear_serializador
+from diario import Diario, aplicar_mutacion, mutaciones_diferencia
+from indices import IndiceEquipos, IndiceNotificaciones, IndiceSalas, RankingOrdenado
+from planificador import Planificador
+from metricas import Metricas, ServidorMetricas, traza_http
+from perfilado import Perfilador
+from trazas import GrabadorTrazas
+from api import ApiLocal, ErrorApi, Versiones
+from coordinacion import CoordinadorLocal, CoordinadorSQLite
+from vigilancia import VigilanteArchivo
 
 intents = discord.Intents.default()
 intents.members = True
 intents.message_content = True
 
-bot = commands.Bot(command_prefix='/', intents=intents)
-
 TORNEOS_FILE = "torneos.json"
 RANKING_FILE = "ranking.json"
 CONFIG_FILE = "config.json"
 
-# Estados por servidor
-server_configs = {}  # {guild_id: {channel_id: ..., message_id: ..., torneo_seleccionado: ...}}
-server_torneos = {}  # {guild_id: {torneo_name: {user_id: team_name}}}
-server_salas = {}  # {guild_id: {sala_id: {nombre, hora_apertura, hora_cierre, jugadores[], canal_id, mensaje_id}}}
+DB_FILE = os.getenv("ALMACEN_DB", "torneos.db")
+SHARDS_DIR = os.getenv("ALMACEN_DIR", "estado")
+DIARIO_FILE = os.getenv("ALMACEN_DIARIO", "diario.jsonl")
+
+# Backend de persistencia: "json" (config.json + ranking.json), "sqlite" o "shards"
+ALMACEN_BACKEND = os.getenv("ALMACEN_BACKEND", "json")
+
+# Formato de los snapshots de archivo: "json" (compacto), "json-indentado" o "msgpack"
+SERIALIZADOR = os.getenv("SERIALIZADOR", "json")
+
+# Segundos entre volcados del guardado diferido
+GUARDADO_INTERVALO = float(os.getenv("GUARDADO_INTERVALO", "2"))
+
+# ----------------- SHARDING ----------------- #
+def parsear_shards(texto):
+    """"0-3" o "0,1,5" -> [0, 1, 2, 3] / [0, 1, 5]; vacío = todos"""
+    shards = []
+    for parte in texto.replace(" ", "").split(","):
+        if not parte:
+            continue
+        if "-" in parte:
+            desde, hasta = parte.split("-")
+            shards.extend(range(int(desde), int(hasta) + 1))
+        else:
+            shards.append(int(parte))
+    return shards or None
+
+# Total de shards del bot; vacío = lo que recomiende Discord
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+# Shards que atiende este proceso (lanzador.py reparte rangos entre procesos)
+SHARD_IDS = parsear_shards(os.getenv("SHARD_IDS", ""))
+PROCESO = os.getenv("PROCESO", "0")
+
+def shard_de(guild_id):
+    """Shard al que Discord asigna un servidor, o None si no está fijado"""
+    if not SHARD_COUNT:
+        return None
+    return (int(guild_id) >> 22) % SHARD_COUNT
+
+def es_de_este_proceso(guild_id):
+    return SHARD_IDS is None or shard_de(guild_id) in SHARD_IDS
+# Base SQLite compartida entre procesos; vacío = un solo proceso, sin coordinación
+COORDINACION_DB = os.getenv("COORDINACION_DB", "")
+COORDINACION_INTERVALO = float(os.getenv("COORDINACION_INTERVALO", "2"))
+SALUD_INTERVALO = float(os.getenv("SALUD_INTERVALO", "30"))
+
+# ----------------- MÉTRICAS ----------------- #
+# Puerto del endpoint de métricas Prometheus; vacío = desactivado
+METRICAS_PUERTO = os.getenv("METRICAS_PUERTO", "")
+METRICAS_HOST = os.getenv("METRICAS_HOST", "127.0.0.1")
+
+metricas = Metricas()
+m_interacciones = metricas.histograma(
+    "bot_interaccion_segundos", "Duración de cada interacción por tipo y nombre",
+    ("tipo", "nombre", "resultado"))
+m_rest = metricas.contador("bot_rest_llamadas_total", "Llamadas REST a Discord", ("metodo", "ruta", "estado"))
+m_rest_429 = metricas.contador("bot_rest_limitadas_total", "Respuestas 429 de Discord", ("metodo", "ruta"))
+m_volcados = metricas.histograma("bot_volcado_segundos", "Duración de cada escritura a disco", ("destino",))
+m_volcado_bytes = metricas.contador("bot_volcado_bytes_total", "Bytes escritos a disco", ("destino",))
+m_dashboard = metricas.contador("bot_dashboard_total", "Refrescos del dashboard pedidos y ejecutados", ("evento",))
+metricas.medidor("bot_salas_activas", "Salas abiertas en todos los servidores",
+                 lambda: sum(len(s) for s in server_salas.values()))
+metricas.medidor("bot_torneos_activos", "Torneos activos en todos los servidores",
+                 lambda: sum(len(t) for t in server_torneos.values()))
+metricas.medidor("bot_gateway_latencia_segundos", "Latencia del heartbeat del gateway", lambda: bot.latency)
+metricas.medidor("bot_shard_latencia_segundos", "Latencia del heartbeat de cada shard",
+                 lambda: {(i,): s.latency for i, s in bot.shards.items()}, ("shard",))
+metricas.medidor("bot_shard_conectado", "1 si el shard está conectado al gateway",
+                 lambda: {(i,): int(not s.is_closed()) for i, s in bot.shards.items()}, ("shard",))
+m_shard_eventos = metricas.contador("bot_shard_eventos_total", "Conexiones, caídas y reanudaciones de cada shard",
+                                    ("shard", "evento"))
+
+def memoria_residente():
+    """Bytes de memoria residente del proceso (None si no se puede saber)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Fuera de Linux solo hay el pico (ru_maxrss, en bytes en macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        return None
+
+def texto_memoria():
+    rss = memoria_residente()
+    return f"{rss / 1048576:.1f} MB" if rss else "desconocida"
+
+metricas.medidor("bot_memoria_residente_bytes", "Memoria residente del proceso", memoria_residente)
+metricas.medidor("bot_guilds_en_memoria", "Servidores con su estado cargado en memoria", lambda: almacen.guilds_cargados)
+
+# ----------------- API LOCAL ----------------- #
+# Puerto TCP local o ruta de socket Unix de la API que usa el panel web (web/);
+# API_PUERTO vacío y sin API_SOCKET = desactivada (por defecto). Por TCP exige
+# API_TOKEN: cualquier proceso de la máquina podría cambiar el estado
+API_PUERTO = os.getenv("API_PUERTO", "")
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_SOCKET = os.getenv("API_SOCKET", "")
+# Si se define, el panel debe mandar "Authorization: Bearer <token>"
+API_TOKEN = os.getenv("API_TOKEN", "")
+
+# Versión de cada guild y del ranking: los ETag de la API
+versiones = Versiones()
+api_local = ApiLocal(versiones, API_HOST, int(API_PUERTO) if API_PUERTO else None, API_SOCKET or None, API_TOKEN or None)
+
+servidor_metricas = ServidorMetricas(metricas, METRICAS_HOST, int(METRICAS_PUERTO)) if METRICAS_PUERTO else None
+
+def observar_volcado(destino):
+    def observar(segundos, escritos):
+        m_volcados.observar(segundos, destino)
+        m_volcado_bytes.inc(destino, cantidad=escritos)
+    return observar
+
+# ----------------- MEDICIÓN DE INTERACCIONES ----------------- #
+# Interacciones más lentas que esto (segundos) se anotan en consola
+INTERACCION_LENTA = float(os.getenv("INTERACCION_LENTA", "1"))
+# Discord da 3 s para reconocer una interacción; se avisa al pasar de aquí
+ACK_AVISO = 2.5
+PERFILES_DIR = os.getenv("PERFILES_DIR", "perfiles")
+
+m_primera_respuesta = metricas.histograma(
+    "bot_interaccion_respuesta_segundos", "Tiempo hasta la primera respuesta, contando el retraso del gateway",
+    ("tipo", "nombre"))
+m_cerca_limite = metricas.contador(
+    "bot_interaccion_cerca_limite_total", "Interacciones respondidas cerca del límite de 3 s o sin responder",
+    ("tipo", "nombre"))
+perfilador = Perfilador(PERFILES_DIR)
+
+# Carpeta donde grabar trazas anónimas de interacciones; vacío = no se graba
+TRAZAS_DIR = os.getenv("TRAZAS_DIR", "")
+grabador = GrabadorTrazas(TRAZAS_DIR) if TRAZAS_DIR else None
+
+mediciones = {}  # {InteractionResponse: [tipo, nombre, inicio, retraso_gateway, primera_respuesta]}
+
+def empezar_medicion(interaction, tipo, nombre):
+    # El plazo de 3 s corre desde que Discord creó la interacción, no desde que llegó
+    retraso = max(0.0, time.time() - interaction.created_at.timestamp())
+    mediciones[interaction.response] = [tipo, nombre, time.perf_counter(), retraso, None]
+
+def terminar_medicion(interaction, resultado):
+    medicion = mediciones.pop(interaction.response, None)
+    if medicion is None:
+        return
+    tipo, nombre, inicio, retraso, respuesta = medicion
+    total = time.perf_counter() - inicio
+    m_interacciones.observar(total, tipo, nombre, resultado)
+    antes = (respuesta if respuesta is not None else time.perf_counter()) - inicio
+    hasta_ack = retraso + antes
+    m_primera_respuesta.observar(hasta_ack, tipo, nombre)
+    cerca = respuesta is None or hasta_ack >= ACK_AVISO
+    if cerca:
+        m_cerca_limite.inc(tipo, nombre)
+    if cerca or total >= INTERACCION_LENTA:
+        aviso = " ⚠️ sin respuesta" if respuesta is None else (" ⚠️ cerca del límite de 3s" if cerca else "")
+        print(f"🐢 {tipo} {nombre}: {hasta_ack:.2f}s hasta responder (gateway {retraso:.2f}s), {total:.2f}s en total{aviso}")
+    perfilador.interaccion_terminada()
+
+def _anotar_respuesta(metodo):
+    async def envoltura(self, *args, **kwargs):
+        valor = await metodo(self, *args, **kwargs)
+        medicion = mediciones.get(self)
+        if medicion is not None and medicion[4] is None:
+            medicion[4] = time.perf_counter()
+        return valor
+    return envoltura
+
+# discord.py no avisa cuándo se reconoce una interacción: se envuelven los
+# métodos de respuesta para anotar el momento de la primera
+for _metodo in ("defer", "send_message", "edit_message", "send_modal"):
+    setattr(discord.InteractionResponse, _metodo, _anotar_respuesta(getattr(discord.InteractionResponse, _metodo)))
+
+def grabar(tipo, nombre, interaction, origen=None):
+    if tipo == "modal":
+        valores = {k: v.value for k, v in vars(origen).items() if isinstance(v, TextInput)}
+    elif tipo == "select":
+        valores = {"values": (interaction.data or {}).get("values", [])}
+    elif tipo == "comando":
+        valores = {o["name"]: o.get("value") for o in (interaction.data or {}).get("options", [])}
+    else:
+        valores = {}
+    grabador.registrar(tipo, nombre, interaction, origen, valores)
+
+def medido(tipo, nombre, callback, origen=None):
+    """Envuelve el callback de un botón, select o modal con la medición (y la
+    grabación de trazas si está activa); origen es la vista o el modal"""
+    async def envoltura(interaction, *args):
+        if grabador:
+            grabar(tipo, nombre, interaction, origen)
+        empezar_medicion(interaction, tipo, nombre)
+        resultado = "error"
+        try:
+            valor = await callback(interaction, *args)
+            resultado = "ok"
+            return valor
+        finally:
+            terminar_medicion(interaction, resultado)
+    return envoltura
+
+class VistaMedida(View):
+    """View cuyos botones y selects quedan medidos"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for item in self.children:
+            self._medir(item)
+
+    def nombre_item(self, item):
+        if self.timeout is None and item.custom_id:
+            # Vistas persistentes: el custom_id es estable (sin el ID del servidor)
+            return re.sub(r"\d{15,}", ":id", item.custom_id)
+        return f"{type(self).__name__}.{getattr(item, 'label', None) or getattr(item, 'placeholder', None)}"
+
+    def _medir(self, item):
+        if not hasattr(item, "callback"):
+            return
+        tipo = "select" if isinstance(item, discord.ui.Select) else "boton"
+        item.callback = medido(tipo, self.nombre_item(item), item.callback, self)
+
+    def add_item(self, item):
+        self._medir(item)
+        return super().add_item(item)
+
+class ModalMedido(Modal):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_submit = medido("modal", type(self).__name__, self.on_submit, self)
+
+class ArbolMedido(app_commands.CommandTree):
+    """Empieza la medición de cada slash command; la termina
+    on_app_command_completion (o on_error si falla)"""
+
+    async def interaction_check(self, interaction):
+        if interaction.type == discord.InteractionType.application_command:
+            if grabador:
+                grabar("comando", interaction.data.get("name"), interaction)
+            empezar_medicion(interaction, "comando", interaction.data.get("name"))
+        return True
 
-# Ranking global (compartido entre servidores)
-ranking = {}
+    async def on_error(self, interaction, error):
+        terminar_medicion(interaction, "error")
+        await super().on_error(interaction, error)
+
+class TorneosBot(commands.AutoShardedBot):
+    async def setup_hook(self):
+        diario.iniciar()
+        almacen.iniciar()
+        planificador.iniciar()
+        cola_roles.iniciar()
+        enlace_coordinacion.iniciar()
+        if servidor_metricas:
+            await servidor_metricas.iniciar()
+        if API_PUERTO and not API_SOCKET and not API_TOKEN:
+            print("⚠️ API_PUERTO sin API_TOKEN: la API local no se inicia (define un token o usa API_SOCKET)")
+        elif API_PUERTO or API_SOCKET:
+            try:
+                await api_local.iniciar()
+            except OSError as e:
+                # El bot funciona sin el panel; un puerto ocupado no debe impedir el arranque
+                print(f"❌ No se pudo abrir la API local: {e}")
+        if RECARGA_CONFIG and hasattr(backend, "cambios_externos"):
+            backend.respetar_externos = True
+            vigilante_config.iniciar()
+        if grabador:
+            grabador.iniciar()
+
+    async def close(self):
+        try:
+            await super().close()
+        finally:
+            await enlace_coordinacion.detener()
+            vigilante_config.detener()
+            await almacen.detener()
+            await diario.detener()
+            if servidor_metricas:
+                await servidor_metricas.detener()
+            await api_local.detener()
+            if grabador:
+                await grabador.detener()
+
+bot = TorneosBot(
+    command_prefix='/',
+    intents=intents,
+    tree_cls=ArbolMedido,
+    shard_count=SHARD_COUNT,
+    shard_ids=SHARD_IDS,
+    http_trace=traza_http(m_rest, m_rest_429) if servidor_metricas else None
+)
 
-# Diccionario para almacenar tasks de cierre de salas
-sala_timers = {}  # {sala_id: [cierre_task, recordatorio_task, contador_task]}
+@bot.event
+async def on_app_command_completion(interaction, command):
+    terminar_medicion(interaction, "ok")
 
-if os.path.exists(RANKING_FILE):
-    with open(RANKING_FILE, "r") as f:
-        ranking = json.load(f)
-else:
-    ranking = {}
-
-if os.path.exists(CONFIG_FILE):
-    with open(CONFIG_FILE, "r") as f:
-        data = json.load(f)
-        server_configs = data.get("configs", {})
-        server_torneos = data.get("torneos", {})
-        server_salas = data.get("salas", {})
-else:
-    server_configs = {}
-    server_torneos = {}
-    server_salas = {}
+@bot.before_invoke
+async def _inicio_comando(ctx):
+    ctx.inicio = time.perf_counter()
 
-def guardar_ranking():
-    with open(RANKING_FILE, "w") as f:
-        json.dump(ranking, f, indent=4)
+@bot.after_invoke
+async def _fin_comando(ctx):
+    resultado = "error" if ctx.command_failed else "ok"
+    m_interacciones.observar(time.perf_counter() - ctx.inicio, "prefijo", ctx.command.qualified_name, resultado)
 
-def guardar_config():
-    data = {"configs": server_configs, "torneos": server_torneos, "salas": server_salas}
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+backend = crear_backend(ALMACEN_BACKEND, CONFIG_FILE, RANKING_FILE, DB_FILE, SHARDS_DIR, crear_serializador(SERIALIZADOR))
+estado = backend.cargar()
 
-def guardar_torneos():
-    guardar_config()
+# Estados por servidor
+server_configs = estado["configs"]  # {guild_id: {channel_id: ..., message_id: ..., torneo_seleccionado: ...}}
+server_torneos = estado["torneos"]  # {guild_id: {torneo_name: {user_id: team_name}}}
+server_salas = estado["salas"]  # {guild_id: {sala_id: {nombre, hora_apertura, hora_cierre, jugadores[], canal_id, mensaje_id}}}
+
+# Ranking global (compartido entre servidores)
+ranking = estado["ranking"]
+
+diario = Diario(DIARIO_FILE)
+almacen = AlmacenDiferido(backend, estado, intervalo=GUARDADO_INTERVALO, diario=diario)
+# Último volcado si el proceso termina sin pasar por bot.close() (atexit va en orden inverso)
+atexit.register(diario.vaciar_sync)
+atexit.register(almacen.vaciar_sync)
+almacen.observador = observar_volcado("snapshot")
+diario.observador = observar_volcado("diario")
+
+def _marcar_mutacion(registro):
+    if "guild" in registro:
+        almacen.marcar_guild(registro["guild"])
+    if registro["op"] == "victoria":
+        almacen.marcar_equipo(registro["equipo"])
+
+# Índice equipo -> miembros de cada torneo, mantenido en cada mutación
+indice_equipos = IndiceEquipos(estado)
+# Ranking global siempre ordenado para top-K y paginación
+ranking_ordenado = RankingOrdenado(ranking)
+# Jugadores anotados en las notificaciones de salas, por estado
+indice_notificaciones = IndiceNotificaciones(estado)
+# Ventana horaria y jugadores de cada sala para el botón de unirse
+indice_salas = IndiceSalas(estado)
+
+def _aplicar(registro):
+    if "guild" in registro:
+        almacen.asegurar_guild(registro["guild"])
+    indice_equipos.actualizar(registro)
+    indice_notificaciones.actualizar(registro)
+    indice_salas.actualizar(registro)
+    if registro["op"] == "victoria":
+        ranking_ordenado.actualizar(registro["equipo"], registro["total"])
+    aplicar_mutacion(estado, registro)
+    _marcar_mutacion(registro)
+    versiones.cambio(registro)
+
+def mutar(op, guild_id=None, **datos):
+    """Aplica un cambio al estado, lo anota en el diario y lo deja pendiente de volcar"""
+    registro = {"op": op, **datos}
+    if guild_id is not None:
+        registro["guild"] = str(guild_id)
+    _aplicar(registro)
+    diario.registrar(registro)
+
+# Reaplicar sobre el snapshot lo que quedó en el diario tras una caída
+for _registro in diario.leer():
+    _aplicar(_registro)
+
+# Los guilds se leen del backend al accederlos: aquí solo hay ranking y lo del diario
+print(f"💾 Estado listo en {(time.perf_counter() - INICIO_PROCESO) * 1000:.0f} ms "
+      f"({almacen.guilds_cargados} servidores en memoria, {len(ranking)} equipos, RSS {texto_memoria()})")
+
+# ----------------- COORDINACIÓN ----------------- #
+# Con varios procesos, el ranking global vive en la base de coordinación y cada
+# proceso mantiene su copia en memoria al día con los cambios de los demás
+if COORDINACION_DB:
+    coordinador = CoordinadorSQLite(COORDINACION_DB)
+    coordinador.importar(ranking)
+else:
+    coordinador = CoordinadorLocal(ranking)
+
+async def sumar_victoria(equipo):
+    """Suma una victoria en el ranking compartido y devuelve el nuevo total"""
+    if COORDINACION_DB:
+        return await asyncio.to_thread(coordinador.sumar_victoria, equipo)
+    return coordinador.sumar_victoria(equipo)
+
+class EnlaceCoordinacion:
+    """Trae los cambios del ranking hechos por otros procesos y reporta la
+    salud de los shards de este"""
+
+    def __init__(self, coordinador, intervalo, intervalo_salud):
+        self.coordinador = coordinador
+        self.intervalo = intervalo
+        self.intervalo_salud = intervalo_salud
+        self.version = 0
+        self._task = None
+
+    def sincronizar(self):
+        """Bloquea: aplica lo cambiado desde la última versión vista"""
+        self.version, cambios = self.coordinador.cambios_desde(self.version)
+        return cambios
+
+    def _aplicar_cambios(self, cambios):
+        for equipo, victorias in cambios:
+            if ranking.get(equipo) != victorias:
+                mutar("victoria", equipo=equipo, total=victorias)
+
+    def shards(self):
+        guilds = {}
+        for guild in bot.guilds:
+            guilds[guild.shard_id] = guilds.get(guild.shard_id, 0) + 1
+        return [(shard_id, not shard.is_closed(), shard.latency, guilds.get(shard_id, 0))
+                for shard_id, shard in bot.shards.items()]
+
+    async def _bucle(self):
+        ultimo_reporte = 0.0
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                self._aplicar_cambios(await asyncio.to_thread(self.sincronizar))
+                if time.monotonic() - ultimo_reporte >= self.intervalo_salud:
+                    ultimo_reporte = time.monotonic()
+                    await asyncio.to_thread(self.coordinador.reportar_salud, PROCESO, self.shards())
+            except Exception as e:
+                print(f"❌ Error de coordinación: {e}")
+
+    def iniciar(self):
+        if isinstance(self.coordinador, CoordinadorLocal):
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+enlace_coordinacion = EnlaceCoordinacion(coordinador, COORDINACION_INTERVALO, SALUD_INTERVALO)
+# Al arrancar se parte del ranking compartido, no del snapshot local
+if COORDINACION_DB:
+    enlace_coordinacion._aplicar_cambios(enlace_coordinacion.sincronizar())
+
+def guardar_ranking(equipo=None):
+    # Solo marca el cambio; el volcado real lo hace el almacén diferido
+    if equipo is None:
+        almacen.marcar_todo()
+    else:
+        almacen.marcar_equipo(equipo)
+
+def guardar_config(guild_id=None):
+    if guild_id is None:
+        almacen.marcar_todo()
+    else:
+        almacen.marcar_guild(guild_id)
+
+def guardar_torneos(guild_id=None):
+    guardar_config(guild_id)
 
 def get_server_torneos(guild_id):
     guild_id = str(guild_id)
+    almacen.asegurar_guild(guild_id)
     if guild_id not in server_torneos:
         server_torneos[guild_id] = {}
-        guardar_config()
+        guardar_config(guild_id)
     return server_torneos[guild_id]
 
 def get_server_config(guild_id):
     guild_id = str(guild_id)
+    almacen.asegurar_guild(guild_id)
     if guild_id not in server_configs:
         server_configs[guild_id] = {
             "channel_id": None,
             "message_id": None,
             "torneo_seleccionado": None
         }
-        guardar_config()
+        guardar_config(guild_id)
     return server_configs[guild_id]
 
 def get_server_salas(guild_id):
     guild_id = str(guild_id)
+    almacen.asegurar_guild(guild_id)
     if guild_id not in server_salas:
         server_salas[guild_id] = {}
-        guardar_config()
+        guardar_config(guild_id)
     return server_salas[guild_id]
 
-def readConfig():
-    try:
-        config_path = path.join(path.dirname(__file__), CONFIG_FILE)
-        if path.exists(config_path):
-            with open(config_path, 'r') as f:
-                return json.load(f)
-        return {"configs": {}, "torneos": {}, "salas": {}, "notificaciones_salas": {}}
-    except:
-        return {"configs": {}, "torneos": {}, "salas": {}, "notificaciones_salas": {}}
+# Segundos que se acumulan líneas de log antes de enviarlas juntas
+LOG_INTERVALO = float(os.getenv("LOG_INTERVALO", "3"))
+
+class RegistroCanal:
+    """Buffer de líneas de log por guild que se envían agrupadas.
+
+    Se manda un solo mensaje por intervalo (o antes si se juntan max_lineas).
+    Si Discord nos frena, el envío tarda más y el intervalo se alarga, así
+    que las líneas siguientes se agrupan en menos mensajes; si el buffer se
+    llena se descartan las más antiguas y se avisa cuántas se perdieron."""
+
+    LIMITE_MENSAJE = 2000
+
+    def __init__(self, intervalo, max_lineas=20, max_buffer=500):
+        self.intervalo = intervalo
+        self.max_lineas = max_lineas
+        self.max_buffer = max_buffer
+        self._buffers = {}  # {guild_id: deque de líneas}
+        self._descartadas = {}
+        self._tareas = {}
+        self._despertar = {}
+        self._espera = {}  # intervalo actual de cada guild (crece con la presión)
+
+    def agregar(self, guild_id, mensaje):
+        guild_id = str(guild_id)
+        buffer = self._buffers.setdefault(guild_id, deque())
+        if len(buffer) >= self.max_buffer:
+            buffer.popleft()
+            self._descartadas[guild_id] = self._descartadas.get(guild_id, 0) + 1
+        buffer.append(mensaje)
+        if guild_id not in self._tareas:
+            self._despertar[guild_id] = asyncio.Event()
+            self._tareas[guild_id] = asyncio.create_task(self._enviar_guild(guild_id))
+        elif len(buffer) >= self.max_lineas:
+            self._despertar[guild_id].set()
+
+    def _tomar_mensaje(self, guild_id):
+        buffer = self._buffers[guild_id]
+        lineas = []
+        descartadas = self._descartadas.pop(guild_id, 0)
+        if descartadas:
+            lineas.append(f"⚠️ {descartadas} líneas de log omitidas")
+        largo = sum(len(l) + 1 for l in lineas)
+        while buffer and largo + len(buffer[0]) + 1 <= self.LIMITE_MENSAJE:
+            largo += len(buffer[0]) + 1
+            lineas.append(buffer.popleft())
+        if not lineas and buffer:
+            lineas.append(buffer.popleft()[:self.LIMITE_MENSAJE])
+        return "\n".join(lineas)
+
+    async def _enviar_guild(self, guild_id):
+        try:
+            while self._buffers.get(guild_id):
+                espera = self._espera.get(guild_id, self.intervalo)
+                if len(self._buffers[guild_id]) < self.max_lineas:
+                    try:
+                        await asyncio.wait_for(self._despertar[guild_id].wait(), timeout=espera)
+                    except asyncio.TimeoutError:
+                        pass
+                self._despertar[guild_id].clear()
+                config = get_server_config(guild_id)
+                channel = bot.get_channel(int(config["channel_id"])) if config["channel_id"] else None
+                if not channel:
+                    self._buffers[guild_id].clear()
+                    break
+                texto = self._tomar_mensaje(guild_id)
+                inicio = time.monotonic()
+                try:
+                    await channel.send(texto)
+                except discord.HTTPException as e:
+                    print(f"❌ Error al enviar log de {guild_id}: {e}")
+                # Un envío lento indica rate limit: se espacian los siguientes
+                duracion = time.monotonic() - inicio
+                if duracion > 1:
+                    self._espera[guild_id] = min(espera * 2, self.intervalo * 10)
+                else:
+                    self._espera[guild_id] = self.intervalo
+        finally:
+            del self._tareas[guild_id]
+
+registro_canal = RegistroCanal(LOG_INTERVALO)
 
-def writeConfig(data):
+async def logear(mensaje, guild_id):
+    # Solo encola la línea: el envío agrupado nunca bloquea al handler
+    registro_canal.agregar(guild_id, mensaje)
+
+# ----------------- ÍNDICE DE ROLES ----------------- #
+ROL_JUGADOR = "Jugador"
+
+class IndiceRoles:
+    """nombre -> rol por guild, para no recorrer guild.roles en cada búsqueda.
+
+    Se construye la primera vez que se consulta un guild y se mantiene con
+    los eventos on_guild_role_create/update/delete."""
+
+    def __init__(self):
+        self._guilds = {}  # {guild_id: {nombre: {role_id: role}}}
+
+    def construir(self, guild):
+        indice = {}
+        for role in guild.roles:
+            indice.setdefault(role.name, {})[role.id] = role
+        self._guilds[guild.id] = indice
+        return indice
+
+    def obtener(self, guild, nombre):
+        indice = self._guilds.get(guild.id)
+        if indice is None:
+            indice = self.construir(guild)
+        roles = indice.get(nombre)
+        if not roles:
+            return None
+        if len(roles) == 1:
+            return next(iter(roles.values()))
+        # Con nombres repetidos, el mismo que devolvía discord.utils.get
+        return min(roles.values(), key=lambda r: r.position)
+
+    def agregar(self, role):
+        indice = self._guilds.get(role.guild.id)
+        if indice is not None:
+            indice.setdefault(role.name, {})[role.id] = role
+
+    def quitar(self, role, nombre=None):
+        indice = self._guilds.get(role.guild.id)
+        if indice is None:
+            return
+        nombre = role.name if nombre is None else nombre
+        roles = indice.get(nombre)
+        if roles:
+            roles.pop(role.id, None)
+            if not roles:
+                del indice[nombre]
+
+    def olvidar(self, guild_id):
+        self._guilds.pop(guild_id, None)
+
+indice_roles = IndiceRoles()
+roles_en_creacion = {}  # {(guild_id, nombre): task}
+
+def obtener_rol(guild, nombre):
+    return indice_roles.obtener(guild, nombre)
+
+async def obtener_o_crear_rol(guild, nombre):
+    """Devuelve (rol, creado); si varias interacciones piden a la vez el mismo
+    rol inexistente, comparten una sola llamada a create_role"""
+    rol = indice_roles.obtener(guild, nombre)
+    if rol:
+        return rol, False
+    clave = (guild.id, nombre)
+    tarea = roles_en_creacion.get(clave)
+    if tarea:
+        return await asyncio.shield(tarea), False
+    tarea = asyncio.ensure_future(guild.create_role(name=nombre))
+    roles_en_creacion[clave] = tarea
     try:
-        config_path = path.join(path.dirname(__file__), CONFIG_FILE)
-        with open(config_path, 'w') as f:
-            json.dump(data, f, indent=4)
-        return True
-    except:
-        return False
+        rol = await tarea
+    finally:
+        del roles_en_creacion[clave]
+    # No se espera al evento del gateway para que la siguiente búsqueda lo vea
+    indice_roles.agregar(rol)
+    return rol, True
+
+# ----------------- OPERACIONES MASIVAS DE ROLES ----------------- #
+# Llamadas simultáneas a la API de roles por trabajo; discord.py ya espera los 429
+ROLES_CONCURRENCIA = int(os.getenv("ROLES_CONCURRENCIA", "4"))
+
+class MotorRoles:
+    """Ejecuta trabajos de roles en segundo plano con concurrencia acotada.
+
+    Cada trabajo vive en config["trabajos_roles"] del guild con su lista de
+    operaciones y cuántas hay hechas, así que se persiste con el resto del
+    estado y on_ready lo retoma si el bot se reinicia a mitad. Operaciones:
+    ["quitar", user_id, role_id] y ["borrar", role_id, [user_ids]]; si borrar
+    el rol falla, se cambia por quitarlo a cada miembro."""
+
+    def __init__(self, concurrencia, intervalo_progreso=2.0):
+        self.concurrencia = concurrencia
+        self.intervalo_progreso = intervalo_progreso
+        self._activos = {}  # {(guild_id, trabajo_id): task}
+
+    def crear(self, guild_id, tipo, ops, fin):
+        # Varios guilds (o dos salas con el mismo cierre) crean trabajos a la vez
+        trabajo = {"id": f"{tipo}-{uuid.uuid4().hex[:12]}", "ops": ops, "hechos": 0, "fin": fin}
+        self._guardar(guild_id, trabajo)
+        return trabajo
+
+    def _guardar(self, guild_id, trabajo):
+        """Trabajo completo con sus operaciones: al crearlo y si la lista crece;
+        el progreso solo anota "hechos" para no reescribir las operaciones"""
+        mutar("trabajo_roles", guild_id, trabajo=dict(trabajo, ops=list(trabajo["ops"])))
+
+    def lanzar(self, guild, trabajo, mensaje=None):
+        clave = (str(guild.id), trabajo["id"])
+        if clave in self._activos:
+            return self._activos[clave]
+        tarea = asyncio.create_task(self._ejecutar(guild, trabajo, mensaje))
+        self._activos[clave] = tarea
+        tarea.add_done_callback(lambda _: self._activos.pop(clave, None))
+        return tarea
+
+    def reanudar(self, guild):
+        for trabajo in list((get_server_config(guild.id).get("trabajos_roles") or {}).values()):
+            self.lanzar(guild, dict(trabajo, ops=list(trabajo["ops"])))
+
+    async def _op(self, guild, op, ops):
+        if op[0] == "borrar":
+            role = guild.get_role(int(op[1]))
+            if not role:
+                return
+            try:
+                await role.delete()
+            except discord.NotFound:
+                pass
+            except Exception:
+                ops.extend(["quitar", uid, op[1]] for uid in op[2])
+            return
+        member = guild.get_member(int(op[1]))
+        role = guild.get_role(int(op[2]))
+        if member and role and role in member.roles:
+            try:
+                await member.remove_roles(role)
+            except discord.NotFound:
+                pass
 
-async def logear(mensaje, guild_id):
-    config = get_server_config(guild_id)
-    if config["channel_id"]:
-        channel = bot.get_channel(int(config["channel_id"]))
-        if channel:
-            await channel.send(mensaje)
+    async def _ejecutar(self, guild, trabajo, mensaje):
+        guild_id = str(guild.id)
+        ops = trabajo["ops"]
+        siguiente = trabajo["hechos"]
+        completados = set()
+        ultimo_progreso = time.monotonic()
+        guardadas = len(ops)
+
+        async def progreso(final=False):
+            nonlocal guardadas
+            # "hechos" solo avanza sobre el prefijo terminado: al reanudar se
+            # repiten como mucho las operaciones que estaban en vuelo
+            while trabajo["hechos"] in completados:
+                completados.discard(trabajo["hechos"])
+                trabajo["hechos"] += 1
+            if final:
+                mutar("fin_trabajo_roles", guild_id, trabajo_id=trabajo["id"])
+            elif len(ops) != guardadas:
+                # Un rol que no se pudo borrar añadió operaciones "quitar"
+                guardadas = len(ops)
+                self._guardar(guild_id, trabajo)
+            else:
+                mutar("progreso_trabajo_roles", guild_id, trabajo_id=trabajo["id"], hechos=trabajo["hechos"])
+            if mensaje:
+                texto = (trabajo["fin"] or "✅ Listo") if final else f"⏳ Procesando roles: {trabajo['hechos']}/{len(ops)}"
+                try:
+                    await mensaje.edit(content=texto)
+                except:
+                    pass
+
+        async def trabajador():
+            nonlocal siguiente, ultimo_progreso
+            while siguiente < len(ops):
+                i = siguiente
+                siguiente += 1
+                try:
+                    await self._op(guild, ops[i], ops)
+                except Exception as e:
+                    print(f"❌ Error en operación de roles {ops[i]}: {e}")
+                completados.add(i)
+                if time.monotonic() - ultimo_progreso >= self.intervalo_progreso:
+                    ultimo_progreso = time.monotonic()
+                    await progreso()
+
+        await asyncio.gather(*(trabajador() for _ in range(self.concurrencia)))
+        await progreso(final=True)
+        if not mensaje and trabajo["fin"]:
+            await logear(trabajo["fin"], guild_id)
+
+motor_roles = MotorRoles(ROLES_CONCURRENCIA)
+
+# Asignaciones de rol que pueden esperar en cola antes de frenar a quien encola
+ROLES_COLA_MAX = int(os.getenv("ROLES_COLA_MAX", "1000"))
+
+class ColaRoles:
+    """Cola acotada de asignaciones de rol atendida por unos pocos workers.
+
+    Los clics que llegan en ráfaga responden enseguida y solo encolan
+    (guild_id, user_id, nombre_rol); una asignación repetida que aún está en
+    cola se descarta. Si la cola está llena, agregar() espera hueco, pero
+    como se llama después de responder la interacción nunca caduca."""
+
+    def __init__(self, workers, maximo):
+        self.workers = workers
+        self._cola = asyncio.Queue(maxsize=maximo)
+        self._pendientes = set()
+        self._tareas = []
+
+    async def agregar(self, guild_id, user_id, nombre_rol):
+        clave = (str(guild_id), str(user_id), nombre_rol)
+        if clave in self._pendientes:
+            return
+        self._pendientes.add(clave)
+        await self._cola.put(clave)
+
+    async def _asignar(self, guild_id, user_id, nombre_rol):
+        guild = bot.get_guild(int(guild_id))
+        member = guild.get_member(int(user_id)) if guild else None
+        if not member:
+            return
+        rol, _ = await obtener_o_crear_rol(guild, nombre_rol)
+        if rol not in member.roles:
+            await member.add_roles(rol)
+
+    async def _worker(self):
+        while True:
+            clave = await self._cola.get()
+            try:
+                await self._asignar(*clave)
+            except Exception as e:
+                print(f"❌ Error al asignar el rol {clave[2]} a {clave[1]}: {e}")
+            finally:
+                self._pendientes.discard(clave)
+                self._cola.task_done()
+
+    async def esperar(self):
+        """Espera a que se atiendan todas las asignaciones encoladas"""
+        await self._cola.join()
+
+    def iniciar(self):
+        self._tareas = [t for t in self._tareas if not t.done()]
+        for _ in range(self.workers - len(self._tareas)):
+            self._tareas.append(asyncio.create_task(self._worker()))
+
+cola_roles = ColaRoles(ROLES_CONCURRENCIA, ROLES_COLA_MAX)
 
 # ----------------- MODALES ----------------- #
-class UnirseModal(Modal):
+class UnirseModal(ModalMedido):
     def __init__(self, torneo, guild_id):
         super().__init__(title=f"Unirse al torneo {torneo}")
         self.torneo = torneo
@@ -118,25 +857,22 @@ class UnirseModal(Modal):
         self.add_item(self.equipo_input)
 
     async def on_submit(self, interaction):
-        torneos = get_server_torneos(self.guild_id)
         user_id = str(interaction.user.id)
-        if self.torneo not in torneos:
-            torneos[self.torneo] = {}
-        torneos[self.torneo][user_id] = self.equipo_input.value
-        guardar_torneos()
+        mutar("unirse", self.guild_id, torneo=self.torneo, user_id=user_id, equipo=self.equipo_input.value)
+        # Así el dashboard ya tiene el nombre sin consultar la API
+        cache_nombres.guardar(user_id, interaction.user.name)
         guild = interaction.guild
-        role = discord.utils.get(guild.roles, name=self.equipo_input.value)
-        if not role:
-            role = await guild.create_role(name=self.equipo_input.value)
+        role, creado = await obtener_o_crear_rol(guild, self.equipo_input.value)
+        if creado:
             await logear(f'🆕 Se creó el equipo **{self.equipo_input.value}**.', self.guild_id)
         member = guild.get_member(interaction.user.id)
         if member:
             await member.add_roles(role)
         await interaction.response.send_message(f'✅ Te has unido al torneo **{self.torneo}** con el equipo **{self.equipo_input.value}**!', ephemeral=True)
         await logear(f'✅ {interaction.user.name} se unió al torneo {self.torneo} con el equipo {self.equipo_input.value}.', self.guild_id)
-        await actualizar_dashboard(interaction.guild)
+        programar_dashboard(interaction.guild)
 
-class CambiarModal(Modal):
+class CambiarModal(ModalMedido):
     def __init__(self, torneo, guild_id):
         super().__init__(title=f"Cambiar equipo en {torneo}")
         self.torneo = torneo
@@ -152,25 +888,24 @@ class CambiarModal(Modal):
             return
         guild = interaction.guild
         equipo_actual = torneos[self.torneo][user_id]
-        role_actual = discord.utils.get(guild.roles, name=equipo_actual)
+        role_actual = obtener_rol(guild, equipo_actual)
         if role_actual:
             member = guild.get_member(interaction.user.id)
             if member:
                 await member.remove_roles(role_actual)
-        torneos[self.torneo][user_id] = self.equipo_input.value
-        guardar_torneos()
-        role_nuevo = discord.utils.get(guild.roles, name=self.equipo_input.value)
-        if not role_nuevo:
-            role_nuevo = await guild.create_role(name=self.equipo_input.value)
+        mutar("cambiar", self.guild_id, torneo=self.torneo, user_id=user_id, equipo=self.equipo_input.value)
+        cache_nombres.guardar(user_id, interaction.user.name)
+        role_nuevo, creado = await obtener_o_crear_rol(guild, self.equipo_input.value)
+        if creado:
             await logear(f'🆕 Se creó el equipo {self.equipo_input.value}.', self.guild_id)
         member = guild.get_member(interaction.user.id)
         if member:
             await member.add_roles(role_nuevo)
         await interaction.response.send_message(f'🔄 Has cambiado de **{equipo_actual}** a **{self.equipo_input.value}**!', ephemeral=True)
         await logear(f'🔄 {interaction.user.name} cambió de {equipo_actual} a {self.equipo_input.value}', self.guild_id)
-        await actualizar_dashboard(interaction.guild)
+        programar_dashboard(interaction.guild)
 
-class EliminarUsuarioModal(Modal):
+class EliminarUsuarioModal(ModalMedido):
     def __init__(self, torneo, guild_id):
         super().__init__(title=f"Eliminar usuario en {torneo}")
         self.torneo = torneo
@@ -188,17 +923,16 @@ class EliminarUsuarioModal(Modal):
             await interaction.response.send_message("❌ Usuario no inscrito en este torneo.", ephemeral=True)
             return
         equipo = torneos[self.torneo][user_id]
-        del torneos[self.torneo][user_id]
-        guardar_torneos()
+        mutar("eliminar_usuario", self.guild_id, torneo=self.torneo, user_id=user_id)
         member = interaction.guild.get_member(int(user_id))
-        role = discord.utils.get(interaction.guild.roles, name=equipo)
+        role = obtener_rol(interaction.guild, equipo)
         if member and role:
             await member.remove_roles(role)
         await interaction.response.send_message(f'❌ Usuario eliminado del torneo.', ephemeral=True)
         await logear(f'❌ Usuario {user_id} eliminado de {self.torneo} y del equipo {equipo}', self.guild_id)
-        await actualizar_dashboard(interaction.guild)
+        programar_dashboard(interaction.guild)
 
-class EliminarEquipoModal(Modal):
+class EliminarEquipoModal(ModalMedido):
     def __init__(self, torneo, guild_id):
         super().__init__(title=f"Eliminar equipo en {torneo}")
         self.torneo = torneo
@@ -215,22 +949,22 @@ class EliminarEquipoModal(Modal):
         if self.torneo not in torneos:
             await interaction.response.send_message("❌ Torneo no existe.", ephemeral=True)
             return
+        # Se responde antes de tocar roles: con muchos miembros no cabe en 3 segundos
+        await interaction.response.defer(ephemeral=True, thinking=True)
         guild = interaction.guild
-        eliminados = 0
-        for user_id, user_equipo in list(torneos[self.torneo].items()):
-            if user_equipo == equipo:
-                del torneos[self.torneo][user_id]
-                member = guild.get_member(int(user_id))
-                role = discord.utils.get(guild.roles, name=equipo)
-                if member and role:
-                    await member.remove_roles(role)
-                eliminados += 1
-        guardar_torneos()
-        await interaction.response.send_message(f'❌ Equipo **{equipo}** eliminado ({eliminados} miembros removidos).', ephemeral=True)
+        miembros = list(indice_equipos.miembros(self.guild_id, self.torneo, equipo))
+        mutar("eliminar_equipo", self.guild_id, torneo=self.torneo, equipo=equipo)
+        programar_dashboard(guild)
+        role = obtener_rol(guild, equipo)
+        eliminados = len(miembros)
+        fin = f'❌ Equipo **{equipo}** eliminado ({eliminados} miembros removidos).'
+        ops = [["quitar", user_id, str(role.id)] for user_id in miembros] if role else []
+        trabajo = motor_roles.crear(self.guild_id, "eliminar_equipo", ops, fin)
+        mensaje = await interaction.followup.send(f"⏳ Procesando roles: 0/{len(ops)}", ephemeral=True, wait=True)
         await logear(f'❌ Equipo {equipo} eliminado del torneo {self.torneo}', self.guild_id)
-        await actualizar_dashboard(interaction.guild)
+        motor_roles.lanzar(guild, trabajo, mensaje)
 
-class FinalizarTorneoModal(Modal):
+class FinalizarTorneoModal(ModalMedido):
     def __init__(self, torneo, guild_id):
         super().__init__(title=f"Finalizar torneo {torneo}")
         self.torneo = torneo
@@ -249,35 +983,28 @@ class FinalizarTorneoModal(Modal):
         if self.torneo not in torneos:
             await interaction.response.send_message("❌ Torneo no existe.", ephemeral=True)
             return
+        await interaction.response.defer(ephemeral=True, thinking=True)
         guild = interaction.guild
-        equipos_eliminados = set()
-        for user_id, equipo in list(torneos[self.torneo].items()):
-            member = guild.get_member(int(user_id))
-            role = discord.utils.get(guild.roles, name=equipo)
-            if member and role:
-                await member.remove_roles(role)
-            equipos_eliminados.add(equipo)
-        for equipo in equipos_eliminados:
-            role = discord.utils.get(guild.roles, name=equipo)
+        equipos = indice_equipos.equipos(self.guild_id, self.torneo)
+        equipos_eliminados = set(equipos)
+        # Borrar el rol ya se lo quita a todos sus miembros: una llamada por
+        # equipo en lugar de una por jugador (los miembros quedan de respaldo)
+        ops = []
+        for equipo, miembros in equipos.items():
+            role = obtener_rol(guild, equipo)
             if role:
-                try:
-                    await role.delete()
-                except:
-                    pass
-        del torneos[self.torneo]
-        guardar_torneos()
-        
-        # Limpiar selección si era este torneo
-        config = get_server_config(self.guild_id)
-        if config["torneo_seleccionado"] == self.torneo:
-            config["torneo_seleccionado"] = None
-            guardar_config()
+                ops.append(["borrar", str(role.id), list(miembros)])
+        # También limpia la selección si era este torneo
+        mutar("finalizar_torneo", self.guild_id, torneo=self.torneo)
+        programar_dashboard(guild)
         
-        await interaction.response.send_message(f'✅ Torneo **{self.torneo}** finalizado y roles eliminados.', ephemeral=True)
+        fin = f'✅ Torneo **{self.torneo}** finalizado y roles eliminados.'
+        trabajo = motor_roles.crear(self.guild_id, "finalizar", ops, fin)
+        mensaje = await interaction.followup.send(f"⏳ Procesando roles: 0/{len(ops)}", ephemeral=True, wait=True)
         await logear(f'✅ Torneo {self.torneo} finalizado. Roles eliminados: {equipos_eliminados}', self.guild_id)
-        await actualizar_dashboard(interaction.guild)
+        motor_roles.lanzar(guild, trabajo, mensaje)
 
-class GanarTorneoModal(Modal):
+class GanarTorneoModal(ModalMedido):
     def __init__(self, torneo, guild_id):
         super().__init__(title=f"Registrar ganador torneo {torneo}")
         self.torneo = torneo
@@ -286,21 +1013,16 @@ class GanarTorneoModal(Modal):
         self.add_item(self.equipo_input)
 
     async def on_submit(self, interaction):
-        torneos = get_server_torneos(self.guild_id)
         if not interaction.user.guild_permissions.administrator:
             await interaction.response.send_message("❌ Solo administradores pueden usar esto.", ephemeral=True)
             return
         equipo = self.equipo_input.value
-        if equipo in ranking:
-            ranking[equipo] += 1
-        else:
-            ranking[equipo] = 1
-        guardar_ranking()
+        mutar("victoria", equipo=equipo, total=await sumar_victoria(equipo))
         await interaction.response.send_message(f'🏆 Equipo **{equipo}** registrado como ganador! Total victorias: {ranking[equipo]}', ephemeral=True)
         await logear(f'🏆 Equipo {equipo} ganó el torneo {self.torneo}. Total: {ranking[equipo]}', self.guild_id)
-        await actualizar_dashboard(interaction.guild)
+        programar_dashboard(interaction.guild)
 
-class CrearTorneoModal(Modal):
+class CrearTorneoModal(ModalMedido):
     def __init__(self, guild_id):
         super().__init__(title="Crear Nuevo Torneo")
         self.guild_id = str(guild_id)
@@ -316,13 +1038,12 @@ class CrearTorneoModal(Modal):
         if nombre in torneos:
             await interaction.response.send_message(f"❌ El torneo **{nombre}** ya existe.", ephemeral=True)
             return
-        torneos[nombre] = {}
-        guardar_torneos()
+        mutar("crear_torneo", self.guild_id, torneo=nombre)
         await interaction.response.send_message(f'🏆 Torneo **{nombre}** creado exitosamente!', ephemeral=True)
         await logear(f'🏆 Torneo {nombre} creado por {interaction.user.name}', self.guild_id)
-        await actualizar_dashboard(interaction.guild)
+        programar_dashboard(interaction.guild)
 
-class CrearSalaModal(Modal):
+class CrearSalaModal(ModalMedido):
     def __init__(self, guild_id, channel_id):
         super().__init__(title="Crear Nueva Sala")
         self.guild_id = str(guild_id)
@@ -350,92 +1071,132 @@ class CrearSalaModal(Modal):
             await interaction.response.send_message("❌ Formato de hora inválido. Usa HH:MM", ephemeral=True)
             return
         
-        sala_id = str(int(datetime.now().timestamp()))
-        salas = get_server_salas(self.guild_id)
-        salas[sala_id] = {
-            "nombre": nombre,
-            "hora_apertura": apertura,
-            "hora_cierre": cierre,
-            "jugadores": [],
-            "canal_id": str(self.channel_id),
-            "mensaje_id": None
-        }
-        guardar_config()
-        
-        # Crear embed con botón
-        embed = discord.Embed(title=f"🎮 Sala: {nombre}", color=discord.Color.green())
-        embed.description = f"⏰ Apertura: **{apertura}** → Cierre: **{cierre}**\n⏳ Tiempo restante: Calculando..."
-        embed.set_footer(text="Haz clic en el botón para unirte")
-        
-        view = SalaView(sala_id, self.guild_id)
-        channel = bot.get_channel(self.channel_id)
-        msg = await channel.send(embed=embed, view=view)
-        
-        salas[sala_id]["mensaje_id"] = str(msg.id)
-        guardar_config()
-        
+        await abrir_sala(self.guild_id, bot.get_channel(self.channel_id), nombre, apertura, cierre)
         await interaction.response.send_message(f'✅ Sala **{nombre}** creada exitosamente!', ephemeral=True)
-        
-        # Programar cierre automático
-        await programar_cierre_sala(self.guild_id, sala_id, cierre_h, cierre_m, msg.channel)
 
-async def programar_cierre_sala(guild_id, sala_id, cierre_h, cierre_m, channel):
-    """Programa cierre automático, recordatorio y contador de una sala"""
+async def abrir_sala(guild_id, channel, nombre, apertura, cierre, extra=None):
+    """Crea la sala, publica su mensaje con el botón de unirse y programa el
+    recordatorio y el cierre; la usan el modal y la API local"""
     guild_id = str(guild_id)
+    cierre_h, cierre_m = map(int, cierre.split(':'))
+    # Marca de tiempo en µs; la API puede crear dos salas en el mismo segundo
     salas = get_server_salas(guild_id)
-    sala = salas.get(sala_id)
-    if not sala:
-        return
+    sala_id = str(time.time_ns() // 1000)
+    while sala_id in salas:
+        sala_id = str(int(sala_id) + 1)
+    mutar("crear_sala", guild_id, sala_id=sala_id, sala={
+        **(extra or {}),
+        "nombre": nombre,
+        "hora_apertura": apertura,
+        "hora_cierre": cierre,
+        "jugadores": [],
+        "canal_id": str(channel.id),
+        "mensaje_id": None,
+        "cierre_ts": proxima_hora(cierre_h, cierre_m).timestamp()
+    })
+    await publicar_sala(guild_id, sala_id, channel)
     
-    # Calcular tiempo hasta cierre
-    ahora = datetime.now()
-    fecha_cierre = datetime.now().replace(hour=cierre_h, minute=cierre_m, second=0, microsecond=0)
-    if fecha_cierre <= ahora:
-        fecha_cierre = fecha_cierre.replace(day=fecha_cierre.day + 1)  # Próximo día si ya pasó
+    # Programar recordatorio y cierre automático
+    programar_eventos_sala(guild_id, sala_id, get_server_salas(guild_id)[sala_id])
+    return sala_id
+
+async def publicar_sala(guild_id, sala_id, channel):
+    """Envía el mensaje de la sala con el botón de unirse y guarda su ID"""
+    sala = get_server_salas(guild_id)[sala_id]
+    # Crear embed con botón
+    embed = discord.Embed(title=f"🎮 Sala: {sala['nombre']}", color=discord.Color.green())
+    embed.description = f"⏰ Apertura: **{sala['hora_apertura']}** → Cierre: **{sala['hora_cierre']}**\n⏳ Tiempo restante: Calculando..."
+    embed.set_footer(text="Haz clic en el botón para unirte")
     
-    tiempo_restante = (fecha_cierre - ahora).total_seconds()
+    view = SalaView(sala_id, guild_id)
+    msg = await channel.send(embed=embed, view=view)
     
-    # Recordatorio 10 minutos antes
-    if tiempo_restante > 600:
-        await asyncio.sleep(tiempo_restante - 600)
+    mutar("actualizar_sala", guild_id, sala_id=sala_id, campos={"mensaje_id": str(msg.id)})
+
+# ----------------- EVENTOS PROGRAMADOS DE SALAS ----------------- #
+def proxima_hora(hora, minuto, desde=None):
+    """Próxima fecha con esa hora; sumar timedelta evita el fallo de fin de mes"""
+    ahora = desde or datetime.now()
+    fecha = ahora.replace(hour=hora, minute=minuto, second=0, microsecond=0)
+    if fecha <= ahora:
+        fecha += timedelta(days=1)  # Próximo día si ya pasó
+    return fecha
+
+def programar_eventos_sala(guild_id, sala_id, sala):
+    """Mete en el planificador el recordatorio (10 min antes), la desactivación
+    del botón y el cierre de una sala a partir de su cierre_ts persistido"""
+    guild_id = str(guild_id)
+    cierre_ts = sala.get("cierre_ts")
+    if cierre_ts is None:
+        # Salas creadas antes de guardar la hora de cierre absoluta
+        cierre_h, cierre_m = map(int, sala["hora_cierre"].split(':'))
+        cierre_ts = proxima_hora(cierre_h, cierre_m).timestamp()
+        mutar("actualizar_sala", guild_id, sala_id=sala_id, campos={"cierre_ts": cierre_ts})
+    if not sala.get("recordatorio_enviado") and cierre_ts - 600 > time.time():
+        planificador.programar(cierre_ts - 600, ("recordatorio_sala", guild_id, sala_id))
+    planificador.programar(cierre_ts, ("desactivar_sala", guild_id, sala_id), prioridad=0)
+    planificador.programar(cierre_ts, ("cerrar_sala", guild_id, sala_id), prioridad=1)
+
+def cancelar_eventos_sala(guild_id, sala_id):
+    """Quita del planificador el recordatorio, la desactivación y el cierre"""
+    for tipo in EVENTOS_PROGRAMADOS:
+        planificador.cancelar((tipo, str(guild_id), sala_id))
+
+async def recordatorio_sala(guild_id, sala_id):
+    sala = get_server_salas(guild_id).get(sala_id)
+    if not sala:
+        return
+    channel = bot.get_channel(int(sala["canal_id"]))
+    if channel:
         try:
             await channel.send(f"⏰ La sala **{sala['nombre']}** cierra en 10 minutos!")
         except:
             pass
-    
-    # Esperar a cierre
-    if tiempo_restante > 0:
-        await asyncio.sleep(tiempo_restante)
-    
-    # Cerrar sala - remover rol Jugador
+    mutar("actualizar_sala", guild_id, sala_id=sala_id, campos={"recordatorio_enviado": True})
+
+async def desactivar_sala(guild_id, sala_id):
+    sala = get_server_salas(guild_id).get(sala_id)
+    if not sala or not sala.get("mensaje_id"):
+        return
+    channel = bot.get_channel(int(sala["canal_id"]))
+    if not channel:
+        return
+    try:
+        msg = channel.get_partial_message(int(sala["mensaje_id"]))
+        boton_desactivado = discord.ui.View()
+        boton = discord.ui.Button(label="Sala cerrada ⏰", style=discord.ButtonStyle.secondary, disabled=True, custom_id="cerrado")
+        boton_desactivado.add_item(boton)
+        await msg.edit(view=boton_desactivado)
+    except:
+        pass
+
+async def cerrar_sala(guild_id, sala_id):
+    sala = get_server_salas(guild_id).get(sala_id)
+    if not sala:
+        return
+    # Quitar el rol Jugador con el motor de roles (acotado y reanudable)
     guild = bot.get_guild(int(guild_id))
-    if guild:
-        rol = discord.utils.get(guild.roles, name="Jugador")
-        if rol:
-            for user_id in sala["jugadores"]:
-                try:
-                    member = guild.get_member(int(user_id))
-                    if member:
-                        await member.remove_roles(rol)
-                except:
-                    pass
-        
-        # Desactivar botón en el mensaje
-        if sala.get("mensaje_id"):
-            try:
-                msg = await channel.fetch_message(int(sala["mensaje_id"]))
-                boton_desactivado = discord.ui.View()
-                boton = discord.ui.Button(label="Sala cerrada ⏰", style=discord.ButtonStyle.secondary, disabled=True, custom_id="cerrado")
-                boton_desactivado.add_item(boton)
-                await msg.edit(view=boton_desactivado)
-            except:
-                pass
+    rol = obtener_rol(guild, ROL_JUGADOR) if guild else None
+    if rol and sala["jugadores"]:
+        ops = [["quitar", user_id, str(rol.id)] for user_id in sala["jugadores"]]
+        motor_roles.lanzar(guild, motor_roles.crear(guild_id, "cerrar_sala", ops, None))
     
     # Eliminar sala
-    del salas[sala_id]
-    guardar_config()
+    mutar("cerrar_sala", guild_id, sala_id=sala_id)
 
-class SalaView(View):
+EVENTOS_PROGRAMADOS = {
+    "recordatorio_sala": recordatorio_sala,
+    "desactivar_sala": desactivar_sala,
+    "cerrar_sala": cerrar_sala,
+}
+
+async def ejecutar_evento(tipo, *ids):
+    await EVENTOS_PROGRAMADOS[tipo](*ids)
+
+# Un único task duerme hasta el próximo evento de todas las salas
+planificador = Planificador(ejecutar_evento)
+
+class SalaView(VistaMedida):
     def __init__(self, sala_id, guild_id):
         super().__init__(timeout=None)
         self.sala_id = sala_id
@@ -450,92 +1211,118 @@ class SalaView(View):
             await interaction.response.send_message("❌ Sala no encontrada", ephemeral=True)
             return
         
-        # Verificar horario
+        # Verificar horario con la ventana ya calculada al crear la sala
         ahora = datetime.now()
         hora_actual_minutos = ahora.hour * 60 + ahora.minute
-        apertura_h, apertura_m = map(int, sala["hora_apertura"].split(':'))
-        cierre_h, cierre_m = map(int, sala["hora_cierre"].split(':'))
-        apertura_minutos = apertura_h * 60 + apertura_m
-        cierre_minutos = cierre_h * 60 + cierre_m
+        apertura_minutos, cierre_minutos = indice_salas.ventana(self.guild_id, self.sala_id)
         
         if hora_actual_minutos < apertura_minutos or hora_actual_minutos > cierre_minutos:
             await interaction.response.send_message("❌ La sala está cerrada en este horario ⏰", ephemeral=True)
             return
         
-        # Asignar rol
-        rol = discord.utils.get(interaction.guild.roles, name="Jugador")
-        if not rol:
-            rol = await interaction.guild.create_role(name="Jugador")
-        
-        member = interaction.user
-        if member:
-            await member.add_roles(rol)
-        
-        if str(member.id) not in sala["jugadores"]:
-            sala["jugadores"].append(str(member.id))
-            guardar_config()
+        user_id = str(interaction.user.id)
+        if user_id not in indice_salas.jugadores(self.guild_id, self.sala_id):
+            mutar("unirse_sala", self.guild_id, sala_id=self.sala_id, user_id=user_id)
         
+        # Se responde antes de tocar roles; la asignación va por la cola
         await interaction.response.send_message(f"✅ Te uniste a la sala **{sala['nombre']}** 🎮", ephemeral=True)
+        await cola_roles.agregar(self.guild_id, user_id, ROL_JUGADOR)
 
 # ===== NOTIFICACIONES DE SALAS (FREE FIRE) ===== #
-class SalasNotificacionesView(View):
+class SalasNotificacionesView(VistaMedida):
     def __init__(self, guild_id):
         super().__init__(timeout=None)
         self.guild_id = str(guild_id)
     
-    @discord.ui.button(label="Quiero jugar hoy", style=discord.ButtonStyle.green, emoji="🔥", custom_id="quiero_jugar")
-    async def quiero_jugar(self, interaction: discord.Interaction, button: discord.ui.Button):
-        config = readConfig()
-        if not config.get("notificaciones_salas"):
-            config["notificaciones_salas"] = {}
-        if not config["notificaciones_salas"].get(self.guild_id):
-            config["notificaciones_salas"][self.guild_id] = {"jugadores_listos": []}
-        
-        settings = config["notificaciones_salas"][self.guild_id]
-        jugador_data = {
-            "user_id": str(interaction.user.id),
-            "nombre": interaction.user.name,
-            "estado": "confirmado",
+    def anotar(self, user, estado_jugador):
+        """Anota al usuario si aún no está en el roster; devuelve False si ya estaba"""
+        user_id = str(user.id)
+        if user_id in indice_notificaciones.roster(self.guild_id):
+            return False
+        entrada = {
+            "user_id": user_id,
+            "nombre": user.name,
+            "estado": estado_jugador,
             "fecha": datetime.now().isoformat()
         }
-        
-        # Evitar duplicados
-        jugadores_actuales = settings.get("jugadores_listos", [])
-        if not any(j["user_id"] == str(interaction.user.id) for j in jugadores_actuales):
-            jugadores_actuales.append(jugador_data)
-            settings["jugadores_listos"] = jugadores_actuales
-            writeConfig(config)
-        
+        mutar("anotar_notificacion", self.guild_id, user_id=user_id, entrada=entrada)
+        return True
+    
+    @discord.ui.button(label="Quiero jugar hoy", style=discord.ButtonStyle.green, emoji="🔥", custom_id="quiero_jugar")
+    async def quiero_jugar(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.anotar(interaction.user, "confirmado")
         await interaction.response.send_message(f"✅ {interaction.user.mention} ¡Estás anotado para hoy! 🔥", ephemeral=True)
     
     @discord.ui.button(label="Notificarme", style=discord.ButtonStyle.blurple, emoji="🔔", custom_id="notificarme")
     async def notificarme(self, interaction: discord.Interaction, button: discord.ui.Button):
-        config = readConfig()
-        if not config.get("notificaciones_salas"):
-            config["notificaciones_salas"] = {}
-        if not config["notificaciones_salas"].get(self.guild_id):
-            config["notificaciones_salas"][self.guild_id] = {"jugadores_listos": []}
-        
-        settings = config["notificaciones_salas"][self.guild_id]
-        jugador_data = {
-            "user_id": str(interaction.user.id),
-            "nombre": interaction.user.name,
-            "estado": "notificado",
-            "fecha": datetime.now().isoformat()
-        }
-        
-        jugadores_actuales = settings.get("jugadores_listos", [])
-        if not any(j["user_id"] == str(interaction.user.id) for j in jugadores_actuales):
-            jugadores_actuales.append(jugador_data)
-            settings["jugadores_listos"] = jugadores_actuales
-            writeConfig(config)
-        
+        self.anotar(interaction.user, "notificado")
         await interaction.response.send_message(f"✅ {interaction.user.mention} ¡Te notificaremos cuando sea! 🔔", ephemeral=True)
     
     @discord.ui.button(label="Scrim Ready", style=discord.ButtonStyle.red, emoji="⚔️", custom_id="scrim_ready")
     async def scrim_ready(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.send_message(f"⚔️ {interaction.user.mention} está listo para SCRIM!", ephemeral=False)
 
+# ----------------- NOMBRES DE USUARIO ----------------- #
+class CacheNombres:
+    """Resuelve user_id -> nombre sin una llamada REST por participante.
+
+    Orden: caché de miembros del guild, LRU con TTL y, como último recurso,
+    fetch_user en paralelo con un límite de peticiones simultáneas."""
+
+    def __init__(self, capacidad=5000, ttl=3600, concurrencia=5):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self._lru = OrderedDict()  # {user_id: (nombre, expira)}
+        self._semaforo = asyncio.Semaphore(concurrencia)
+
+    def guardar(self, user_id, nombre):
+        user_id = str(user_id)
+        self._lru[user_id] = (nombre, time.monotonic() + self.ttl)
+        self._lru.move_to_end(user_id)
+        while len(self._lru) > self.capacidad:
+            self._lru.popitem(last=False)
+
+    def _en_cache(self, user_id):
+        entrada = self._lru.get(user_id)
+        if not entrada:
+            return None
+        nombre, expira = entrada
+        if expira < time.monotonic():
+            del self._lru[user_id]
+            return None
+        self._lru.move_to_end(user_id)
+        return nombre
+
+    async def _buscar(self, user_id):
+        async with self._semaforo:
+            try:
+                user = await bot.fetch_user(int(user_id))
+            except:
+                return user_id, f"ID:{user_id}"
+        self.guardar(user_id, user.name)
+        return user_id, user.name
+
+    async def resolver(self, guild, user_ids):
+        nombres = {}
+        faltan = []
+        for user_id in user_ids:
+            member = guild.get_member(int(user_id)) if guild and user_id.isdigit() else None
+            if member:
+                nombres[user_id] = member.name
+                continue
+            nombre = self._en_cache(user_id)
+            if nombre is not None:
+                nombres[user_id] = nombre
+            elif user_id.isdigit():
+                faltan.append(user_id)
+            else:
+                nombres[user_id] = f"ID:{user_id}"
+        if faltan:
+            nombres.update(await asyncio.gather(*(self._buscar(uid) for uid in faltan)))
+        return nombres
+
+cache_nombres = CacheNombres()
+
 # ----------------- DASHBOARD ----------------- #
 async def generar_embed(guild_id):
     embed = discord.Embed(title="📊 Dashboard de Torneos Interactivo", color=discord.Color.blue())
@@ -549,22 +1336,18 @@ async def generar_embed(guild_id):
     
     if torneo_seleccionado and torneo_seleccionado in torneos:
         torneo = torneo_seleccionado
-        participantes = torneos[torneo]
         texto = ""
-        equipos_dict = {}
-        for uid, equipo in participantes.items():
-            if equipo not in equipos_dict:
-                equipos_dict[equipo] = []
-            try:
-                user = await bot.fetch_user(int(uid))
-                equipos_dict[equipo].append(user.name)
-            except:
-                equipos_dict[equipo].append(f"ID:{uid}")
-        
-        for equipo, miembros in sorted(equipos_dict.items()):
+        guild = bot.get_guild(int(guild_id))
+        equipos_dict = indice_equipos.equipos(guild_id, torneo)
+        # Orden de aparición de los equipos; copia porque hay awaits en el bucle
+        for equipo, miembros in list(equipos_dict.items()):
+            # El campo se corta en 1024 caracteres: no hace falta resolver más nombres
+            if len(texto) >= 1024:
+                break
+            nombres = await cache_nombres.resolver(guild, list(miembros))
             texto += f"**{equipo}** ({len(miembros)})\n"
-            for miembro in miembros:
-                texto += f"  • {miembro}\n"
+            for uid in miembros:
+                texto += f"  • {nombres[uid]}\n"
         
         if not texto:
             texto = "No hay participantes aún. ¡Únete usando el botón!"
@@ -576,16 +1359,55 @@ async def generar_embed(guild_id):
         embed.add_field(name="Torneos Activos", value=texto_torneos or "Ninguno", inline=False)
     
     if ranking:
-        sorted_ranking = sorted(ranking.items(), key=lambda x: x[1], reverse=True)
-        texto_ranking = ""
-        for idx, (eq, pts) in enumerate(sorted_ranking[:10], 1):
-            emoji = "🥇" if idx == 1 else "🥈" if idx == 2 else "🥉" if idx == 3 else f"{idx}."
-            texto_ranking += f"{emoji} **{eq}**: {pts} victoria{'s' if pts != 1 else ''}\n"
+        texto_ranking = texto_ranking_entradas(ranking_ordenado.top(10))
         embed.add_field(name="🏆 Ranking General (Top 10)", value=texto_ranking, inline=False)
     
     embed.set_footer(text="Usa los botones y el menú para interactuar con los torneos")
     return embed
 
+class RefrescoDashboard:
+    """Agrupa las peticiones de refresco de cada guild: como mucho una edición
+    del dashboard por ventana, ejecutada fuera del handler de la interacción"""
+
+    def __init__(self, ventana):
+        self.ventana = ventana
+        self._tareas = {}  # {guild_id: task}
+        self._sucios = set()
+        self._ultimo = {}  # {guild_id: instante de la última edición}
+
+    def solicitar(self, guild):
+        if guild is None:
+            return
+        self._sucios.add(guild.id)
+        if guild.id not in self._tareas:
+            self._tareas[guild.id] = asyncio.create_task(self._ejecutar(guild))
+
+    async def _ejecutar(self, guild):
+        try:
+            while guild.id in self._sucios:
+                espera = self._ultimo.get(guild.id, 0) + self.ventana - time.monotonic()
+                if espera > 0:
+                    await asyncio.sleep(espera)
+                # Lo que llegue durante la edición provoca una vuelta más
+                self._sucios.discard(guild.id)
+                try:
+                    await actualizar_dashboard(guild)
+                except Exception as e:
+                    print(f"❌ Error al actualizar dashboard de {guild.id}: {e}")
+                self._ultimo[guild.id] = time.monotonic()
+        finally:
+            del self._tareas[guild.id]
+
+# Segundos mínimos entre dos ediciones del dashboard de un mismo guild
+DASHBOARD_VENTANA = float(os.getenv("DASHBOARD_VENTANA", "2"))
+
+refresco_dashboard = RefrescoDashboard(DASHBOARD_VENTANA)
+mensajes_dashboard = {}  # {guild_id: discord.Message}
+
+def programar_dashboard(guild):
+    m_dashboard.inc("solicitado")
+    refresco_dashboard.solicitar(guild)
+
 async def actualizar_dashboard(guild, channel=None):
     config = get_server_config(guild.id)
     
@@ -597,31 +1419,34 @@ async def actualizar_dashboard(guild, channel=None):
         if not channel:
             return
     
+    m_dashboard.inc("ejecutado")
     embed = await generar_embed(guild.id)
     view = DashboardViewUser(guild.id)
     message_id = config.get("message_id")
     
     if message_id:
+        # Se reutiliza el mensaje en caché (o uno parcial) en lugar de fetch_message
+        msg = mensajes_dashboard.get(guild.id)
+        if msg is None or msg.id != int(message_id) or msg.channel.id != channel.id:
+            msg = channel.get_partial_message(int(message_id))
         try:
-            msg = await channel.fetch_message(int(message_id))
-            await msg.edit(embed=embed, view=view)
+            mensajes_dashboard[guild.id] = await msg.edit(embed=embed, view=view)
             return
         except:
-            config["message_id"] = None
-            guardar_config()
+            mensajes_dashboard.pop(guild.id, None)
+            mutar("config", guild.id, campos={"message_id": None})
     
     try:
         msg = await channel.send(embed=embed, view=view)
-        config["message_id"] = str(msg.id)
-        config["channel_id"] = str(channel.id)
-        guardar_config()
+        mensajes_dashboard[guild.id] = msg
+        mutar("config", guild.id, campos={"message_id": str(msg.id), "channel_id": str(channel.id)})
     except discord.Forbidden:
         pass
     except Exception as e:
         pass
 
 # ----------------- SELECT Y VIEW ----------------- #
-class DashboardViewUser(View):
+class DashboardViewUser(VistaMedida):
     """Dashboard simplificado para usuarios normales"""
     def __init__(self, guild_id):
         super().__init__(timeout=None)
@@ -650,10 +1475,8 @@ class DashboardViewUser(View):
             if not selected_value or selected_value == "Sin torneos":
                 await interaction.response.send_message("❌ No hay torneos disponibles.", ephemeral=True)
                 return
-            config = get_server_config(self.guild_id)
-            config["torneo_seleccionado"] = selected_value
-            guardar_config()
-            await actualizar_dashboard(interaction.guild)
+            mutar("config", self.guild_id, campos={"torneo_seleccionado": selected_value})
+            programar_dashboard(interaction.guild)
             await interaction.response.send_message(f"✅ Torneo seleccionado: **{selected_value}**", ephemeral=True)
         except Exception as e:
             await interaction.response.send_message(f"❌ Error: {str(e)}", ephemeral=True)
@@ -680,11 +1503,11 @@ class DashboardViewUser(View):
 
     @discord.ui.button(label="Actualizar", style=discord.ButtonStyle.gray, emoji="🔃", custom_id="btn_actualizar")
     async def actualizar_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await actualizar_dashboard(interaction.guild)
+        programar_dashboard(interaction.guild)
         await interaction.response.send_message("✅ Dashboard actualizado", ephemeral=True)
 
 
-class DashboardViewAdmin(View):
+class DashboardViewAdmin(VistaMedida):
     """Dashboard completo para administradores - incluye todos los botones"""
     def __init__(self, guild_id):
         super().__init__(timeout=None)
@@ -713,10 +1536,8 @@ class DashboardViewAdmin(View):
             if not selected_value or selected_value == "Sin torneos":
                 await interaction.response.send_message("❌ No hay torneos disponibles.", ephemeral=True)
                 return
-            config = get_server_config(self.guild_id)
-            config["torneo_seleccionado"] = selected_value
-            guardar_config()
-            await actualizar_dashboard(interaction.guild)
+            mutar("config", self.guild_id, campos={"torneo_seleccionado": selected_value})
+            programar_dashboard(interaction.guild)
             await interaction.response.send_message(f"✅ Torneo seleccionado: **{selected_value}**", ephemeral=True)
         except Exception as e:
             await interaction.response.send_message(f"❌ Error: {str(e)}", ephemeral=True)
@@ -743,7 +1564,7 @@ class DashboardViewAdmin(View):
 
     @discord.ui.button(label="Actualizar", style=discord.ButtonStyle.gray, emoji="🔃", custom_id="btn_actualizar_admin")
     async def actualizar_btn_admin(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await actualizar_dashboard(interaction.guild)
+        programar_dashboard(interaction.guild)
         await interaction.response.send_message("✅ Dashboard actualizado", ephemeral=True)
 
     @discord.ui.button(label="Crear Torneo", style=discord.ButtonStyle.green, emoji="🏆", row=2, custom_id="btn_crear")
@@ -823,23 +1644,59 @@ async def dashboard_cmd(interaction: discord.Interaction):
     await actualizar_dashboard(interaction.guild, interaction.channel)
     await interaction.followup.send("✅ Dashboard creado! Los botones funcionarán incluso después de reiniciar el bot.", ephemeral=True)
 
+RANKING_POR_PAGINA = 15
+
+def texto_ranking_entradas(entradas):
+    texto = ""
+    for idx, equipo, victorias in entradas:
+        emoji = "🥇" if idx == 1 else "🥈" if idx == 2 else "🥉" if idx == 3 else f"{idx}."
+        texto += f"{emoji} **{equipo}**: {victorias} victoria{'s' if victorias != 1 else ''}\n"
+    return texto
+
+def embed_ranking(pagina):
+    total_paginas = max(1, -(-len(ranking_ordenado) // RANKING_POR_PAGINA))
+    pagina = min(max(pagina, 0), total_paginas - 1)
+    embed = discord.Embed(title="🏆 Ranking General de Equipos", color=discord.Color.gold())
+    # Solo se renderiza el tramo pedido del ranking ya ordenado
+    embed.description = texto_ranking_entradas(ranking_ordenado.pagina(pagina * RANKING_POR_PAGINA, RANKING_POR_PAGINA))
+    embed.set_footer(text=f"Total de {len(ranking)} equipos registrados • Página {pagina + 1}/{total_paginas}")
+    return embed, pagina, total_paginas
+
+class RankingView(VistaMedida):
+    def __init__(self, pagina=0):
+        super().__init__(timeout=300)
+        self.pagina = pagina
+        self._actualizar_botones()
+
+    def _actualizar_botones(self):
+        total_paginas = max(1, -(-len(ranking_ordenado) // RANKING_POR_PAGINA))
+        self.anterior_btn.disabled = self.pagina <= 0
+        self.siguiente_btn.disabled = self.pagina >= total_paginas - 1
+
+    async def _mostrar(self, interaction, pagina):
+        embed, self.pagina, _ = embed_ranking(pagina)
+        self._actualizar_botones()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="Anterior", style=discord.ButtonStyle.gray, emoji="◀️")
+    async def anterior_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._mostrar(interaction, self.pagina - 1)
+
+    @discord.ui.button(label="Siguiente", style=discord.ButtonStyle.gray, emoji="▶️")
+    async def siguiente_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._mostrar(interaction, self.pagina + 1)
+
 @bot.tree.command(name="ranking", description="Ver el ranking general de equipos")
 async def ranking_cmd(interaction: discord.Interaction):
     if not ranking:
         await interaction.response.send_message("📊 No hay datos de ranking aún.", ephemeral=True)
         return
     
-    sorted_ranking = sorted(ranking.items(), key=lambda x: x[1], reverse=True)
-    embed = discord.Embed(title="🏆 Ranking General de Equipos", color=discord.Color.gold())
-    
-    texto = ""
-    for idx, (equipo, victorias) in enumerate(sorted_ranking[:15], 1):
-        emoji = "🥇" if idx == 1 else "🥈" if idx == 2 else "🥉" if idx == 3 else f"{idx}."
-        texto += f"{emoji} **{equipo}**: {victorias} victoria{'s' if victorias != 1 else ''}\n"
-    
-    embed.description = texto
-    embed.set_footer(text=f"Total de {len(ranking)} equipos registrados")
-    await interaction.response.send_message(embed=embed)
+    embed, _, total_paginas = embed_ranking(0)
+    if total_paginas > 1:
+        await interaction.response.send_message(embed=embed, view=RankingView())
+    else:
+        await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="salas", description="Ver salas activas")
 async def salas_cmd(interaction: discord.Interaction):
@@ -881,27 +1738,16 @@ async def sala_cmd(interaction: discord.Interaction, accion: str):
         embed.add_field(name="⚔️ Scrim Ready", value="Anuncia que estás listo para un scrim", inline=False)
         
         view = SalasNotificacionesView(interaction.guild_id)
-        config = readConfig()
-        if not config.get("notificaciones_salas"):
-            config["notificaciones_salas"] = {}
-        if not config["notificaciones_salas"].get(str(interaction.guild_id)):
-            config["notificaciones_salas"][str(interaction.guild_id)] = {"jugadores_listos": []}
-        config["notificaciones_salas"][str(interaction.guild_id)]["mensaje_id"] = ""
-        writeConfig(config)
-        
         msg = await interaction.channel.send(embed=embed, view=view)
-        config["notificaciones_salas"][str(interaction.guild_id)]["mensaje_id"] = str(msg.id)
-        config["notificaciones_salas"][str(interaction.guild_id)]["canal_id"] = str(interaction.channel.id)
-        writeConfig(config)
+        mutar("panel_notificaciones", interaction.guild_id, campos={"mensaje_id": str(msg.id), "canal_id": str(interaction.channel.id)})
         
         await interaction.response.send_message(f"✅ Sala de notificaciones abierta!", ephemeral=True)
     
     elif accion.lower() == "cerrar":
-        config = readConfig()
-        if config.get("notificaciones_salas") and config["notificaciones_salas"].get(str(interaction.guild_id)):
-            config["notificaciones_salas"][str(interaction.guild_id)]["jugadores_listos"] = []
-        writeConfig(config)
-        await interaction.response.send_message(f"✅ Sala de notificaciones cerrada y lista limpiada!", ephemeral=True)
+        confirmados = len(indice_notificaciones.por_estado(interaction.guild_id, "confirmado"))
+        notificados = len(indice_notificaciones.por_estado(interaction.guild_id, "notificado"))
+        mutar("limpiar_notificaciones", interaction.guild_id)
+        await interaction.response.send_message(f"✅ Sala de notificaciones cerrada y lista limpiada! ({confirmados} confirmados, {notificados} por notificar)", ephemeral=True)
     
     else:
         await interaction.response.send_message("❌ Usa: `/sala abrir` o `/sala cerrar`", ephemeral=True)
@@ -939,12 +1785,27 @@ async def panel_cmd(interaction: discord.Interaction):
     embed.set_footer(text="Usa los botones abajo para gestionar todo")
     
     view = DashboardViewAdmin(interaction.guild_id)
-    config = get_server_config(interaction.guild_id)
-    config["channel_id"] = str(interaction.channel.id)
-    guardar_config()
+    mutar("config", interaction.guild_id, campos={"channel_id": str(interaction.channel.id)})
     
     await interaction.response.send_message(embed=embed, view=view)
 
+@bot.tree.command(name="perfilar", description="Perfilar las próximas interacciones (solo administradores)")
+@discord.app_commands.describe(cantidad="Número de interacciones a perfilar")
+async def perfilar_cmd(interaction: discord.Interaction, cantidad: int = 20):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ Solo administradores pueden perfilar.", ephemeral=True)
+        return
+    guild_id = interaction.guild_id
+
+    async def al_terminar(ruta):
+        await logear(f"🔬 Perfil de {cantidad} interacciones guardado en `{ruta}`", guild_id)
+
+    # +1 porque esta misma interacción también cuenta al terminar
+    if not perfilador.activar(max(1, cantidad) + 1, al_terminar):
+        await interaction.response.send_message("⏳ Ya hay un perfil en curso.", ephemeral=True)
+        return
+    await interaction.response.send_message(f"🔬 Perfilando las próximas {cantidad} interacciones...", ephemeral=True)
+
 # ----------------- COMANDOS DE UTILIDAD (PREFIX) ----------------- #
 @bot.command()
 async def ayuda(ctx):
@@ -1018,64 +1879,480 @@ async def equipo(ctx, jugadores: int = None):
         msg += f"**Equipo {i}:** " + ", ".join([m.name for m in team]) + "\n"
     await ctx.send(msg)
 
+# ----------------- CANALES DE ENTRENAMIENTO ----------------- #
+# Límite de canales de entrenamiento (libres + en uso) por servidor
+ENTRENO_POOL_MAX = int(os.getenv("ENTRENO_POOL_MAX", "10"))
+
+class PoolEntreno:
+    """Canales de entrenamiento ocultos que se reutilizan entre sesiones.
+
+    Arrendar un canal solo reescribe sus permisos (una llamada) en lugar de
+    crearlo y borrarlo. El estado vive en config["entreno"] =
+    {"libres": [canal_id], "ocupados": {canal_id: {...expira...}}}, y la
+    devolución es un evento del planificador, así que sobrevive a reinicios.
+    El tamaño se ajusta al pico de canales en uso de la última hora."""
+
+    VENTANA_DEMANDA = 3600
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self._demanda = {}  # {guild_id: deque[(instante, en_uso)]}
+        self._reponiendo = set()
+
+    def _datos(self, guild_id):
+        datos = get_server_config(guild_id).get("entreno") or {}
+        return {"libres": list(datos.get("libres", [])), "ocupados": dict(datos.get("ocupados", {}))}
+
+    def _guardar(self, guild_id, datos):
+        mutar("config", guild_id, campos={"entreno": datos})
+
+    def _overwrites(self, guild, usuario=None):
+        overwrites = {
+            guild.default_role: discord.PermissionOverwrite(read_messages=False),
+            guild.me: discord.PermissionOverwrite(read_messages=True)
+        }
+        if usuario:
+            overwrites[usuario] = discord.PermissionOverwrite(read_messages=True)
+        return overwrites
+
+    def _registrar_demanda(self, guild_id, en_uso):
+        ahora = time.monotonic()
+        historial = self._demanda.setdefault(guild_id, deque())
+        historial.append((ahora, en_uso))
+        while historial and historial[0][0] < ahora - self.VENTANA_DEMANDA:
+            historial.popleft()
+
+    def objetivo(self, guild_id):
+        """Canales a mantener: pico reciente en uso más uno de reserva"""
+        pico = max((n for _, n in self._demanda.get(guild_id, ())), default=0)
+        return min(self.maximo, pico + 1)
+
+    async def _crear(self, guild):
+        datos = self._datos(str(guild.id))
+        numero = len(datos["libres"]) + len(datos["ocupados"]) + 1
+        return await guild.create_text_channel(f"entreno-{numero}", overwrites=self._overwrites(guild))
+
+    async def reponer(self, guild):
+        """Crea en segundo plano los canales libres que falten hasta el objetivo"""
+        guild_id = str(guild.id)
+        if guild_id in self._reponiendo:
+            return
+        self._reponiendo.add(guild_id)
+        try:
+            while True:
+                datos = self._datos(guild_id)
+                if len(datos["libres"]) + len(datos["ocupados"]) >= self.objetivo(guild_id):
+                    break
+                canal = await self._crear(guild)
+                datos = self._datos(guild_id)
+                datos["libres"].append(str(canal.id))
+                self._guardar(guild_id, datos)
+        except Exception as e:
+            print(f"❌ Error al reponer canales de entrenamiento en {guild_id}: {e}")
+        finally:
+            self._reponiendo.discard(guild_id)
+
+    async def arrendar(self, guild, usuario, minutos, aviso_canal_id):
+        guild_id = str(guild.id)
+        datos = self._datos(guild_id)
+        canal = None
+        while datos["libres"] and canal is None:
+            canal = guild.get_channel(int(datos["libres"].pop(0)))
+        if canal is None:
+            # Pool vacío: se crea uno en el momento (el camino lento)
+            canal = await self._crear(guild)
+            datos = self._datos(guild_id)
+            if str(canal.id) in datos["libres"]:
+                datos["libres"].remove(str(canal.id))
+        expira = time.time() + minutos * 60
+        datos["ocupados"][str(canal.id)] = {
+            "user_id": str(usuario.id),
+            "expira": expira,
+            "minutos": minutos,
+            "aviso_canal_id": str(aviso_canal_id)
+        }
+        self._guardar(guild_id, datos)
+        planificador.programar(expira, ("liberar_entreno", guild_id, str(canal.id)))
+        await canal.edit(overwrites=self._overwrites(guild, usuario))
+        self._registrar_demanda(guild_id, len(datos["ocupados"]))
+        asyncio.create_task(self.reponer(guild))
+        return canal
+
+    async def liberar(self, guild_id, canal_id):
+        guild = bot.get_guild(int(guild_id))
+        datos = self._datos(guild_id)
+        arriendo = datos["ocupados"].pop(canal_id, None)
+        if not guild or arriendo is None:
+            return
+        canal = guild.get_channel(int(canal_id))
+        self._registrar_demanda(guild_id, len(datos["ocupados"]))
+        if canal:
+            try:
+                if len(datos["libres"]) + len(datos["ocupados"]) >= self.objetivo(guild_id):
+                    # Sobra capacidad: el pool se encoge
+                    await canal.delete()
+                else:
+                    await canal.edit(overwrites=self._overwrites(guild))
+                    await canal.purge(limit=None)
+                    datos["libres"].append(canal_id)
+            except Exception as e:
+                print(f"❌ Error al devolver el canal {canal_id}: {e}")
+        self._guardar(guild_id, datos)
+        aviso = bot.get_channel(int(arriendo["aviso_canal_id"]))
+        if aviso:
+            try:
+                await aviso.send(f"⏳ Canal de entrenamiento eliminado después de {arriendo['minutos']} minutos.")
+            except:
+                pass
+
+    def reanudar(self, guild):
+        guild_id = str(guild.id)
+        for canal_id, arriendo in self._datos(guild_id)["ocupados"].items():
+            planificador.programar(arriendo["expira"], ("liberar_entreno", guild_id, canal_id))
+
+pool_entreno = PoolEntreno(ENTRENO_POOL_MAX)
+EVENTOS_PROGRAMADOS["liberar_entreno"] = pool_entreno.liberar
+
 @bot.command()
 async def entrenar(ctx, mapa=None, tiempo: int = 30):
     if mapa:
-        overwrites = {
-            ctx.guild.default_role: discord.PermissionOverwrite(read_messages=False),
-            ctx.author: discord.PermissionOverwrite(read_messages=True)
-        }
-        canal = await ctx.guild.create_text_channel(f"entreno-{mapa}", overwrites=overwrites)
+        canal = await pool_entreno.arrendar(ctx.guild, ctx.author, tiempo, ctx.channel.id)
+        await canal.send(f"🗺️ Mapa: **{mapa}** — {ctx.author.mention}, el canal es tuyo durante {tiempo} minutos.")
         await ctx.send(f"✅ Canal de entrenamiento **{canal.name}** creado por {tiempo} minutos.")
-        await asyncio.sleep(tiempo * 60)
-        await canal.delete()
-        await ctx.send(f"⏳ Canal de entrenamiento eliminado después de {tiempo} minutos.")
     else:
         await ctx.send("Usa: `/entrenar [mapa] [tiempo_en_minutos]`")
 
+# ----------------- RECARGA EN CALIENTE ----------------- #
+# Las ediciones de config.json hechas fuera del bot (a mano, scripts, versiones
+# antiguas del panel) se aplican sin reiniciar y el siguiente volcado ya no
+# las pisa. "0" lo desactiva; RECARGA_INTERVALO es el sondeo si no hay inotify
+RECARGA_CONFIG = os.getenv("RECARGA_CONFIG", "1") != "0"
+RECARGA_INTERVALO = float(os.getenv("RECARGA_INTERVALO", "2"))
+
+async def preparar_sala_externa(guild_id, sala_id):
+    """Botón y eventos programados de una sala que apareció en el archivo"""
+    sala = server_salas[guild_id][sala_id]
+    try:
+        if sala.get("mensaje_id"):
+            bot.add_view(SalaView(sala_id, guild_id), message_id=int(sala["mensaje_id"]))
+        else:
+            channel = bot.get_channel(int(sala["canal_id"])) if str(sala.get("canal_id") or "").isdigit() else None
+            if channel is None:
+                print(f"⚠️ Sala {sala_id} añadida sin canal válido; no se publica su mensaje")
+            else:
+                await publicar_sala(guild_id, sala_id, channel)
+        programar_eventos_sala(guild_id, sala_id, sala)
+    except Exception as e:
+        print(f"❌ No se pudo preparar la sala {sala_id}: {e}")
+
+async def aplicar_externo(registro):
+    """Como mutar() con el registro ya armado, más lo que ese cambio implica
+    en Discord (mensajes, vistas persistentes y eventos programados)"""
+    guild_id, op = registro["guild"], registro["op"]
+    sala_id = registro.get("sala_id")
+    if op == "cerrar_sala":
+        await desactivar_sala(guild_id, sala_id)
+        cancelar_eventos_sala(guild_id, sala_id)
+    _aplicar(registro)
+    diario.registrar(registro)
+    if op == "crear_sala":
+        await preparar_sala_externa(guild_id, sala_id)
+    elif op == "actualizar_sala" and server_salas.get(guild_id, {}).get(sala_id) is not None:
+        campos = registro["campos"]
+        if "hora_cierre" in campos or "cierre_ts" in campos:
+            if "cierre_ts" not in campos:
+                # programar_eventos_sala recalcula el cierre a partir de la hora
+                mutar("actualizar_sala", guild_id, sala_id=sala_id, campos={"cierre_ts": None})
+            planificador.cancelar(("recordatorio_sala", guild_id, sala_id))
+            programar_eventos_sala(guild_id, sala_id, server_salas[guild_id][sala_id])
+        if campos.get("mensaje_id"):
+            bot.add_view(SalaView(sala_id, guild_id), message_id=int(campos["mensaje_id"]))
+    elif op == "config" and registro["campos"].get("message_id"):
+        config = server_configs[guild_id]
+        if config.get("channel_id"):
+            bot.add_view(DashboardViewUser(guild_id), message_id=int(config["message_id"]))
+    elif op == "panel_notificaciones" and registro["campos"].get("mensaje_id"):
+        bot.add_view(SalasNotificacionesView(guild_id), message_id=int(registro["campos"]["mensaje_id"]))
+
+async def recargar_config():
+    """Aplica lo editado por fuera en config.json, solo en los guilds que cambiaron"""
+    try:
+        cambios = await almacen.cambios_externos()
+    except ValueError as e:
+        print(f"⚠️ config.json no es JSON válido ({e}); se espera al siguiente cambio")
+        return
+    if not cambios:
+        return
+    total, servidores = 0, 0
+    for guild_id, secciones in cambios.items():
+        actual = {seccion: estado[seccion].get(guild_id) for seccion in secciones}
+        # Con cambios propios sin volcar, lo que falta en el archivo puede ser nuevo
+        registros = mutaciones_diferencia(guild_id, actual, secciones, solo_altas=almacen.guild_pendiente(guild_id))
+        for registro in registros:
+            await aplicar_externo(registro)
+        if not registros:
+            continue  # solo cambió el formato (p. ej. JSON con sangría)
+        total += len(registros)
+        servidores += 1
+        guild = bot.get_guild(int(guild_id))
+        if guild:
+            programar_dashboard(guild)
+    if total:
+        print(f"🔄 config.json editado por fuera: {total} cambios en {servidores} servidores")
+
+vigilante_config = VigilanteArchivo(CONFIG_FILE, recargar_config, RECARGA_INTERVALO)
+
+# ----------------- RUTAS DE LA API LOCAL ----------------- #
+# Lecturas directas de la memoria; las escrituras siguen el mismo camino que
+# los botones y comandos de Discord (mutar + mensajes + eventos programados)
+CAMPOS_SALA_PANEL = ("max_players", "rol_id", "mensaje_personalizado", "descripcion")
+CAMPOS_NOTIFICACIONES_PANEL = ("notifications_enabled", "notification_role", "send_dm",
+                               "custom_message", "room_name", "room_schedule")
+
+def _guild_api(params):
+    guild_id = params["guild"]
+    if not guild_id.isdigit():
+        raise ErrorApi(400, "ID de servidor inválido")
+    # Con varios procesos cada uno solo escribe sus guilds en el almacén compartido
+    if not es_de_este_proceso(guild_id):
+        raise ErrorApi(421, f"El servidor {guild_id} está en el shard {shard_de(guild_id)}, que atiende otro proceso")
+    almacen.asegurar_guild(guild_id)
+    return guild_id
+
+def _version_guild(params):
+    return params["guild"]
+
+def _hora_valida(texto):
+    try:
+        h, m = map(int, str(texto).split(':'))
+    except ValueError:
+        return False
+    return 0 <= h < 24 and 0 <= m < 60
+
+@api_local.ruta("GET", "/api/guilds/{guild}/torneos", _version_guild)
+def api_torneos(params, consulta, datos):
+    return server_torneos.get(_guild_api(params), {})
+
+@api_local.ruta("GET", "/api/guilds/{guild}/salas", _version_guild)
+def api_salas(params, consulta, datos):
+    return server_salas.get(_guild_api(params), {})
+
+@api_local.ruta("POST", "/api/guilds/{guild}/salas")
+async def api_crear_sala(params, consulta, datos):
+    guild_id = _guild_api(params)
+    nombre = str(datos.get("nombre") or "").strip()
+    apertura, cierre = datos.get("hora_apertura"), datos.get("hora_cierre")
+    if not nombre or not _hora_valida(apertura) or not _hora_valida(cierre):
+        raise ErrorApi(400, "Faltan nombre u horas válidas (HH:MM)")
+    channel = bot.get_channel(int(datos["canal_id"])) if str(datos.get("canal_id") or "").isdigit() else None
+    if channel is None or str(getattr(channel.guild, "id", "")) != guild_id:
+        raise ErrorApi(404, "Canal no encontrado en este servidor")
+    extra = {k: datos[k] for k in CAMPOS_SALA_PANEL if k in datos}
+    sala_id = await abrir_sala(guild_id, channel, nombre, apertura, cierre, extra)
+    await logear(f"🎮 Sala {nombre} creada desde el panel web", guild_id)
+    return {"sala_id": sala_id}
+
+@api_local.ruta("DELETE", "/api/guilds/{guild}/salas/{sala}")
+async def api_cerrar_sala(params, consulta, datos):
+    guild_id = _guild_api(params)
+    sala = server_salas.get(guild_id, {}).get(params["sala"])
+    if sala is None:
+        raise ErrorApi(404, "Sala no encontrada")
+    await desactivar_sala(guild_id, params["sala"])
+    await cerrar_sala(guild_id, params["sala"])
+    cancelar_eventos_sala(guild_id, params["sala"])
+    await logear(f"🎮 Sala {sala['nombre']} cerrada desde el panel web", guild_id)
+
+@api_local.ruta("GET", "/api/guilds/{guild}/notificaciones", _version_guild)
+def api_notificaciones(params, consulta, datos):
+    guild_id = _guild_api(params)
+    settings = (server_configs.get(guild_id) or {}).get("notificaciones_salas") or {}
+    return {
+        **settings,
+        "confirmados": len(indice_notificaciones.por_estado(guild_id, "confirmado")),
+        "notificados": len(indice_notificaciones.por_estado(guild_id, "notificado")),
+    }
+
+@api_local.ruta("POST", "/api/guilds/{guild}/notificaciones")
+def api_configurar_notificaciones(params, consulta, datos):
+    guild_id = _guild_api(params)
+    campos = {k: datos[k] for k in CAMPOS_NOTIFICACIONES_PANEL if k in datos}
+    if not campos:
+        raise ErrorApi(400, "Sin campos que actualizar")
+    mutar("panel_notificaciones", guild_id, campos=campos)
+
+@api_local.ruta("DELETE", "/api/guilds/{guild}/notificaciones/jugadores/{usuario}")
+def api_quitar_notificacion(params, consulta, datos):
+    guild_id = _guild_api(params)
+    if params["usuario"] not in indice_notificaciones.roster(guild_id):
+        raise ErrorApi(404, "Jugador no anotado")
+    mutar("quitar_notificacion", guild_id, user_id=params["usuario"])
+
+@api_local.ruta("POST", "/api/guilds/{guild}/notificaciones/limpiar")
+def api_limpiar_notificaciones(params, consulta, datos):
+    mutar("limpiar_notificaciones", _guild_api(params))
+
+@api_local.ruta("GET", "/api/ranking", lambda params: "ranking")
+def api_ranking(params, consulta, datos):
+    try:
+        inicio = max(0, int(consulta.get("inicio", 0)))
+        cantidad = min(500, max(1, int(consulta.get("cantidad", 50))))
+    except ValueError:
+        raise ErrorApi(400, "inicio y cantidad deben ser números")
+    return {
+        "total": len(ranking_ordenado),
+        "equipos": [{"posicion": p, "equipo": e, "victorias": v} for p, e, v in ranking_ordenado.pagina(inicio, cantidad)],
+    }
+
+# ----------------- SINCRONIZACIÓN DE COMANDOS ----------------- #
+# Huella de los comandos ya sincronizados, por aplicación
+HUELLA_COMANDOS_FILE = os.getenv("HUELLA_COMANDOS_FILE", "comandos_huella.json")
+# "1" para sincronizar aunque la huella no haya cambiado
+SYNC_FORZAR = os.getenv("SYNC_FORZAR", "") == "1"
+
+def huella_comandos():
+    """sha256 del esquema que se enviaría a Discord con tree.sync()"""
+    esquema = sorted((c.to_dict(bot.tree) for c in bot.tree.get_commands()), key=lambda c: (c.get("type", 1), c["name"]))
+    return hashlib.sha256(json.dumps(esquema, sort_keys=True).encode()).hexdigest()
+
+def leer_huellas():
+    try:
+        with open(HUELLA_COMANDOS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+async def sincronizar_comandos():
+    """tree.sync() solo si los comandos cambiaron desde la última sincronización"""
+    # Los comandos son globales: con varios procesos los sincroniza solo el del
+    # shard 0, que es también el único que escribe el archivo de huellas
+    if SHARD_IDS is not None and 0 not in SHARD_IDS:
+        return
+    huellas = leer_huellas()
+    aplicacion = str(bot.application_id)
+    huella = huella_comandos()
+    if huellas.get(aplicacion) == huella and not SYNC_FORZAR:
+        print(f"✅ Comandos sin cambios ({len(bot.tree.get_commands())}), no se sincronizan")
+        return
+    try:
+        synced = await bot.tree.sync()
+        print(f"✅ {len(synced)} comandos sincronizados")
+    except Exception as e:
+        print(f"❌ Error al sincronizar: {e}")
+        return
+    huellas[aplicacion] = huella
+    escribir_atomico(HUELLA_COMANDOS_FILE, json.dumps(huellas, indent=4).encode())
+
 # ----------------- EVENTOS ----------------- #
+# on_ready se repite en cada reconexión completa; lo de arranque va una sola vez
+arranque_hecho = False
+
 @bot.event
 async def on_ready():
+    global arranque_hecho
+    # Con el backend por servidor, cada guild se carga la primera vez que se ve
+    for guild in bot.guilds:
+        almacen.asegurar_guild(str(guild.id))
+        # Tras reconectar los objetos Role son nuevos: se rehace el índice
+        indice_roles.construir(guild)
+
+    if arranque_hecho:
+        print(f"🔁 {bot.user} reconectado; arranque ya hecho en este proceso")
+        return
+    arranque_hecho = True
+
+    for guild in bot.guilds:
+        # Trabajos de roles que quedaron a medias antes del reinicio
+        motor_roles.reanudar(guild)
+        # Devoluciones pendientes de canales de entrenamiento
+        pool_entreno.reanudar(guild)
+
     # Registrar vistas persistentes para cada servidor configurado
     for guild_id, config in server_configs.items():
         if config.get("channel_id") and config.get("message_id"):
             bot.add_view(DashboardViewUser(guild_id), message_id=int(config["message_id"]))
     
-    # Registrar vistas de salas
+    # Registrar vistas de salas y reconstruir sus eventos programados
     for guild_id, salas in server_salas.items():
-        for sala_id, sala in salas.items():
+        for sala_id, sala in list(salas.items()):
             if sala.get("mensaje_id"):
                 try:
                     bot.add_view(SalaView(sala_id, guild_id), message_id=int(sala["mensaje_id"]))
                 except:
                     pass
+            try:
+                programar_eventos_sala(guild_id, sala_id, sala)
+            except Exception as e:
+                print(f"❌ No se pudo programar la sala {sala_id}: {e}")
     
     # Registrar vistas de notificaciones de salas
-    config = readConfig()
-    if config.get("notificaciones_salas"):
-        for guild_id, settings in config["notificaciones_salas"].items():
-            if settings.get("mensaje_id"):
-                try:
-                    bot.add_view(SalasNotificacionesView(guild_id), message_id=int(settings["mensaje_id"]))
-                except:
-                    pass
+    for guild_id, config in server_configs.items():
+        settings = config.get("notificaciones_salas") or {}
+        if settings.get("mensaje_id"):
+            try:
+                bot.add_view(SalasNotificacionesView(guild_id), message_id=int(settings["mensaje_id"]))
+            except:
+                pass
     
-    try:
-        synced = await bot.tree.sync()
-        print(f"✅ {len(synced)} comandos sincronizados")
-    except Exception as e:
-        print(f"❌ Error al sincronizar: {e}")
+    await sincronizar_comandos()
     
-    print(f"✅ {bot.user} se ha conectado!")
+    print(f"✅ {bot.user} se ha conectado! (proceso {PROCESO}, shards {sorted(bot.shards)} de {bot.shard_count})")
     print(f"🏆 Torneos cargados: {sum(len(t) for t in server_torneos.values())}")
     print(f"📈 Equipos en ranking: {len(ranking)}")
     print(f"🖥️ Servidores configurados: {len(server_configs)}")
     print(f"🎮 Salas activas: {sum(len(s) for s in server_salas.values())}")
+    print(f"⏱️ Listo en {time.perf_counter() - INICIO_PROCESO:.1f}s · RSS {texto_memoria()}")
+
+@bot.event
+async def on_shard_connect(shard_id):
+    m_shard_eventos.inc(shard_id, "conectado")
+    print(f"🔌 Shard {shard_id} conectado (proceso {PROCESO})")
+
+@bot.event
+async def on_shard_disconnect(shard_id):
+    m_shard_eventos.inc(shard_id, "desconectado")
+    print(f"⚠️ Shard {shard_id} desconectado (proceso {PROCESO})")
+
+@bot.event
+async def on_shard_resumed(shard_id):
+    m_shard_eventos.inc(shard_id, "reanudado")
+    print(f"🔁 Shard {shard_id} reanudó la sesión")
+
+@bot.event
+async def on_shard_ready(shard_id):
+    guilds = sum(1 for g in bot.guilds if g.shard_id == shard_id)
+    print(f"✅ Shard {shard_id} listo con {guilds} servidores")
+
+@bot.event
+async def on_guild_role_create(role):
+    indice_roles.agregar(role)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    if before.name != after.name:
+        indice_roles.quitar(after, nombre=before.name)
+    indice_roles.agregar(after)
+
+@bot.event
+async def on_guild_role_delete(role):
+    indice_roles.quitar(role)
+
+@bot.event
+async def on_guild_remove(guild):
+    indice_roles.olvidar(guild.id)
+    # El estado sigue en disco; se suelta de memoria una vez volcado
+    await almacen.vaciar()
+    if almacen.descargar_guild(guild.id):
+        indice_equipos.olvidar(guild.id)
+        indice_notificaciones.olvidar(guild.id)
+        indice_salas.olvidar(guild.id)
 
 # ----------------- EJECUTAR BOT ----------------- #
-token = os.getenv('DISCORD_TOKEN')
-if not token:
-    print("❌ Error: No se encontró DISCORD_TOKEN")
-    print("Por favor, agrega tu token de bot en los Secrets de Replit")
-else:
-    bot.run(token)
+# Solo al ejecutar main.py: así benchmark.py puede importar los handlers
+if __name__ == "__main__":
+    token = os.getenv('DISCORD_TOKEN')
+    if not token:
+        print("❌ Error: No se encontró DISCORD_TOKEN")
+        print("Por favor, agrega tu token de bot en los Secrets de Replit")
+    else:
+        bot.run(token)
@@ -0,0 +1,174 @@
+import asyncio
+import re
+
+import aiohttp
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nombres, valores, extra=""):
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+class Contador:
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+
+    def inc(self, *valores, cantidad=1):
+        self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        for valores, total in self._valores.items():
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {total}")
+        return lineas
+
+
+class Histograma:
+    CUBOS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10)
+
+    def __init__(self, nombre, ayuda, etiquetas=(), cubos=CUBOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.cubos = tuple(cubos)
+        self._series = {}  # {valores: [conteos por cubo, suma, total]}
+
+    def observar(self, valor, *valores):
+        serie = self._series.get(valores)
+        if serie is None:
+            serie = self._series[valores] = [[0] * len(self.cubos), 0.0, 0]
+        for i, limite in enumerate(self.cubos):
+            if valor <= limite:
+                serie[0][i] += 1
+        serie[1] += valor
+        serie[2] += 1
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        for valores, (conteos, suma, total) in self._series.items():
+            for limite, conteo in zip(self.cubos, conteos):
+                le = 'le="%s"' % limite
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, valores, le)} {conteo}")
+            le = 'le="+Inf"'
+            lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, valores, le)} {total}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, valores)} {suma}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, valores)} {total}")
+        return lineas
+
+
+class Medidor:
+    """Gauge que se calcula al pedir las métricas; con etiquetas, funcion()
+    devuelve {(valores de etiqueta): valor}"""
+
+    def __init__(self, nombre, ayuda, funcion, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+        self.etiquetas = tuple(etiquetas)
+
+    def exponer(self):
+        try:
+            valores = self.funcion()
+        except Exception:
+            return []
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} gauge"]
+        if not self.etiquetas:
+            valores = {(): valores}
+        for etiquetas, valor in valores.items():
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {valor}")
+        return lineas
+
+
+class Metricas:
+    """Registro de métricas en formato de texto de Prometheus.
+
+    Todo se actualiza desde el event loop, así que no hace falta bloquear."""
+
+    def __init__(self):
+        self._metricas = []
+
+    def _agregar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._agregar(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), cubos=Histograma.CUBOS):
+        return self._agregar(Histograma(nombre, ayuda, etiquetas, cubos))
+
+    def medidor(self, nombre, ayuda, funcion, etiquetas=()):
+        return self._agregar(Medidor(nombre, ayuda, funcion, etiquetas))
+
+    def exponer(self):
+        lineas = []
+        for metrica in self._metricas:
+            lineas.extend(metrica.exponer())
+        return "\n".join(lineas) + "\n"
+
+
+# Los IDs de Discord (snowflakes) se agrupan para no crear una serie por canal
+_SNOWFLAKE = re.compile(r"\d{15,}")
+
+
+def traza_http(llamadas, limitadas):
+    """TraceConfig de aiohttp que cuenta las llamadas REST por método, ruta y
+    estado, y aparte las respuestas 429"""
+    traza = aiohttp.TraceConfig()
+
+    async def al_terminar(sesion, contexto, params):
+        ruta = _SNOWFLAKE.sub(":id", params.url.path)
+        estado = params.response.status
+        llamadas.inc(params.method, ruta, estado)
+        if estado == 429:
+            limitadas.inc(params.method, ruta)
+
+    traza.on_request_end.append(al_terminar)
+    return traza
+
+
+class ServidorMetricas:
+    """Servidor HTTP mínimo que responde cualquier GET con las métricas"""
+
+    def __init__(self, metricas, host, puerto):
+        self.metricas = metricas
+        self.host = host
+        self.puerto = puerto
+        self._servidor = None
+
+    async def _atender(self, lector, escritor):
+        try:
+            await asyncio.wait_for(lector.readuntil(b"\r\n\r\n"), timeout=5)
+            cuerpo = self.metricas.exponer().encode()
+            escritor.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                + f"Content-Length: {len(cuerpo)}\r\n".encode()
+                + b"Connection: close\r\n\r\n" + cuerpo
+            )
+            await escritor.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            escritor.close()
+
+    async def iniciar(self):
+        if self._servidor is None:
+            self._servidor = await asyncio.start_server(self._atender, self.host, self.puerto)
+            print(f"📊 Métricas en http://{self.host}:{self.puerto}/metrics")
+
+    async def detener(self):
+        if self._servidor is not None:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+            self._servidor = None
+
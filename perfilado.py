@@ -0,0 +1,66 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import time
+
+
+class Perfilador:
+    """Perfil cProfile del event loop durante las próximas N interacciones.
+
+    cProfile mide todo lo que corre en el hilo mientras está activo, así que
+    el perfil incluye también lo que se ejecutó en paralelo a esas
+    interacciones; para buscar el handler lento es justo lo que interesa.
+    Al terminar se guarda el .prof (para snakeviz/pstats) y un resumen .txt."""
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._perfil = None
+        self._restantes = 0
+        self._al_terminar = None
+
+    @property
+    def activo(self):
+        return self._perfil is not None
+
+    def activar(self, cantidad, al_terminar=None):
+        """Empieza a perfilar; al_terminar(ruta) se llama con el archivo guardado"""
+        if self.activo:
+            return False
+        self._perfil = cProfile.Profile()
+        self._restantes = cantidad
+        self._al_terminar = al_terminar
+        self._perfil.enable()
+        return True
+
+    def interaccion_terminada(self):
+        if not self.activo:
+            return
+        self._restantes -= 1
+        if self._restantes > 0:
+            return
+        perfil, al_terminar = self._perfil, self._al_terminar
+        perfil.disable()
+        self._perfil = None
+        asyncio.create_task(self._guardar(perfil, al_terminar))
+
+    def _volcar(self, perfil):
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta = os.path.join(self.directorio, f"perfil-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+        perfil.dump_stats(ruta)
+        resumen = io.StringIO()
+        pstats.Stats(perfil, stream=resumen).sort_stats("cumulative").print_stats(40)
+        with open(ruta[:-len(".prof")] + ".txt", "w", encoding="utf-8") as f:
+            f.write(resumen.getvalue())
+        return ruta
+
+    async def _guardar(self, perfil, al_terminar):
+        try:
+            ruta = await asyncio.to_thread(self._volcar, perfil)
+        except Exception as e:
+            print(f"❌ Error al guardar el perfil: {e}")
+            return
+        print(f"🔬 Perfil guardado en {ruta}")
+        if al_terminar:
+            await al_terminar(ruta)
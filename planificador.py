@@ -0,0 +1,73 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+
+class Planificador:
+    """Min-heap de eventos con hora (epoch) atendido por un único task.
+
+    Cada evento se identifica por una clave (tipo, *ids); volver a programar
+    la misma clave reemplaza el evento anterior y cancelar solo lo marca, así
+    que insertar y cancelar son O(log n) y O(1). Las horas se guardan en el
+    estado de cada sala/canal, de modo que el heap se reconstruye al arrancar."""
+
+    def __init__(self, manejador):
+        # manejador(tipo, *ids) es una corrutina; se lanza como task propio
+        self.manejador = manejador
+        self._heap = []  # [(hora, prioridad, seq, clave)]
+        self._vigentes = {}  # {clave: seq}
+        self._seq = itertools.count()
+        self._despertar = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._vigentes)
+
+    def programar(self, hora, clave, prioridad=0):
+        seq = next(self._seq)
+        self._vigentes[clave] = seq
+        heapq.heappush(self._heap, (hora, prioridad, seq, clave))
+        # Solo hace falta despertar al task si el nuevo evento es el primero
+        if self._heap[0][2] == seq:
+            self._despertar.set()
+
+    def cancelar(self, clave):
+        self._vigentes.pop(clave, None)
+
+    def programado(self, clave):
+        return clave in self._vigentes
+
+    def _purgar(self):
+        while self._heap and self._vigentes.get(self._heap[0][3]) != self._heap[0][2]:
+            heapq.heappop(self._heap)
+
+    async def _bucle(self):
+        while True:
+            self._purgar()
+            self._despertar.clear()
+            espera = self._heap[0][0] - time.time() if self._heap else None
+            if espera is None or espera > 0:
+                try:
+                    await asyncio.wait_for(self._despertar.wait(), timeout=espera)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, seq, clave = heapq.heappop(self._heap)
+            del self._vigentes[clave]
+            asyncio.create_task(self._despachar(clave))
+
+    async def _despachar(self, clave):
+        try:
+            await self.manejador(*clave)
+        except Exception as e:
+            print(f"❌ Error en evento programado {clave}: {e}")
+
+    def iniciar(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._bucle())
+
+    def detener(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,138 @@
+"""Formatos de los snapshots en disco.
+
+    json            JSON compacto (orjson si está instalado)
+    json-indentado  JSON con sangría, el formato histórico, para leerlo a mano
+    msgpack         binario (requiere el paquete msgpack)
+
+Al leer, el formato se detecta por el contenido, así que cambiar SERIALIZADOR
+no obliga a migrar: los archivos antiguos se siguen leyendo y se reescriben
+en el formato nuevo en el siguiente volcado.
+
+    python serializacion.py --guilds 50 --torneos 3 --participantes 500
+
+compara el tiempo de codificar/decodificar y el tamaño de cada formato con un
+server_torneos sintético.
+"""
+import argparse
+import json
+import random
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Cabecera de los snapshots binarios; un JSON nunca empieza así
+MAGIA_MSGPACK = b"\x00TBM1"
+
+
+class SerializadorJSON:
+    def __init__(self, indentado=False, rapido=True):
+        self.indentado = indentado
+        self.rapido = rapido and orjson is not None
+        self.nombre = ("json-indentado" if indentado else "json") + (" (orjson)" if self.rapido else "")
+
+    def codificar(self, datos):
+        if self.rapido:
+            return orjson.dumps(datos, option=orjson.OPT_INDENT_2 if self.indentado else 0)
+        if self.indentado:
+            return json.dumps(datos, indent=4).encode()
+        return json.dumps(datos, separators=(",", ":")).encode()
+
+    def decodificar(self, datos):
+        return orjson.loads(datos) if self.rapido else json.loads(datos)
+
+
+class SerializadorMsgpack:
+    nombre = "msgpack"
+
+    def codificar(self, datos):
+        return MAGIA_MSGPACK + msgpack.packb(datos, use_bin_type=True)
+
+    def decodificar(self, datos):
+        return msgpack.unpackb(datos[len(MAGIA_MSGPACK):], raw=False, strict_map_key=False)
+
+
+def decodificar(datos):
+    """bytes de un snapshot en cualquiera de los formatos -> objeto"""
+    if datos.startswith(MAGIA_MSGPACK):
+        if msgpack is None:
+            raise RuntimeError("El archivo está en formato msgpack y el paquete msgpack no está instalado")
+        return SerializadorMsgpack().decodificar(datos)
+    return SerializadorJSON().decodificar(datos)
+
+
+def leer(ruta):
+    with open(ruta, "rb") as f:
+        return decodificar(f.read())
+
+
+def crear_serializador(nombre):
+    """nombre: 'json' (por defecto), 'json-indentado' o 'msgpack'"""
+    if nombre == "msgpack":
+        if msgpack is not None:
+            return SerializadorMsgpack()
+        print("⚠️ SERIALIZADOR=msgpack pero el paquete msgpack no está instalado; se usa JSON compacto")
+    return SerializadorJSON(indentado=nombre == "json-indentado")
+
+
+# ----------------- MICRO-BENCHMARK ----------------- #
+def torneos_sinteticos(guilds, torneos, participantes, semilla=0):
+    """{guild_id: {torneo: {user_id: equipo}}} con IDs y nombres realistas"""
+    azar = random.Random(semilla)
+    datos = {}
+    for _ in range(guilds):
+        guild = {}
+        for t in range(torneos):
+            equipos = [f"Equipo {azar.choice(['Alfa', 'Fénix', 'Lobos', 'Titanes'])} {i}" for i in range(max(1, participantes // 5))]
+            guild[f"Torneo {t + 1}"] = {str(azar.randrange(10 ** 17, 10 ** 18)): azar.choice(equipos) for _ in range(participantes)}
+        datos[str(azar.randrange(10 ** 17, 10 ** 18))] = guild
+    return datos
+
+
+def medir(serializador, datos, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        codificado = serializador.codificar(datos)
+    codificar = (time.perf_counter() - inicio) / repeticiones
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        decodificado = serializador.decodificar(codificado)
+    decodificar_s = (time.perf_counter() - inicio) / repeticiones
+    if decodificado != datos:
+        raise AssertionError(f"{serializador.nombre} no conserva los datos")
+    return codificar, decodificar_s, len(codificado)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara los formatos de snapshot con datos sintéticos")
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--torneos", type=int, default=3)
+    parser.add_argument("--participantes", type=int, default=500)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    datos = torneos_sinteticos(args.guilds, args.torneos, args.participantes)
+    candidatos = [SerializadorJSON(indentado=True, rapido=False), SerializadorJSON(rapido=False)]
+    if orjson is not None:
+        candidatos += [SerializadorJSON(indentado=True), SerializadorJSON()]
+    if msgpack is not None:
+        candidatos.append(SerializadorMsgpack())
+    faltan = [nombre for nombre, modulo in (("orjson", orjson), ("msgpack", msgpack)) if modulo is None]
+
+    print(f"📊 {args.guilds} guilds × {args.torneos} torneos × {args.participantes} participantes\n")
+    print(f"{'formato':<26} {'codificar ms':>13} {'decodificar ms':>15} {'bytes':>12}")
+    base = None
+    for serializador in candidatos:
+        codificar, decodificar_s, tamano = medir(serializador, datos, args.repeticiones)
+        base = base or codificar
+        print(f"{serializador.nombre:<26} {codificar * 1000:>13.2f} {decodificar_s * 1000:>15.2f} {tamano:>12}"
+              f"   ×{base / codificar:.1f}")
+    if faltan:
+        print(f"\nNo instalados: {', '.join(faltan)}")
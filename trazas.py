@@ -0,0 +1,274 @@
+"""Grabación anónima de interacciones y reproducción offline.
+
+En producción, con TRAZAS_DIR definido, cada interacción (tipo, clase,
+botón/modal/comando, valores, guild, usuario e instante) se añade a
+trazas/trazas-<fecha>.jsonl. IDs y textos libres se cambian por seudónimos
+con una sal aleatoria por archivo: la misma entrada da el mismo seudónimo
+dentro de una grabación, así que la reproducción conserva quién se une a qué
+equipo, pero no se puede volver al valor real.
+
+    python trazas.py trazas/trazas-20260101-200000.jsonl --velocidad 10 --latencia 0.05
+
+reproduce la grabación a 10× sobre la capa de Discord simulada de
+benchmark.py, con los handlers reales, y muestra latencias y llamadas REST.
+"""
+import argparse
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import re
+import time
+
+# Textos que los handlers comparan literalmente y por eso no se cambian
+_LITERALES = re.compile(r"^(CONFIRMAR|Sin torneos|abrir|cerrar|\d{1,2}:\d{2})$", re.IGNORECASE)
+_SNOWFLAKE = re.compile(r"^\d{15,}$")
+
+
+class Anonimizador:
+    def __init__(self, sal=None):
+        self.sal = sal or os.urandom(16)
+
+    def _hash(self, valor):
+        return hashlib.sha256(self.sal + str(valor).encode("utf-8")).hexdigest()
+
+    def id(self, valor):
+        # Sigue pareciendo un snowflake para que int() funcione al reproducir
+        return str(10 ** 17 + int(self._hash(valor)[:15], 16) % (9 * 10 ** 17))
+
+    def valor(self, valor):
+        if isinstance(valor, bool) or valor is None or isinstance(valor, float):
+            return valor
+        if isinstance(valor, int):
+            return int(self.id(valor)) if valor >= 10 ** 14 else valor
+        if isinstance(valor, str):
+            if _SNOWFLAKE.match(valor):
+                return self.id(valor)
+            if _LITERALES.match(valor) or valor == "":
+                return valor
+            return "t-" + self._hash(valor)[:10]
+        if isinstance(valor, (list, tuple)):
+            return [self.valor(v) for v in valor]
+        if isinstance(valor, dict):
+            return {k: self.valor(v) for k, v in valor.items()}
+        return None
+
+
+def contexto_de(origen):
+    """Argumentos con los que se construyó la vista o el modal: todos guardan
+    sus parámetros con el mismo nombre, así que basta con la firma"""
+    if origen is None:
+        return {}
+    parametros = list(inspect.signature(type(origen).__init__).parameters)[1:]
+    return {p: getattr(origen, p) for p in parametros if hasattr(origen, p)}
+
+
+class GrabadorTrazas:
+    """Acumula eventos en memoria y los añade al archivo una vez por segundo"""
+
+    def __init__(self, directorio, intervalo=1.0):
+        self.directorio = directorio
+        self.intervalo = intervalo
+        self.anonimizador = Anonimizador()
+        self.ruta = None
+        self._inicio = None
+        self._pendientes = []
+        self._task = None
+
+    def registrar(self, tipo, nombre, interaction, origen=None, valores=None):
+        ahora = time.monotonic()
+        if self._inicio is None:
+            self._inicio = ahora
+        a = self.anonimizador
+        usuario = getattr(interaction, "user", None)
+        permisos = getattr(usuario, "guild_permissions", None)
+        evento = {
+            "t": round(ahora - self._inicio, 4),
+            "tipo": tipo,
+            "clase": type(origen).__name__ if origen is not None else None,
+            "nombre": nombre,
+            "guild": a.id(interaction.guild_id) if interaction.guild_id else None,
+            "usuario": a.id(usuario.id) if usuario else None,
+            "admin": bool(permisos and permisos.administrator),
+            "contexto": a.valor(contexto_de(origen)),
+            "valores": a.valor(valores or {}),
+        }
+        self._pendientes.append(json.dumps(evento, ensure_ascii=False) + "\n")
+
+    def _escribir(self, lineas):
+        with open(self.ruta, "a", encoding="utf-8") as f:
+            f.writelines(lineas)
+
+    async def vaciar(self):
+        if not self._pendientes:
+            return
+        lineas, self._pendientes = self._pendientes, []
+        try:
+            await asyncio.to_thread(self._escribir, lineas)
+        except Exception as e:
+            print(f"❌ Error al escribir trazas: {e}")
+
+    async def _bucle(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            await self.vaciar()
+
+    def iniciar(self):
+        if self._task is None or self._task.done():
+            os.makedirs(self.directorio, exist_ok=True)
+            self.ruta = os.path.join(self.directorio, f"trazas-{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+            self._task = asyncio.create_task(self._bucle())
+            print(f"🎥 Grabando interacciones en {self.ruta}")
+
+    async def detener(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.vaciar()
+
+
+# ----------------- REPRODUCCIÓN ----------------- #
+def leer_trazas(ruta):
+    with open(ruta, "r", encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+class Reproductor:
+    """Convierte cada evento grabado en la llamada al handler real"""
+
+    def __init__(self, benchmark, simulacion):
+        self.b = benchmark
+        self.main = benchmark.main
+        self.simulacion = simulacion
+
+    def guild(self, guild_id):
+        guild = self.simulacion.guilds.get(int(guild_id))
+        if guild is None:
+            guild = self.simulacion.agregar_guild(self.b.FalsoGuild(0, guild_id=int(guild_id)))
+        return guild
+
+    def _preparar_estado(self, guild, contexto):
+        # La grabación empieza con el bot ya funcionando: se crea lo que falte
+        main = self.main
+        torneo = contexto.get("torneo")
+        if torneo and torneo not in main.get_server_torneos(guild.id):
+            main.mutar("crear_torneo", guild.id, torneo=torneo)
+        sala_id = contexto.get("sala_id")
+        if sala_id and sala_id not in main.get_server_salas(guild.id):
+            main.mutar("crear_sala", guild.id, sala_id=sala_id, sala={
+                "nombre": sala_id, "hora_apertura": "00:00", "hora_cierre": "23:59",
+                "jugadores": [], "canal_id": str(guild.canal.id), "mensaje_id": None
+            })
+
+    def _construir(self, clase, guild, contexto):
+        cls = getattr(self.main, clase)
+        kwargs = {}
+        for parametro in list(inspect.signature(cls.__init__).parameters)[1:]:
+            if parametro == "guild_id":
+                kwargs[parametro] = guild.id
+            elif parametro == "channel_id":
+                kwargs[parametro] = guild.canal.id
+            elif parametro in contexto:
+                kwargs[parametro] = contexto[parametro]
+        return cls(**kwargs)
+
+    def preparar(self, evento):
+        """Devuelve (corrutina, interacción) para el evento, o None si no se puede reproducir"""
+        discord = self.b.discord
+        guild = self.guild(evento["guild"])
+        miembro = guild.miembro(int(evento["usuario"]), evento["admin"])
+        contexto = evento["contexto"]
+        self._preparar_estado(guild, contexto)
+        tipo = evento["tipo"]
+        if tipo == "comando":
+            comando = self.main.bot.tree.get_command(evento["nombre"])
+            if comando is None:
+                return None
+            interaccion = self.b.FalsaInteraccion(guild, miembro, discord.InteractionType.application_command)
+            return comando.callback(interaccion, **evento["valores"]), interaccion
+        if tipo == "modal":
+            modal = self._construir(evento["clase"], guild, contexto)
+            for atributo, valor in evento["valores"].items():
+                self.b.rellenar(getattr(modal, atributo), valor)
+            interaccion = self.b.FalsaInteraccion(guild, miembro)
+            return modal.on_submit(interaccion), interaccion
+        vista = self._construir(evento["clase"], guild, contexto)
+        for item in vista.children:
+            if vista.nombre_item(item) == evento["nombre"]:
+                interaccion = self.b.FalsaInteraccion(guild, miembro, discord.InteractionType.component)
+                interaccion.data = dict(evento["valores"])
+                return item.callback(interaccion), interaccion
+        return None
+
+
+async def reproducir(benchmark, eventos, velocidad):
+    simulacion = benchmark.Simulacion()
+    await simulacion.iniciar()
+    reproductor = Reproductor(benchmark, simulacion)
+    latencias, acks, retrasos = [], [], []
+    omitidos = 0
+
+    async def correr(corrutina, interaccion):
+        inicio = time.perf_counter()
+        try:
+            await corrutina
+        except Exception as e:
+            print(f"❌ Error al reproducir: {e}")
+        latencias.append(time.perf_counter() - inicio)
+        if interaccion.response.respondida is not None:
+            acks.append(interaccion.response.respondida - inicio)
+
+    tareas = []
+    inicio = time.perf_counter()
+    for evento in eventos:
+        espera = inicio + evento["t"] / velocidad - time.perf_counter()
+        if espera > 0:
+            await asyncio.sleep(espera)
+        else:
+            retrasos.append(-espera)
+        operacion = reproductor.preparar(evento)
+        if operacion is None:
+            omitidos += 1
+            continue
+        tareas.append(asyncio.create_task(correr(*operacion)))
+    await asyncio.gather(*tareas)
+    duracion = time.perf_counter() - inicio
+    await simulacion.esperar()
+    await simulacion.detener()
+    return {
+        "eventos": len(eventos),
+        "omitidos": omitidos,
+        "segundos": duracion,
+        "p50_ms": benchmark.percentil(latencias, 0.5) * 1000,
+        "p99_ms": benchmark.percentil(latencias, 0.99) * 1000,
+        "ack_p99_ms": benchmark.percentil(acks, 0.99) * 1000,
+        "retraso_max_ms": max(retrasos, default=0.0) * 1000,
+        "rest": dict(benchmark.rest.llamadas),
+        "bytes": simulacion.bytes.total,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reproduce una grabación de interacciones sin conectarse a Discord")
+    parser.add_argument("trazas")
+    parser.add_argument("--velocidad", type=float, default=1.0, help="1, 10, 100... veces la velocidad grabada")
+    parser.add_argument("--latencia", type=float, default=0.05, help="Latencia simulada de cada llamada REST (s)")
+    parser.add_argument("--backend", choices=("json", "sqlite", "shards"), default="json")
+    parser.add_argument("--json", help="Guardar el resultado en este archivo")
+    args = parser.parse_args()
+
+    eventos = leer_trazas(args.trazas)
+    salida = os.path.abspath(args.json) if args.json else None
+    import benchmark
+    directorio = benchmark.preparar_entorno(args)
+    resultado = asyncio.run(reproducir(benchmark, eventos, args.velocidad))
+    print(f"\n🎬 {resultado['eventos']} eventos a {args.velocidad:g}× en {resultado['segundos']:.2f}s "
+          f"({resultado['omitidos']} omitidos)")
+    print(f"⏱️ p50 {resultado['p50_ms']:.2f} ms · p99 {resultado['p99_ms']:.2f} ms · "
+          f"ack p99 {resultado['ack_p99_ms']:.2f} ms · retraso máx. del reproductor {resultado['retraso_max_ms']:.2f} ms")
+    print("🌐 REST: " + ", ".join(f"{k}={v}" for k, v in sorted(resultado["rest"].items())))
+    print(f"💾 {resultado['bytes']} bytes escritos · estado en {directorio}")
+    if salida:
+        with open(salida, "w") as f:
+            json.dump({"parametros": vars(args), "resultado": resultado}, f, indent=4)
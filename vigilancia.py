@@ -0,0 +1,124 @@
+"""Aviso cuando un archivo cambia en disco.
+
+En Linux se usa inotify (vía ctypes, sin dependencias) sobre el directorio
+del archivo, para ver tanto las escrituras en el sitio como los reemplazos
+por rename; en otros sistemas, o si inotify falla, se compara tamaño y fecha
+cada cierto intervalo.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+_EVENTO = struct.Struct("iIII")
+
+
+def _abrir_inotify(directorio):
+    """Descriptor de un inotify no bloqueante sobre el directorio, o None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        wd = libc.inotify_add_watch(fd, os.fsencode(directorio), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+def _nombres(datos):
+    """Nombres de archivo de un bloque de eventos de inotify"""
+    pos = 0
+    while pos + _EVENTO.size <= len(datos):
+        _, _, _, largo = _EVENTO.unpack_from(datos, pos)
+        pos += _EVENTO.size
+        yield datos[pos:pos + largo].rstrip(b"\0")
+        pos += largo
+
+
+def _firma(ruta):
+    try:
+        estado = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+    return estado.st_size, estado.st_mtime_ns, estado.st_ino
+
+
+class VigilanteArchivo:
+    """Llama a al_cambiar() (corrutina) cuando el archivo cambia; las ráfagas
+    de eventos se agrupan durante `espera` segundos y nunca hay dos llamadas
+    a la vez. Quien recibe el aviso decide si el cambio es propio."""
+
+    def __init__(self, ruta, al_cambiar, intervalo=2.0, espera=0.25):
+        self.ruta = os.path.abspath(ruta)
+        self.al_cambiar = al_cambiar
+        self.intervalo = intervalo
+        self.espera = espera
+        self.modo = None
+        self._fd = None
+        self._aviso = None
+        self._task = None
+
+    def _leer_eventos(self):
+        nombre = os.fsencode(os.path.basename(self.ruta))
+        try:
+            while True:
+                datos = os.read(self._fd, 64 * 1024)
+                if not datos:
+                    break
+                if nombre in _nombres(datos):
+                    self._aviso.set()
+        except BlockingIOError:
+            pass
+
+    async def _bucle(self):
+        firma = _firma(self.ruta)
+        while True:
+            if self.modo == "inotify":
+                await self._aviso.wait()
+            else:
+                await asyncio.sleep(self.intervalo)
+                nueva = _firma(self.ruta)
+                if nueva == firma:
+                    continue
+                firma = nueva
+            # Dejar que termine de escribirse antes de leerlo
+            await asyncio.sleep(self.espera)
+            if self._aviso is not None:
+                self._aviso.clear()
+            try:
+                await self.al_cambiar()
+            except Exception as e:
+                print(f"❌ Error al recargar {os.path.basename(self.ruta)}: {e}")
+
+    def iniciar(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._fd = _abrir_inotify(os.path.dirname(self.ruta))
+        if self._fd is not None:
+            self.modo = "inotify"
+            self._aviso = asyncio.Event()
+            asyncio.get_running_loop().add_reader(self._fd, self._leer_eventos)
+        else:
+            self.modo = "sondeo"
+        self._task = asyncio.create_task(self._bucle())
+        print(f"👀 Vigilando {os.path.basename(self.ruta)} ({self.modo})")
+
+    def detener(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
@@ -3,7 +3,7 @@ const session = require('express-session');
 const axios = require('axios');
 require('dotenv').config();
 const path = require('path');
-const fs = require('fs');
+const http = require('http');
 
 const app = express();
 const PORT = process.env.PORT || 5000;
@@ -14,32 +14,70 @@ const db = require('./database/db');
 // Simple Memory Store for sessions
 const sessionStore = new session.MemoryStore();
 
-// Config file path (shared with bot)
-const CONFIG_FILE = path.join(__dirname, '..', 'config.json');
+// Local API of the bot process (API_PUERTO / API_SOCKET in the bot's .env).
+// The bot owns config.json; the panel reads and writes state only through it.
+const BOT_API_SOCKET = process.env.API_SOCKET || '';
+const BOT_API_HOST = process.env.API_HOST || '127.0.0.1';
+const BOT_API_PORT = process.env.API_PUERTO || '';
+const BOT_API_TOKEN = process.env.API_TOKEN || '';
+const botApiAgent = new http.Agent({ keepAlive: true });
+// GET responses by path with their ETag: unchanged data comes back as a 304
+const botApiCache = new Map();
+
+const botApi = (method, apiPath, body) => new Promise((resolve, reject) => {
+  if (!BOT_API_SOCKET && !BOT_API_PORT) {
+    const error = new Error('Bot API not configured (set API_PUERTO and API_TOKEN, or API_SOCKET)');
+    error.status = 503;
+    return reject(error);
+  }
+  const payload = body === undefined ? null : Buffer.from(JSON.stringify(body));
+  const headers = {};
+  if (BOT_API_TOKEN) headers.Authorization = `Bearer ${BOT_API_TOKEN}`;
+  if (payload) {
+    headers['Content-Type'] = 'application/json';
+    headers['Content-Length'] = payload.length;
+  }
+  const cached = method === 'GET' ? botApiCache.get(apiPath) : null;
+  if (cached) headers['If-None-Match'] = cached.etag;
+
+  const options = { method, path: apiPath, headers, agent: botApiAgent };
+  if (BOT_API_SOCKET) {
+    options.socketPath = BOT_API_SOCKET;
+  } else {
+    options.host = BOT_API_HOST;
+    options.port = BOT_API_PORT;
+  }
+  const req = http.request(options, (res) => {
+    const chunks = [];
+    res.on('data', (chunk) => chunks.push(chunk));
+    res.on('end', () => {
+      if (res.statusCode === 304 && cached) return resolve(cached.data);
+      const text = Buffer.concat(chunks).toString('utf-8');
+      const data = text ? JSON.parse(text) : null;
+      if (res.statusCode >= 400) {
+        const error = new Error((data && data.error) || `Bot API HTTP ${res.statusCode}`);
+        error.status = res.statusCode;
+        return reject(error);
+      }
+      if (method === 'GET' && res.headers.etag) botApiCache.set(apiPath, { etag: res.headers.etag, data });
+      resolve(data);
+    });
+  });
+  req.on('error', reject);
+  if (payload) req.write(payload);
+  req.end();
+});
 
-// Helper function to read config.json
-const readConfig = () => {
-  try {
-    if (fs.existsSync(CONFIG_FILE)) {
-      const data = fs.readFileSync(CONFIG_FILE, 'utf-8');
-      return JSON.parse(data);
-    }
-    return { configs: {}, torneos: {}, salas: {} };
-  } catch (error) {
-    console.error('Error reading config:', error);
-    return { configs: {}, torneos: {}, salas: {} };
-  }
-};
+const getRooms = (guildId) => botApi('GET', `/api/guilds/${guildId}/salas`);
 
-// Helper function to write config.json
-const writeConfig = (data) => {
-  try {
-    fs.writeFileSync(CONFIG_FILE, JSON.stringify(data, null, 2));
-    return true;
-  } catch (error) {
-    console.error('Error writing config:', error);
-    return false;
-  }
+// The bot keeps the roster as { user_id: entry }; the views expect a list
+const getNotificationSettings = async (guildId) => {
+  const settings = await botApi('GET', `/api/guilds/${guildId}/notificaciones`);
+  const roster = settings.jugadores_listos || {};
+  return {
+    ...settings,
+    jugadores_listos: Object.entries(roster).map(([user_id, entry]) => ({ user_id, ...entry }))
+  };
 };
 
 // Middleware
@@ -267,8 +305,7 @@ app.get('/dashboard/:guildId', isAuthenticated, async (req, res) => {
     }
 
     // Get stats for dashboard
-    const fullConfig = readConfig();
-    const serverRooms = fullConfig.salas && fullConfig.salas[guildId] ? fullConfig.salas[guildId] : {};
+    const serverRooms = await getRooms(guildId).catch(() => ({}));
     const activeRooms = Object.values(serverRooms).filter(r => r.jugadores).length;
     const totalPlayers = Object.values(serverRooms).reduce((sum, r) => sum + (r.jugadores ? r.jugadores.length : 0), 0);
     
@@ -361,8 +398,7 @@ app.get('/dashboard/:guildId/rooms', isAuthenticated, async (req, res) => {
       });
     }
 
-    const fullConfig = readConfig();
-    const serverRooms = fullConfig.salas && fullConfig.salas[guildId] ? fullConfig.salas[guildId] : {};
+    const serverRooms = await getRooms(guildId);
     
     const activeRooms = Object.entries(serverRooms)
       .map(([id, room]) => ({
@@ -400,28 +436,19 @@ app.post('/api/salas/crear/:guildId', isAuthenticated, async (req, res) => {
     const { guildId } = req.params;
     const { nombre, max_players, hora_apertura, hora_cierre, channel_id, role_id, custom_message, description } = req.body;
     
-    const roomId = String(Date.now());
     console.log(`🎮 Creating pro room: ${nombre} in guild ${guildId}`);
     
-    const fullConfig = readConfig();
-    if (!fullConfig.salas) fullConfig.salas = {};
-    if (!fullConfig.salas[guildId]) fullConfig.salas[guildId] = {};
-    
-    fullConfig.salas[guildId][roomId] = {
+    // The bot posts the room message with its join button and schedules the close
+    const { sala_id: roomId } = await botApi('POST', `/api/guilds/${guildId}/salas`, {
       nombre: nombre,
       hora_apertura: hora_apertura,
       hora_cierre: hora_cierre,
-      jugadores: [],
-      max_players: max_players,
       canal_id: channel_id,
+      max_players: max_players,
       rol_id: role_id,
       mensaje_personalizado: custom_message,
-      descripcion: description,
-      mensaje_id: '',
-      estado: 'activa'
-    };
-    
-    writeConfig(fullConfig);
+      descripcion: description
+    });
     console.log(`✅ Pro room created: ${roomId}`);
     db.addLog(guildId, 'room_pro_created', req.session.user.username, `Sala PRO creada: ${nombre}`);
     
@@ -434,19 +461,18 @@ app.post('/api/salas/crear/:guildId', isAuthenticated, async (req, res) => {
     res.json({ success: true, room_id: roomId });
   } catch (error) {
     console.error('Error creating pro room:', error);
-    res.status(500).json({ success: false, error: error.message });
+    res.status(error.status || 500).json({ success: false, error: error.message });
   }
 });
 
 app.post('/api/salas/cerrar/:roomId', isAuthenticated, async (req, res) => {
   try {
     const { roomId } = req.params;
-    const fullConfig = readConfig();
     
-    for (const guildId in fullConfig.salas) {
-      if (fullConfig.salas[guildId][roomId]) {
-        delete fullConfig.salas[guildId][roomId];
-        writeConfig(fullConfig);
+    for (const { id: guildId } of req.session.user.guilds) {
+      const rooms = await getRooms(guildId).catch(() => ({}));
+      if (rooms[roomId]) {
+        await botApi('DELETE', `/api/guilds/${guildId}/salas/${roomId}`);
         db.addLog(guildId, 'room_pro_closed', req.session.user.username, `Sala cerrada: ${roomId}`);
         return res.json({ success: true });
       }
@@ -564,11 +590,10 @@ app.delete('/api/guild/:guildId/roles/:roleId', isAuthenticated, (req, res) => {
 });
 
 // GET /api/guild/:guildId/rooms
-app.get('/api/guild/:guildId/rooms', isAuthenticated, (req, res) => {
+app.get('/api/guild/:guildId/rooms', isAuthenticated, async (req, res) => {
   try {
     const { guildId } = req.params;
-    const fullConfig = readConfig();
-    const serverRooms = fullConfig.salas && fullConfig.salas[guildId] ? fullConfig.salas[guildId] : {};
+    const serverRooms = await getRooms(guildId);
     const rooms = Object.entries(serverRooms).map(([id, room]) => ({
       room_id: id,
       name: room.nombre,
@@ -587,25 +612,18 @@ app.post('/api/guild/:guildId/rooms', isAuthenticated, async (req, res) => {
   try {
     const { guildId } = req.params;
     const { name, description, open_time, close_time, max_players } = req.body;
-    const roomId = String(Date.now());
     
     console.log(`📍 Creating room: ${name} in guild ${guildId}`);
     
-    const fullConfig = readConfig();
-    if (!fullConfig.salas) fullConfig.salas = {};
-    if (!fullConfig.salas[guildId]) fullConfig.salas[guildId] = {};
-    
-    fullConfig.salas[guildId][roomId] = {
+    const { sala_id: roomId } = await botApi('POST', `/api/guilds/${guildId}/salas`, {
       nombre: name,
       hora_apertura: open_time,
       hora_cierre: close_time,
-      jugadores: [],
       canal_id: db.getGuildConfig(guildId)?.log_channel_id || '',
-      mensaje_id: ''
-    };
-    
-    writeConfig(fullConfig);
-    console.log(`✅ Room created in config.json: ${roomId}`);
+      descripcion: description,
+      max_players: max_players
+    });
+    console.log(`✅ Room created by the bot: ${roomId}`);
     db.addLog(guildId, 'room_created', req.session.user.username, `Sala creada: ${name}`);
     
     const config = db.getGuildConfig(guildId);
@@ -617,25 +635,22 @@ app.post('/api/guild/:guildId/rooms', isAuthenticated, async (req, res) => {
     res.json({ success: true, room_id: roomId });
   } catch (error) {
     console.error(`❌ Room creation error:`, error);
-    res.status(500).json({ success: false, error: error.message });
+    res.status(error.status || 500).json({ success: false, error: error.message });
   }
 });
 
 // DELETE /api/guild/:guildId/rooms/:roomId
-app.delete('/api/guild/:guildId/rooms/:roomId', isAuthenticated, (req, res) => {
+app.delete('/api/guild/:guildId/rooms/:roomId', isAuthenticated, async (req, res) => {
   try {
     const { guildId, roomId } = req.params;
     
-    const fullConfig = readConfig();
-    if (fullConfig.salas && fullConfig.salas[guildId] && fullConfig.salas[guildId][roomId]) {
-      delete fullConfig.salas[guildId][roomId];
-      writeConfig(fullConfig);
-      db.addLog(guildId, 'room_deleted', req.session.user.username, `Sala eliminada: ${roomId}`);
-      res.json({ success: true });
-    } else {
-      res.status(404).json({ success: false, error: 'Sala no encontrada' });
-    }
+    await botApi('DELETE', `/api/guilds/${guildId}/salas/${roomId}`);
+    db.addLog(guildId, 'room_deleted', req.session.user.username, `Sala eliminada: ${roomId}`);
+    res.json({ success: true });
   } catch (error) {
+    if (error.status === 404) {
+      return res.status(404).json({ success: false, error: 'Sala no encontrada' });
+    }
     res.status(500).json({ success: false, error: error.message });
   }
 });
@@ -725,17 +740,15 @@ app.get('/dashboard/:guildId/notificaciones-salas', isAuthenticated, async (req,
       });
     }
 
-    const fullConfig = readConfig();
-    const settings = fullConfig.notificaciones_salas && fullConfig.notificaciones_salas[guildId] ? 
-      fullConfig.notificaciones_salas[guildId] : {
-        notifications_enabled: true,
-        notification_role: '@here',
-        send_dm: true,
-        custom_message: '🔥 ¡Únete a la sala! Tenemos espacio para ti',
-        room_name: 'Sala Free Fire',
-        room_schedule: '19:00 - 23:00',
-        jugadores_listos: []
-      };
+    const settings = {
+      notifications_enabled: true,
+      notification_role: '@here',
+      send_dm: true,
+      custom_message: '🔥 ¡Únete a la sala! Tenemos espacio para ti',
+      room_name: 'Sala Free Fire',
+      room_schedule: '19:00 - 23:00',
+      ...(await getNotificationSettings(guildId))
+    };
 
     const jugadoresAnotados = settings.jugadores_listos || [];
     const jugadoresConfirmados = jugadoresAnotados.filter(j => j.estado === 'confirmado') || [];
@@ -758,26 +771,19 @@ app.get('/dashboard/:guildId/notificaciones-salas', isAuthenticated, async (req,
   }
 });
 
-app.post('/api/guild/:guildId/notificaciones-salas/config', isAuthenticated, (req, res) => {
+app.post('/api/guild/:guildId/notificaciones-salas/config', isAuthenticated, async (req, res) => {
   try {
     const { guildId } = req.params;
     const { notifications_enabled, notification_role, send_dm, custom_message, room_name, room_schedule } = req.body;
 
-    const fullConfig = readConfig();
-    if (!fullConfig.notificaciones_salas) fullConfig.notificaciones_salas = {};
-    if (!fullConfig.notificaciones_salas[guildId]) fullConfig.notificaciones_salas[guildId] = {};
-
-    fullConfig.notificaciones_salas[guildId] = {
-      ...fullConfig.notificaciones_salas[guildId],
+    await botApi('POST', `/api/guilds/${guildId}/notificaciones`, {
       notifications_enabled,
       notification_role,
       send_dm,
       custom_message,
       room_name,
       room_schedule
-    };
-
-    writeConfig(fullConfig);
+    });
     db.addLog(guildId, 'notificaciones_updated', req.session.user.username, 'Configuración de notificaciones actualizada');
 
     res.json({ success: true });
@@ -789,9 +795,7 @@ app.post('/api/guild/:guildId/notificaciones-salas/config', isAuthenticated, (re
 app.post('/api/guild/:guildId/notificaciones-salas/test', isAuthenticated, async (req, res) => {
   try {
     const { guildId } = req.params;
-    const fullConfig = readConfig();
-    const settings = fullConfig.notificaciones_salas && fullConfig.notificaciones_salas[guildId] ? 
-      fullConfig.notificaciones_salas[guildId] : {};
+    const settings = await getNotificationSettings(guildId);
 
     const config = db.getGuildConfig(guildId);
     if (config && config.announce_channel_id && settings.notifications_enabled) {
@@ -808,9 +812,7 @@ app.post('/api/guild/:guildId/notificaciones-salas/test', isAuthenticated, async
 app.post('/api/guild/:guildId/notificaciones-salas/notificar', isAuthenticated, async (req, res) => {
   try {
     const { guildId } = req.params;
-    const fullConfig = readConfig();
-    const settings = fullConfig.notificaciones_salas && fullConfig.notificaciones_salas[guildId] ? 
-      fullConfig.notificaciones_salas[guildId] : {};
+    const settings = await getNotificationSettings(guildId);
 
     const config = db.getGuildConfig(guildId);
     if (config && config.announce_channel_id && settings.notifications_enabled) {
@@ -833,35 +835,22 @@ app.post('/api/guild/:guildId/notificaciones-salas/notificar', isAuthenticated,
   }
 });
 
-app.delete('/api/guild/:guildId/notificaciones-salas/jugador/:userId', isAuthenticated, (req, res) => {
+app.delete('/api/guild/:guildId/notificaciones-salas/jugador/:userId', isAuthenticated, async (req, res) => {
   try {
     const { guildId, userId } = req.params;
-    const fullConfig = readConfig();
-    if (!fullConfig.notificaciones_salas) fullConfig.notificaciones_salas = {};
-    if (!fullConfig.notificaciones_salas[guildId]) fullConfig.notificaciones_salas[guildId] = {};
-
-    const settings = fullConfig.notificaciones_salas[guildId];
-    if (settings.jugadores_listos) {
-      settings.jugadores_listos = settings.jugadores_listos.filter(j => j.user_id !== userId);
-    }
-
-    writeConfig(fullConfig);
+    await botApi('DELETE', `/api/guilds/${guildId}/notificaciones/jugadores/${userId}`);
     res.json({ success: true });
   } catch (error) {
+    // Already removed: same result as before
+    if (error.status === 404) return res.json({ success: true });
     res.status(500).json({ success: false, error: error.message });
   }
 });
 
-app.post('/api/guild/:guildId/notificaciones-salas/limpiar', isAuthenticated, (req, res) => {
+app.post('/api/guild/:guildId/notificaciones-salas/limpiar', isAuthenticated, async (req, res) => {
   try {
     const { guildId } = req.params;
-    const fullConfig = readConfig();
-    if (!fullConfig.notificaciones_salas) fullConfig.notificaciones_salas = {};
-    if (!fullConfig.notificaciones_salas[guildId]) fullConfig.notificaciones_salas[guildId] = {};
-
-    fullConfig.notificaciones_salas[guildId].jugadores_listos = [];
-
-    writeConfig(fullConfig);
+    await botApi('POST', `/api/guilds/${guildId}/notificaciones/limpiar`);
     db.addLog(guildId, 'notificaciones_cleared', req.session.user.username, 'Lista de jugadores limpiada');
 
     res.json({ success: true });